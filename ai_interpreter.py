@@ -1,27 +1,28 @@
+import asyncio
+import hashlib
 import json
-from openai import OpenAI
-from config import DEEPSEEK_API_KEY, DEEPSEEK_MODEL_NAME, DEEPSEEK_API_BASE_URL
+import re
+import time
+from collections import OrderedDict
+from openai import AsyncOpenAI
+from config import (
+    DEEPSEEK_API_KEY, DEEPSEEK_MODEL_NAME, DEEPSEEK_API_BASE_URL,
+    AI_CONCURRENCY_LIMIT, AI_TIMEOUT, AI_CACHE_TTL, AI_CACHE_SIZE, AI_CACHE_SIGNIFICANT_DIGITS,
+    AI_BATCH_MAX_SIZE, AI_PROMPT_TOKEN_BUDGET, AI_PROMPT_MIN_KLINES,
+)
+from metrics import AI_SECONDS, CACHE_EVENTS
 
-if DEEPSEEK_API_KEY:
-    client = OpenAI(
-        api_key=DEEPSEEK_API_KEY,
-        base_url=DEEPSEEK_API_BASE_URL,
-    )
-else:
-    client = None
-    print("Warning: DEEPSEEK_API_KEY is not set. AI interpretation will be disabled.")
+# 可选的 tokenizer，用于统计提示词 token 数 (未安装时按字符数估算)
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("cl100k_base")
+except ImportError:
+    _encoding = None
 
-def get_ai_interpretation(symbol: str, timeframe: str, signal_data: dict, previous_signal: dict = None):
-    if not client:
-        return "AI interpretation disabled (API key missing)."
-    """
-    使用AI模型解读指标异动信号及其市场背景
-    """
-    # 为了可读性，将数据包拆分
-    primary_signal = signal_data.get('primary_signal', {})
-    market_context = signal_data.get('market_context', {})
+if not DEEPSEEK_API_KEY:
+    print("Warning: DEEPSEEK_API_KEY is not set. AI interpretation will be disabled.")
 
-    system_prompt = """You are a world-class crypto market analyst. Your analysis is concise, data-driven, and directly actionable for experienced traders. You avoid generic advice and focus on interpreting the provided data to form a coherent market thesis. Do not use emojis. Never give financial advice.
+SYSTEM_PROMPT = """You are a world-class crypto market analyst. Your analysis is concise, data-driven, and directly actionable for experienced traders. You avoid generic advice and focus on interpreting the provided data to form a coherent market thesis. Do not use emojis. Never give financial advice.
 
 Your Task is to analyze the primary signal in conjunction with the broader market context provided. Structure your interpretation in the following format, and your entire analysis must be in Chinese:
 
@@ -30,55 +31,373 @@ Your Task is to analyze the primary signal in conjunction with the broader marke
 【潜在影响与后续关注】What is the most likely short-term impact, and what specific price levels or indicator behaviors should be monitored for confirmation or invalidation? (e.g., "Potential for a short-term reversal. Watch for a price rejection at the $68,200 level. Confirmation would be a bearish divergence on the RSI on the next price swing.")
 """
 
-    # 将K线数据格式化为更易读的字符串
-    klines_str = "\n".join([f"  - O:{k['open']:.2f} H:{k['high']:.2f} L:{k['low']:.2f} C:{k['close']:.2f} V:{k['volume']:,.0f}" for k in market_context.get('recent_klines', [])])
+def count_tokens(text: str):
+    """提示词的 token 数：安装了 tiktoken 时用 cl100k_base 编码计数 (与 DeepSeek 的 tokenizer 接近)，否则估算"""
+    if _encoding is not None:
+        return len(_encoding.encode(text))
+    # 估算: 中日韩字符约 1 个 token，其余约 4 个字符 1 个 token
+    cjk = len(re.findall(r'[\u3000-\u9fff\uff00-\uffef]', text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+SYSTEM_PROMPT_TOKENS = count_tokens(SYSTEM_PROMPT)
+
+# 用户提示词中不随信号变化的部分，启动时渲染一次
+NEW_SIGNAL_CONTEXT = "Context: new signal alert."
+UPDATE_CONTEXT = "Context: update to a previously triggered signal. Assess whether the new signal is a continuation, acceleration, or potential reversal."
+KLINES_HEADER = "Recent klines (open high low close volume, oldest first):"
+
+def _format_pairs(fields: dict):
+    """紧凑的 key=value 编码 (比缩进的 JSON 少一半以上的 token)"""
+    return "; ".join(f"{k}={v}" for k, v in fields.items())
+
+def _format_klines(klines: list):
+    """K 线按行编码为以空格分隔的表格，价格保留 6 位有效数字"""
+    return "\n".join(
+        f"{k['open']:.6g} {k['high']:.6g} {k['low']:.6g} {k['close']:.6g} {k['volume']:.0f}" for k in klines
+    )
+
+def _previous_signal_delta(previous_fields: dict, current_fields: dict):
+    """上一个信号中与本次对比有意义的字段: 类型变化时的旧类型，以及同名数值字段的 旧值->新值"""
+    delta = {}
+    if previous_fields.get('signal_type') != current_fields.get('signal_type'):
+        delta['signal_type'] = previous_fields.get('signal_type')
+    for key, value in previous_fields.items():
+        if key in ('indicator', 'signal_type', 'timeframe', 'sentiment'):
+            continue
+        delta[key] = f"{value}->{current_fields[key]}" if key in current_fields else value
+    return delta
+
+def build_prompts(symbol: str, timeframe: str, signal_data: dict, previous_signal: dict = None,
+                  token_budget: int = AI_PROMPT_TOKEN_BUDGET):
+    """
+    构建 (system_prompt, user_prompt)。
+    用户提示词使用紧凑编码，超过 token_budget 时从最早的 K 线开始裁剪 (至少保留 AI_PROMPT_MIN_KLINES 根)。
+    """
+    primary_signal = signal_data['primary_signal'].format_fields()
+    market_context = signal_data.get('market_context', {})
 
-    # 构建历史信号部分
+    lines = [UPDATE_CONTEXT if previous_signal else NEW_SIGNAL_CONTEXT, f"Asset: {symbol} | Timeframe: {timeframe}"]
+    lines.append(f"Signal: {_format_pairs(primary_signal)}")
     if previous_signal:
-        prev_signal_context = f"""**0. Previous Signal Context:**
-This is an update to a previously triggered signal. Your task is to analyze if the new signal represents a continuation, acceleration, or potential reversal of the situation.
-Previous Signal:
-```json
-{json.dumps(previous_signal, indent=2)}
-```
-"""
+        delta = _previous_signal_delta(previous_signal['primary_signal'].format_fields(), primary_signal)
+        lines.append(f"Previous signal (previous->current): {_format_pairs(delta)}")
+    if market_context.get('key_indicators'):
+        lines.append(f"Market: {_format_pairs(market_context['key_indicators'])}")
+    if market_context.get('technical_indicators'):
+        lines.append(f"Technicals: {_format_pairs(market_context['technical_indicators'])}")
+    header = "\n".join(lines)
+
+    klines = market_context.get('recent_klines', [])
+    user_prompt = header
+    if klines:
+        # 二分查找预算内能保留的最多 K 线数
+        low, high = min(AI_PROMPT_MIN_KLINES, len(klines)), len(klines)
+        while low < high:
+            keep = (low + high + 1) // 2
+            if count_tokens(f"{header}\n{KLINES_HEADER}\n{_format_klines(klines[-keep:])}") <= token_budget:
+                low = keep
+            else:
+                high = keep - 1
+        user_prompt = f"{header}\n{KLINES_HEADER}\n{_format_klines(klines[-low:])}"
+
+    return SYSTEM_PROMPT, user_prompt
+
+# --- Async client path ---
+# 异步客户端与并发信号量绑定到事件循环，按需创建
+_async_client = None
+_async_semaphore = None
+_async_loop = None
+# fingerprint -> (expires_at, interpretation)，按 LRU 顺序保存
+_interpretation_cache = OrderedDict()
+# fingerprint -> 正在进行中的请求 (Future)
+_in_flight = {}
+
+def _get_async_client():
+    global _async_client, _async_semaphore, _async_loop
+    loop = asyncio.get_running_loop()
+    if _async_loop is not loop:
+        _async_client = AsyncOpenAI(api_key=DEEPSEEK_API_KEY, base_url=DEEPSEEK_API_BASE_URL, timeout=AI_TIMEOUT)
+        _async_semaphore = asyncio.Semaphore(AI_CONCURRENCY_LIMIT)
+        _async_loop = loop
+    return _async_client, _async_semaphore
+
+async def close_client():
+    """关闭异步客户端 (在事件循环结束前调用)"""
+    global _async_client, _async_loop
+    if _async_client is not None:
+        await _async_client.close()
+    _async_client = None
+    _async_loop = None
+
+def _round_value(value):
+    """将数值 (包括 "$1,234" / "+5.20%" 这样的字符串) 保留 AI_CACHE_SIGNIFICANT_DIGITS 位有效数字"""
+    if isinstance(value, str):
+        cleaned = re.sub(r'[$,%+\s]', '', value)
+        try:
+            value = float(cleaned)
+        except ValueError:
+            return value
+    if isinstance(value, (int, float)) and value:
+        return float(f"{value:.{AI_CACHE_SIGNIFICANT_DIGITS}g}")
+    return value
+
+def signal_fingerprint(symbol: str, timeframe: str, signal_data: dict, previous_signal: dict = None):
+    """
+    计算信号指纹：主信号与市场背景按有效数字取整后哈希，
+    使相同或几乎相同的请求 (例如同一 OI 信号被再次评估) 命中同一缓存项。
+    """
+    market_context = signal_data.get('market_context', {})
+    previous_primary = previous_signal['primary_signal'].to_dict() if previous_signal else {}
+    primary_signal = signal_data['primary_signal'].to_dict()
+    # 时间戳不参与指纹，使下一根 K 线上重复评估的同一信号也能命中缓存
+    primary_signal.pop('timestamp', None)
+    previous_primary.pop('timestamp', None)
+    payload = {
+        "symbol": symbol,
+        "timeframe": timeframe,
+        "primary_signal": {k: _round_value(v) for k, v in primary_signal.items()},
+        "key_indicators": {k: _round_value(v) for k, v in market_context.get('key_indicators', {}).items()},
+        "technical_indicators": {k: _round_value(v) for k, v in market_context.get('technical_indicators', {}).items()},
+        "previous_signal": {k: _round_value(v) for k, v in previous_primary.items()},
+    }
+    return hashlib.sha1(json.dumps(payload, sort_keys=True).encode('utf-8')).hexdigest()
+
+def _cache_get(key: str):
+    entry = _interpretation_cache.get(key)
+    if entry is None:
+        CACHE_EVENTS.inc(cache='ai', result='miss')
+        return None
+    expires_at, interpretation = entry
+    if expires_at < time.monotonic():
+        del _interpretation_cache[key]
+        CACHE_EVENTS.inc(cache='ai', result='miss')
+        return None
+    _interpretation_cache.move_to_end(key)
+    CACHE_EVENTS.inc(cache='ai', result='hit')
+    return interpretation
+
+def _cache_put(key: str, interpretation: str):
+    _interpretation_cache[key] = (time.monotonic() + AI_CACHE_TTL, interpretation)
+    _interpretation_cache.move_to_end(key)
+    while len(_interpretation_cache) > AI_CACHE_SIZE:
+        _interpretation_cache.popitem(last=False)
+
+def _system_prompt_tokens(system_prompt: str):
+    if system_prompt is SYSTEM_PROMPT:
+        return SYSTEM_PROMPT_TOKENS
+    if system_prompt is BATCH_SYSTEM_PROMPT:
+        return BATCH_SYSTEM_PROMPT_TOKENS
+    return count_tokens(system_prompt)
+
+async def _request_interpretation(system_prompt: str, user_prompt: str, mode: str = 'single'):
+    async_client, semaphore = _get_async_client()
+    prompt_tokens = _system_prompt_tokens(system_prompt) + count_tokens(user_prompt)
+    async with semaphore:
+        started = time.perf_counter()
+        try:
+            response = await asyncio.wait_for(
+                async_client.chat.completions.create(
+                    model=DEEPSEEK_MODEL_NAME,
+                    messages=[
+                        {"role": "system", "content": system_prompt},
+                        {"role": "user", "content": user_prompt},
+                    ],
+                    temperature=0.6, # 稍微提高一点创造性以进行更好的分析
+                ),
+                timeout=AI_TIMEOUT,
+            )
+            AI_SECONDS.observe(time.perf_counter() - started, mode=mode, outcome='ok')
+            usage = getattr(response, 'usage', None)
+            reported = f", {usage.prompt_tokens} reported by API" if usage and usage.prompt_tokens else ""
+            print(f"AI {mode} request: ~{prompt_tokens} prompt tokens{reported}")
+            return response.choices[0].message.content
+        except Exception as e:
+            AI_SECONDS.observe(time.perf_counter() - started, mode=mode, outcome='error')
+            print(f"Error calling custom API: {e!r}")
+            return None
+
+async def get_ai_interpretation_async(symbol: str, timeframe: str, signal_data: dict, previous_signal: dict = None):
+    """
+    使用 AI 模型解读指标异动信号及其市场背景 (唯一的单信号入口)：限制并发、带超时，
+    结果按信号指纹缓存，相同指纹的并发请求合并为一次调用。
+    """
+    if not DEEPSEEK_API_KEY:
+        return "AI interpretation disabled (API key missing)."
+
+    key = signal_fingerprint(symbol, timeframe, signal_data, previous_signal)
+    cached = _cache_get(key)
+    if cached is not None:
+        print(f"AI interpretation cache hit for {symbol}")
+        return cached
+
+    if key in _in_flight:
+        print(f"AI interpretation for {symbol} joined an in-flight request")
+        CACHE_EVENTS.inc(cache='ai', result='in_flight')
+        interpretation = await asyncio.shield(_in_flight[key])
     else:
-        prev_signal_context = """**0. Context:**
-This is a new signal alert.
-"""
+        system_prompt, user_prompt = build_prompts(symbol, timeframe, signal_data, previous_signal)
+        future = asyncio.ensure_future(_request_interpretation(system_prompt, user_prompt))
+        _in_flight[key] = future
+        future.add_done_callback(lambda _: _in_flight.pop(key, None))
+        interpretation = await asyncio.shield(future)
+
+    if interpretation is None:
+        return "AI interpretation failed."
+    _cache_put(key, interpretation)
+    return interpretation
+
+# --- Streaming interpretation ---
+SECTION_START = '【'
+
+def split_sections(interpretation: str):
+    """按【标题】把解读拆成段落 (连接起来即原文)"""
+    parts = re.split(f'(?={SECTION_START})', interpretation)
+    return [part for part in parts if part.strip()]
+
+async def stream_ai_interpretation_async(symbol: str, timeframe: str, signal_data: dict, previous_signal: dict = None):
+    """
+    流式获取 AI 解读：每当一个【】段落完整生成就 yield 该段落 (所有段落连接起来即完整解读)。
+    完整解读写入与 get_ai_interpretation_async 相同的缓存；命中缓存时直接按段落返回。
+    请求失败且尚未生成任何段落时 yield 一次失败提示，生成中途失败时只返回已完成的段落。
+    """
+    if not DEEPSEEK_API_KEY:
+        yield "AI interpretation disabled (API key missing)."
+        return
+
+    key = signal_fingerprint(symbol, timeframe, signal_data, previous_signal)
+    cached = _cache_get(key)
+    if cached is not None:
+        print(f"AI interpretation cache hit for {symbol}")
+        for section in split_sections(cached):
+            yield section
+        return
+
+    system_prompt, user_prompt = build_prompts(symbol, timeframe, signal_data, previous_signal)
+    prompt_tokens = SYSTEM_PROMPT_TOKENS + count_tokens(user_prompt)
+    async_client, semaphore = _get_async_client()
+    sections = []
+    buffer = ""
+    async with semaphore:
+        started = time.perf_counter()
+        try:
+            # 客户端的 AI_TIMEOUT 对每次读取生效，生成时间较长时不会被整体超时打断
+            stream = await async_client.chat.completions.create(
+                model=DEEPSEEK_MODEL_NAME,
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": user_prompt},
+                ],
+                temperature=0.6, # 稍微提高一点创造性以进行更好的分析
+                stream=True,
+            )
+            async for chunk in stream:
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if not delta:
+                    continue
+                buffer += delta
+                # 出现新的段落标题时，之前的内容已经是完整的段落
+                split = buffer.rfind(SECTION_START)
+                if split > 0 and buffer[:split].strip():
+                    sections.append(buffer[:split])
+                    buffer = buffer[split:]
+                    yield sections[-1]
+        except Exception as e:
+            AI_SECONDS.observe(time.perf_counter() - started, mode='stream', outcome='error')
+            print(f"Error calling custom API: {e!r}")
+            if not sections:
+                yield "AI interpretation failed."
+            return
+        AI_SECONDS.observe(time.perf_counter() - started, mode='stream', outcome='ok')
+    print(f"AI stream request: ~{prompt_tokens} prompt tokens")
 
-    user_prompt = f"""{prev_signal_context}
-**Asset:** {symbol}
-**Timeframe:** {timeframe}
-
-**1. Primary Signal Detected:**
-```json
-{json.dumps(primary_signal, indent=2)}
-```
-
-**2. Market Context Snapshot:**
-*   **Key On-Chain & Market Indicators:**
-    ```json
-    {json.dumps(market_context.get('key_indicators', {}), indent=2)}
-    ```
-*   **Key Technical Indicators:**
-    ```json
-    {json.dumps(market_context.get('technical_indicators', {}), indent=2)}
-    ```
-*   **Recent Price Action (Last 16 periods, newest first):**
-{klines_str}
+    if buffer.strip():
+        sections.append(buffer)
+        yield buffer
+    if sections:
+        _cache_put(key, "".join(sections))
+
+# --- Batch interpretation ---
+BATCH_INSTRUCTIONS = """
+You will receive several independent signals in one request, each introduced by a line of the form `=== SIGNAL <n> ===`. Analyze every signal independently using the format above. Begin the analysis of each signal with the exact same `=== SIGNAL <n> ===` line and do not add any text outside the per-signal sections.
 """
 
-    try:
-        response = client.chat.completions.create(
-            model=DEEPSEEK_MODEL_NAME,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt},
-            ],
-            temperature=0.6, # 稍微提高一点创造性以进行更好的分析
-        )
-        return response.choices[0].message.content
-    except Exception as e:
-        print(f"Error calling custom API: {e}")
-        return "AI interpretation failed."
+BATCH_SYSTEM_PROMPT = SYSTEM_PROMPT + BATCH_INSTRUCTIONS
+BATCH_SYSTEM_PROMPT_TOKENS = count_tokens(BATCH_SYSTEM_PROMPT)
+
+BATCH_SEPARATOR = re.compile(r'^=== SIGNAL (\d+) ===\s*$', re.MULTILINE)
+
+def build_batch_prompts(timeframe: str, items: list):
+    """
+    将多个 (symbol, signal_data, previous_signal) 合并为一个请求的 (system_prompt, user_prompt)，
+    每个信号各自使用 AI_PROMPT_TOKEN_BUDGET 的预算
+    """
+    sections = []
+    for n, (symbol, signal_data, previous_signal) in enumerate(items, start=1):
+        _, user_prompt = build_prompts(symbol, timeframe, signal_data, previous_signal)
+        sections.append(f"=== SIGNAL {n} ===\n{user_prompt}")
+    return BATCH_SYSTEM_PROMPT, "\n".join(sections)
+
+def split_batch_response(content: str, count: int):
+    """按 === SIGNAL <n> === 拆分批量回复，返回长度为 count 的列表 (缺失的项为 None)"""
+    results = [None] * count
+    parts = BATCH_SEPARATOR.split(content)
+    # parts = [前导文本, n1, 内容1, n2, 内容2, ...]
+    for number, text in zip(parts[1::2], parts[2::2]):
+        index = int(number) - 1
+        if 0 <= index < count and text.strip():
+            results[index] = text.strip()
+    return results
+
+async def _interpret_batch(timeframe: str, items: list, keys: list):
+    system_prompt, user_prompt = build_batch_prompts(timeframe, items)
+    content = await _request_interpretation(system_prompt, user_prompt, mode='batch')
+    if content is None:
+        return ["AI interpretation failed."] * len(items)
+    results = split_batch_response(content, len(items))
+
+    missing = []
+    for n, (key, interpretation) in enumerate(zip(keys, results)):
+        if interpretation is None:
+            missing.append(n)
+        else:
+            _cache_put(key, interpretation)
+
+    # 未出现在批量回复中的信号单独请求
+    if missing:
+        print(f"Batch response missing {len(missing)} of {len(items)} signals, falling back to single requests")
+        fallbacks = await asyncio.gather(*[
+            get_ai_interpretation_async(items[n][0], timeframe, items[n][1], items[n][2]) for n in missing
+        ])
+        for n, interpretation in zip(missing, fallbacks):
+            results[n] = interpretation
+    return results
+
+async def get_batch_ai_interpretations_async(timeframe: str, items: list):
+    """
+    批量解读同一轮检查中需要发送的多个信号。
+    items 为 [(symbol, signal_data, previous_signal), ...]，返回与之一一对应的解读列表。
+    已缓存的信号直接返回，其余每 AI_BATCH_MAX_SIZE 个合并为一次请求。
+    """
+    if not DEEPSEEK_API_KEY:
+        return ["AI interpretation disabled (API key missing)."] * len(items)
+
+    results = [None] * len(items)
+    pending, pending_keys, pending_index = [], [], []
+    for n, (symbol, signal_data, previous_signal) in enumerate(items):
+        key = signal_fingerprint(symbol, timeframe, signal_data, previous_signal)
+        cached = _cache_get(key)
+        if cached is not None:
+            results[n] = cached
+        else:
+            pending.append((symbol, signal_data, previous_signal))
+            pending_keys.append(key)
+            pending_index.append(n)
+
+    batches = [
+        (pending[i:i + AI_BATCH_MAX_SIZE], pending_keys[i:i + AI_BATCH_MAX_SIZE])
+        for i in range(0, len(pending), AI_BATCH_MAX_SIZE)
+    ]
+    batch_results = await asyncio.gather(*[_interpret_batch(timeframe, b_items, b_keys) for b_items, b_keys in batches])
+    for n, interpretation in zip(pending_index, [r for batch in batch_results for r in batch]):
+        results[n] = interpretation
+    return results
@@ -1,55 +1,362 @@
-import requests
-import json
+import asyncio
+import aiohttp
+import contextvars
+import sqlite3
+import threading
 import time
+import uuid
+from contextlib import asynccontextmanager
 from datetime import datetime
-from config import NOTIFYX_WEBHOOK_URLS, GOTIFY_URL, GOTIFY_TOKEN
+from config import (
+    NOTIFYX_WEBHOOK_URLS, GOTIFY_URL, GOTIFY_TOKEN,
+    ALERT_TIMEOUT, ALERT_MAX_RETRIES, ALERT_RETRY_BACKOFF, ALERT_MIN_INTERVAL,
+    ALERT_OUTBOX_PATH, ALERT_OUTBOX_MAX_ATTEMPTS, ALERT_OUTBOX_RETRY_DELAY, ALERT_DIGEST_THRESHOLD,
+)
+from metrics import ALERT_SECONDS, HTTP_RESPONSES, ALERT_OUTBOX_PENDING
 
-def send_notifyx_alert(payload):
-    """Sends a message to all configured NotifyX webhooks."""
-    if not NOTIFYX_WEBHOOK_URLS:
-        return
+# 所有告警渠道共用的连接池 Session (按事件循环惰性创建)
+_session = None
+_session_loop = None
+# endpoint -> 下一次允许发送的时间 (time.monotonic)
+_next_send_time = {}
 
-    for webhook_token_or_url in NOTIFYX_WEBHOOK_URLS:
-        if webhook_token_or_url.startswith('http'):
-            webhook_url = webhook_token_or_url
-        else:
-            webhook_url = f"https://www.notifyx.cn/api/v1/send/{webhook_token_or_url}"
+def _get_session():
+    global _session, _session_loop
+    loop = asyncio.get_running_loop()
+    if _session is None or _session.closed or _session_loop is not loop:
+        # trust_env=True: 与 requests 一样读取 HTTP(S)_PROXY 环境变量
+        _session = aiohttp.ClientSession(
+            timeout=aiohttp.ClientTimeout(total=ALERT_TIMEOUT),
+            trust_env=True,
+        )
+        _session_loop = loop
+    return _session
+
+async def close_session():
+    """停止发件箱后台任务并关闭共享的告警 Session (在事件循环结束前调用)，未发送的告警留在发件箱中，下次启动后发送"""
+    global _session, _worker_task
+    if _worker_task is not None and not _worker_task.done():
+        _worker_task.cancel()
         try:
-            response = requests.post(webhook_url, data=json.dumps(payload), headers={'Content-Type': 'application/json'})
-            response.raise_for_status()
-            print(f"NotifyX alert sent successfully to {webhook_url}")
-        except requests.exceptions.RequestException as e:
-            print(f"Error sending NotifyX alert to {webhook_url}: {e}")
-        time.sleep(1)
-
-def send_gotify_alert(title, message):
-    """Sends a message to the configured Gotify server."""
-    if not GOTIFY_URL or not GOTIFY_TOKEN:
-        return
+            await _worker_task
+        except asyncio.CancelledError:
+            pass
+    _worker_task = None
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
 
-    try:
-        response = requests.post(
-            f"{GOTIFY_URL}/message?token={GOTIFY_TOKEN}",
-            json={"title": title, "message": message, "priority": 5},
-        )
-        response.raise_for_status()
+async def _wait_for_slot(endpoint: str):
+    """按 endpoint 限速：同一 endpoint 两次发送之间至少间隔 ALERT_MIN_INTERVAL 秒"""
+    now = time.monotonic()
+    send_at = max(now, _next_send_time.get(endpoint, 0))
+    _next_send_time[endpoint] = send_at + ALERT_MIN_INTERVAL
+    if send_at > now:
+        await asyncio.sleep(send_at - now)
+
+async def _post(channel: str, endpoint: str, url: str, **kwargs):
+    """发送 POST 请求并按渠道记录耗时与结果。成功返回 True。"""
+    started = time.perf_counter()
+    sent = await _post_with_retries(channel, endpoint, url, **kwargs)
+    ALERT_SECONDS.observe(time.perf_counter() - started, channel=channel, outcome='sent' if sent else 'failed')
+    return sent
+
+async def _post_with_retries(channel: str, endpoint: str, url: str, **kwargs):
+    """超时/网络错误/429/5xx 时按指数退避重试"""
+    session = _get_session()
+    for attempt in range(ALERT_MAX_RETRIES + 1):
+        await _wait_for_slot(endpoint)
+        retry_after = None
+        try:
+            async with session.post(url, **kwargs) as response:
+                HTTP_RESPONSES.inc(service=channel, status=response.status)
+                if response.status < 400:
+                    return True
+                error = f"HTTP {response.status}"
+                if response.status != 429 and response.status < 500:
+                    print(f"Error sending alert to {endpoint}: {error}")
+                    return False
+                if response.headers.get('Retry-After', '').isdigit():
+                    retry_after = int(response.headers['Retry-After'])
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            HTTP_RESPONSES.inc(service=channel, status='error')
+            error = repr(e)
+
+        if attempt < ALERT_MAX_RETRIES:
+            delay = retry_after if retry_after is not None else ALERT_RETRY_BACKOFF * 2 ** attempt
+            print(f"Error sending alert to {endpoint}: {error}, retrying in {delay}s")
+            await asyncio.sleep(delay)
+    print(f"Error sending alert to {endpoint}: {error}, giving up after {ALERT_MAX_RETRIES + 1} attempts")
+    return False
+
+def _notifyx_url(webhook_token_or_url: str):
+    if webhook_token_or_url.startswith('http'):
+        return webhook_token_or_url
+    return f"https://www.notifyx.cn/api/v1/send/{webhook_token_or_url}"
+
+async def send_notifyx_alert(webhook_url: str, title: str, content: str):
+    """Sends a message to one NotifyX webhook. Returns True on success."""
+    sent = await _post('notifyx', webhook_url, webhook_url, json={"content": content, "title": title})
+    if sent:
+        print(f"NotifyX alert sent successfully to {webhook_url}")
+    return sent
+
+async def send_gotify_alert(title, message):
+    """Sends a message to the configured Gotify server. Returns True on success."""
+    sent = await _post(
+        'gotify',
+        GOTIFY_URL,
+        f"{GOTIFY_URL}/message?token={GOTIFY_TOKEN}",
+        json={"title": title, "message": message, "priority": 5},
+    )
+    if sent:
         print(f"Gotify alert sent successfully to {GOTIFY_URL}")
-    except requests.exceptions.RequestException as e:
-        print(f"Error sending Gotify alert to {GOTIFY_URL}: {e}")
+    return sent
+
+# 取出待发送告警后占用的时间 (秒)：发送期间其他进程不会重复取出，进程中途退出时到期后重新发送
+OUTBOX_CLAIM_SECONDS = 300
+# 发件箱后台任务两次检查之间的最长等待时间 (秒)
+OUTBOX_POLL_INTERVAL = 60
+# 汇总消息中各条告警之间的分隔
+DIGEST_SEPARATOR = "\n\n---\n\n"
 
-def send_alert(symbol: str, signal_data: dict, ai_interpretation: str):
+class AlertOutbox:
     """
-    Formats a message and sends it to all configured notification services.
+    持久化的告警发件箱 (SQLite)。每条记录是发往一个渠道目标 (某个 NotifyX webhook 或 Gotify) 的一条消息:
+    - held: 属于一个尚未结束的批次 (一轮检查)，批次结束时按数量决定逐条发送或合并为一条汇总
+    - pending: 等待发送 (next_attempt_at 之后)，发送成功后删除
+    - failed: 超过 ALERT_OUTBOX_MAX_ATTEMPTS 次仍未成功，保留在数据库中供排查
+    数据库操作是阻塞的 (数据库可能被多个进程共用，等锁最多 30 秒)，在事件循环中通过 asyncio.to_thread 调用。
     """
-    primary_signal = signal_data.get('primary_signal', {})
-    indicator_name = primary_signal.get('indicator', 'N/A')
-    
-    details_list = []
-    for key, value in primary_signal.items():
-        if key not in ['indicator', 'signal_type']:
-            details_list.append(f"**{key.replace('_', ' ').title()}:** `{value}`")
-    details_string = " | ".join(details_list)
+    def __init__(self, db_path: str = ALERT_OUTBOX_PATH):
+        self.db = sqlite3.connect(db_path or ':memory:', timeout=30, check_same_thread=False)
+        # 各方法在线程池中执行，共用同一个连接
+        self._lock = threading.Lock()
+        if db_path:
+            self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS alert_outbox ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, channel TEXT NOT NULL, target TEXT NOT NULL, "
+            "title TEXT NOT NULL, content TEXT NOT NULL, batch TEXT, status TEXT NOT NULL, "
+            "attempts INTEGER NOT NULL DEFAULT 0, next_attempt_at REAL NOT NULL, created_at REAL NOT NULL)"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS alert_outbox_due ON alert_outbox (status, next_attempt_at)")
+        # 上次运行中未结束的批次直接逐条发送
+        released = self.db.execute("UPDATE alert_outbox SET status = 'pending' WHERE status = 'held'").rowcount
+        self.db.commit()
+        if released:
+            print(f"Released {released} held alerts from an unfinished batch")
+
+    def enqueue(self, channel: str, target: str, title: str, content: str, batch: str = None):
+        with self._lock:
+            now = time.time()
+            self.db.execute(
+                "INSERT INTO alert_outbox (channel, target, title, content, batch, status, next_attempt_at, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (channel, target, title, content, batch, 'held' if batch else 'pending', now, now),
+            )
+            self.db.commit()
+
+    def close_batch(self, batch: str, digest_threshold: int = ALERT_DIGEST_THRESHOLD):
+        """结束批次：每个渠道目标的告警超过 digest_threshold 条时合并为一条汇总消息，否则逐条发送"""
+        with self._lock:
+            now = time.time()
+            rows = self.db.execute(
+                "SELECT id, channel, target, content FROM alert_outbox WHERE batch = ? AND status = 'held' ORDER BY id",
+                (batch,),
+            ).fetchall()
+            groups = {}
+            for row_id, channel, target, content in rows:
+                groups.setdefault((channel, target), []).append((row_id, content))
+            for (channel, target), items in groups.items():
+                if digest_threshold and len(items) > digest_threshold:
+                    self.db.execute(
+                        "INSERT INTO alert_outbox (channel, target, title, content, batch, status, next_attempt_at, created_at) "
+                        "VALUES (?, ?, ?, ?, ?, 'pending', ?, ?)",
+                        (channel, target, f"市场异动汇总 ({len(items)} 条告警)",
+                         DIGEST_SEPARATOR.join(content for _, content in items), batch, now, now),
+                    )
+                    self.db.executemany("DELETE FROM alert_outbox WHERE id = ?", [(row_id,) for row_id, _ in items])
+                else:
+                    self.db.executemany(
+                        "UPDATE alert_outbox SET status = 'pending' WHERE id = ?", [(row_id,) for row_id, _ in items]
+                    )
+            self.db.commit()
+
+    def claim_due(self, limit: int = 50):
+        """取出已到发送时间的告警，并在同一事务中推迟其 next_attempt_at (多个进程共用数据库时不会重复发送)"""
+        with self._lock:
+            now = time.time()
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self.db.execute(
+                    "SELECT id, channel, target, title, content, attempts FROM alert_outbox "
+                    "WHERE status = 'pending' AND next_attempt_at <= ? ORDER BY id LIMIT ?",
+                    (now, limit),
+                ).fetchall()
+                self.db.executemany(
+                    "UPDATE alert_outbox SET next_attempt_at = ? WHERE id = ?",
+                    [(now + OUTBOX_CLAIM_SECONDS, row[0]) for row in rows],
+                )
+                self.db.commit()
+            except Exception:
+                self.db.rollback()
+                raise
+            return rows
+
+    def release(self, row_ids: list):
+        """放回已取出但未发送完的告警 (进程正常退出时)，下次启动后立即发送"""
+        with self._lock:
+            self.db.executemany("UPDATE alert_outbox SET next_attempt_at = ? WHERE id = ?", [(time.time(), i) for i in row_ids])
+            self.db.commit()
+
+    def delivered(self, row_id: int):
+        with self._lock:
+            self.db.execute("DELETE FROM alert_outbox WHERE id = ?", (row_id,))
+            self.db.commit()
+
+    def failed(self, row_id: int, attempts: int):
+        """记录一次失败的发送，按次数退避后重试，超过最大次数时标记为 failed"""
+        with self._lock:
+            attempts += 1
+            if attempts >= ALERT_OUTBOX_MAX_ATTEMPTS:
+                self.db.execute("UPDATE alert_outbox SET status = 'failed', attempts = ? WHERE id = ?", (attempts, row_id))
+                print(f"Alert {row_id} failed after {attempts} attempts, kept in the outbox as failed")
+            else:
+                delay = min(ALERT_OUTBOX_RETRY_DELAY * 2 ** (attempts - 1), 3600)
+                self.db.execute(
+                    "UPDATE alert_outbox SET attempts = ?, next_attempt_at = ? WHERE id = ?",
+                    (attempts, time.time() + delay, row_id),
+                )
+            self.db.commit()
+
+    def pending_count(self):
+        with self._lock:
+            return self.db.execute("SELECT COUNT(*) FROM alert_outbox WHERE status IN ('held', 'pending')").fetchone()[0]
+
+    def next_due_in(self):
+        """距下一条待发送告警的秒数，没有时返回 None"""
+        with self._lock:
+            row = self.db.execute("SELECT MIN(next_attempt_at) FROM alert_outbox WHERE status = 'pending'").fetchone()
+            return None if row[0] is None else max(0.0, row[0] - time.time())
+
+_outbox = None
+# 发件箱后台任务与唤醒事件 (按事件循环惰性创建)
+_worker_task = None
+_worker_wakeup = None
+_worker_loop = None
+# 后台任务已取出、正在发送的告警 id
+_claimed = set()
+# 当前批次 (一轮检查)，由 alert_batch() 设置
+_current_batch = contextvars.ContextVar('alert_batch', default=None)
 
+_outbox_lock = threading.Lock()
+
+def _get_outbox():
+    """发件箱在首次使用时创建 (打开数据库是阻塞的，可能在线程池中调用)"""
+    global _outbox
+    with _outbox_lock:
+        if _outbox is None:
+            _outbox = AlertOutbox()
+    return _outbox
+
+async def _deliver(channel: str, target: str, title: str, content: str):
+    if channel == 'notifyx':
+        return await send_notifyx_alert(target, title, content)
+    return await send_gotify_alert(title, content)
+
+def _record_results(outbox: AlertOutbox, rows: list, results: list):
+    """记录一批告警的发送结果，返回剩余待发送的告警数"""
+    for (row_id, _, _, _, _, attempts), sent in zip(rows, results):
+        if sent is True:
+            outbox.delivered(row_id)
+        else:
+            outbox.failed(row_id, attempts)
+    return outbox.pending_count()
+
+async def _run_outbox_worker(wakeup: asyncio.Event):
+    outbox = await asyncio.to_thread(_get_outbox)
+    while True:
+        wakeup.clear()
+        rows = await asyncio.to_thread(outbox.claim_due)
+        if rows:
+            _claimed.update(row[0] for row in rows)
+            try:
+                results = await asyncio.gather(
+                    *[_deliver(channel, target, title, content) for _, channel, target, title, content, _ in rows],
+                    return_exceptions=True,
+                )
+            except asyncio.CancelledError:
+                # 任务正在被取消 (进程退出)，不能再等待线程池，直接同步放回
+                outbox.release(list(_claimed))
+                raise
+            finally:
+                _claimed.clear()
+            ALERT_OUTBOX_PENDING.set(await asyncio.to_thread(_record_results, outbox, rows, results))
+            continue
+        ALERT_OUTBOX_PENDING.set(await asyncio.to_thread(outbox.pending_count))
+        next_due = await asyncio.to_thread(outbox.next_due_in)
+        timeout = OUTBOX_POLL_INTERVAL if next_due is None else min(next_due, OUTBOX_POLL_INTERVAL)
+        try:
+            await asyncio.wait_for(wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+def start_outbox_worker():
+    """在当前事件循环中启动发件箱后台任务 (已启动时只唤醒)，也会发送上次运行遗留的告警"""
+    global _worker_task, _worker_wakeup, _worker_loop
+    loop = asyncio.get_running_loop()
+    if _worker_task is None or _worker_task.done() or _worker_loop is not loop:
+        _worker_wakeup = asyncio.Event()
+        _worker_task = loop.create_task(_run_outbox_worker(_worker_wakeup))
+        _worker_loop = loop
+    else:
+        _worker_wakeup.set()
+
+async def drain_outbox(timeout: float = None):
+    """等待发件箱中当前可发送的告警发送完毕 (失败后等待重试的告警不计入)"""
+    start_outbox_worker()
+    outbox = await asyncio.to_thread(_get_outbox)
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while True:
+        next_due = await asyncio.to_thread(outbox.next_due_in)
+        if not _claimed and (next_due is None or next_due > 0):
+            return
+        if deadline is not None and time.monotonic() >= deadline:
+            return
+        await asyncio.sleep(0.05)
+
+@asynccontextmanager
+async def alert_batch():
+    """
+    在 with 代码块中发送的告警属于同一批次 (一轮检查)：代码块结束后，某个渠道目标的告警超过
+    ALERT_DIGEST_THRESHOLD 条时合并为一条汇总消息，否则逐条发送。
+    """
+    batch = uuid.uuid4().hex
+    token = _current_batch.set(batch)
+    try:
+        yield batch
+    finally:
+        _current_batch.reset(token)
+        await asyncio.to_thread(lambda: _get_outbox().close_batch(batch))
+        start_outbox_worker()
+
+def _enqueue_all(title: str, content: str, batch: str):
+    outbox = _get_outbox()
+    for url in NOTIFYX_WEBHOOK_URLS:
+        outbox.enqueue('notifyx', _notifyx_url(url), title, content, batch)
+    if GOTIFY_URL and GOTIFY_TOKEN:
+        outbox.enqueue('gotify', GOTIFY_URL, title, content, batch)
+
+async def enqueue_alert(title: str, content: str):
+    """把告警写入发件箱 (每个已配置的渠道目标一条)，由后台任务发送"""
+    batch = _current_batch.get()
+    await asyncio.to_thread(_enqueue_all, title, content, batch)
+    if batch is None:
+        start_outbox_worker()
+
+def _format_ai_interpretation(ai_interpretation: str):
+    """按【标题】拆分 AI 解读，每段标题单独一行"""
     ai_sections = []
     sections = ai_interpretation.split('【')
     for section in sections:
@@ -59,8 +366,26 @@ def send_alert(symbol: str, signal_data: dict, ai_interpretation: str):
             content = parts[1].strip()
             if content:
                 ai_sections.append(f"【{title}】\n{content}")
+    return "\n\n".join(ai_sections)
+
+async def send_alert(symbol: str, signal_data: dict, ai_interpretation: str = None):
+    """
+    Formats a message and queues it in the outbox for all configured notification services.
+    ai_interpretation 为 None 时 (两阶段告警的第一阶段) 只发送信号本身，AI 解读由 send_ai_followup 补充。
+    """
+    primary_signal = signal_data['primary_signal'].format_fields()
+    indicator_name = primary_signal.get('indicator', 'N/A')
     
-    ai_interpretation_formatted = "\n\n".join(ai_sections)
+    details_list = []
+    for key, value in primary_signal.items():
+        if key not in ['indicator', 'signal_type']:
+            details_list.append(f"**{key.replace('_', ' ').title()}:** `{value}`")
+    details_string = " | ".join(details_list)
+
+    if ai_interpretation is None:
+        ai_interpretation_formatted = "_AI 解读稍后发送_"
+    else:
+        ai_interpretation_formatted = _format_ai_interpretation(ai_interpretation)
 
     content = (
         f"🚨 **{symbol} 市场异动告警** 🚨\n\n"
@@ -71,10 +396,16 @@ def send_alert(symbol: str, signal_data: dict, ai_interpretation: str):
 
     title = f"{symbol} 市场异动告警"
     
-    notifyx_payload = {
-        "content": content,
-        "title": title
-    }
-    
-    send_notifyx_alert(notifyx_payload)
-    send_gotify_alert(title, content)
+    await enqueue_alert(title, content)
+
+async def send_ai_followup(symbol: str, signal_data: dict, ai_interpretation: str):
+    """
+    两阶段告警的第二阶段：发送对应信号的 AI 解读 (完整解读或其中一段)。
+    NotifyX 与 Gotify 都不支持编辑已发送的消息，因此作为一条新消息发送。
+    """
+    primary_signal = signal_data['primary_signal']
+    content = (
+        f"🤖 **{symbol} AI 解读** ({primary_signal.indicator.value} · {primary_signal.signal_type})\n\n"
+        f"{_format_ai_interpretation(ai_interpretation) or ai_interpretation.strip()}"
+    )
+    await enqueue_alert(f"{symbol} AI 解读", content)
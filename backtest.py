@@ -0,0 +1,261 @@
+"""
+历史回放 / 回测引擎：离线评估 VolumeSignal、OpenInterestSignal、LSRatioSignal 与 SignalStateManager 去重阈值。
+
+对所有币种的完整历史一次性计算 Z-Score、OI 变化等序列 ((时间 x 币种) 矩阵)，
+每组阈值只需做一次比较即可得到每根 K 线上的触发结果，而不是逐根 K 线调用 check()。
+触发的信号再按 SignalStateManager 的规则 (以 K 线时间计算 TTL) 去重，得到实际会发送的告警数。
+
+历史数据格式：目录下每个币种一个文件 (<SYMBOL>.csv 或 <SYMBOL>.parquet，Parquet 需要安装 pyarrow)，或一个带 symbol 列的文件。
+必需列: timestamp (毫秒或日期字符串), open, high, low, close, volume, oi, ls_ratio
+(oi / ls_ratio 也可使用 Binance 原始字段名 sumOpenInterestValue / longShortRatio)。
+
+用法:
+    python backtest.py history/ --grid VOLUME_Z_SCORE_THRESHOLD=2,2.5,3 --grid OI_SUDDEN_CHANGE_THRESHOLD=0.035,0.05
+"""
+import argparse
+import itertools
+import logging
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+import config
+from config import (
+    TIMEFRAME, VOLUME_LOOKBACK_PERIOD, OI_CONTINUOUS_RISE_PERIODS, LS_RATIO_LOOKBACK_PERIOD, STATE_TTL_SECONDS,
+)
+from resampler import resample_frame
+from signals import Indicator, CHANGE_FIELDS
+
+logger = logging.getLogger(__name__)
+
+# 可在回测中调整的阈值 (回看周期需要重新计算序列，固定使用 config.py 中的值)
+THRESHOLD_NAMES = (
+    'VOLUME_Z_SCORE_THRESHOLD', 'OI_24H_CHANGE_THRESHOLD', 'OI_SUDDEN_CHANGE_THRESHOLD',
+    'LS_RATIO_Z_SCORE_THRESHOLD', 'Z_SCORE_CHANGE_THRESHOLD', 'PERCENTAGE_CHANGE_THRESHOLD',
+)
+DEFAULT_THRESHOLDS = {name: getattr(config, name) for name in THRESHOLD_NAMES}
+
+# Binance 原始字段名 -> DataFrame 列名
+COLUMN_ALIASES = {'sumOpenInterestValue': 'oi', 'longShortRatio': 'ls_ratio'}
+REQUIRED_COLUMNS = ('open', 'high', 'low', 'close', 'volume', 'oi', 'ls_ratio')
+
+def _prepare_frame(df: pd.DataFrame):
+    """统一列名、时间索引与数值类型；OI / 多空比缺失时只向前填充 (不使用未来数据)"""
+    df = df.rename(columns=COLUMN_ALIASES)
+    missing = [c for c in REQUIRED_COLUMNS if c not in df]
+    if missing:
+        raise ValueError(f"History is missing columns: {', '.join(missing)}")
+    timestamps = df['timestamp']
+    if pd.api.types.is_numeric_dtype(timestamps):
+        index = pd.to_datetime(timestamps, unit='ms')
+    else:
+        index = pd.to_datetime(timestamps)
+    numeric = [c for c in df.columns if c not in ('timestamp', 'symbol')]
+    df = df[numeric].astype(np.float64).set_axis(pd.DatetimeIndex(index, name='timestamp'))
+    df = df[~df.index.duplicated(keep='last')].sort_index()
+    df[['oi', 'ls_ratio']] = df[['oi', 'ls_ratio']].ffill()
+    return df
+
+def _read_table(path: str):
+    if path.endswith('.parquet'):
+        return pd.read_parquet(path)
+    return pd.read_csv(path)
+
+def load_history(path: str):
+    """加载历史数据，返回 {symbol: DataFrame}"""
+    if os.path.isdir(path):
+        frames = {}
+        for name in sorted(os.listdir(path)):
+            symbol, ext = os.path.splitext(name)
+            if ext in ('.csv', '.parquet'):
+                frames[symbol] = _prepare_frame(_read_table(os.path.join(path, name)))
+        return frames
+    table = _read_table(path)
+    if 'symbol' not in table:
+        raise ValueError("A single history file must have a symbol column")
+    return {symbol: _prepare_frame(group) for symbol, group in table.groupby('symbol', sort=True)}
+
+def _rolling_z_score(wide: pd.DataFrame, lookback: int):
+    """与 indicators.calculate_z_score 相同的滚动 Z-Score，对所有币种列一次性计算"""
+    rolling = wide.rolling(window=lookback)
+    return (wide - rolling.mean()) / rolling.std()
+
+class ReplayFeatures:
+    """
+    所有币种在每根 K 线上的指标序列 ((时间 x 币种) 矩阵)，与阈值无关，只计算一次。
+    第 t 行对应 "以第 t 根 K 线为最新一根" 时 checker 看到的值。
+    """
+    def __init__(self, frames: dict):
+        self.symbols = list(frames)
+        close = pd.concat({s: df['close'] for s, df in frames.items()}, axis=1)
+        volume = pd.concat({s: df['volume'] for s, df in frames.items()}, axis=1)
+        oi = pd.concat({s: df['oi'] for s, df in frames.items()}, axis=1)
+        ls_ratio = pd.concat({s: df['ls_ratio'] for s, df in frames.items()}, axis=1)
+        self.index = close.index
+        # 每个币种截至每根 K 线已有的 K 线数 (对应 checker 中的 len(df))
+        rows_seen = close.notna().cumsum().to_numpy()
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            self.close = close.to_numpy()
+            self.volume = volume.to_numpy()
+            self.oi = oi.to_numpy()
+            self.ls_ratio = ls_ratio.to_numpy()
+            self.volume_z = _rolling_z_score(volume, VOLUME_LOOKBACK_PERIOD).to_numpy()
+            self.price_change = (close / close.shift(1) - 1).to_numpy()
+            self.oi_24h_change = (oi / oi.shift(VOLUME_LOOKBACK_PERIOD - 1) - 1).to_numpy()
+            oi_pct_change = oi / oi.shift(1) - 1
+            self.oi_pct_change = oi_pct_change.to_numpy()
+            self.oi_rise = ((oi_pct_change > 0).rolling(OI_CONTINUOUS_RISE_PERIODS).sum() == OI_CONTINUOUS_RISE_PERIODS).to_numpy()
+            self.oi_fall = ((oi_pct_change < 0).rolling(OI_CONTINUOUS_RISE_PERIODS).sum() == OI_CONTINUOUS_RISE_PERIODS).to_numpy()
+            self.ls_z = _rolling_z_score(ls_ratio, LS_RATIO_LOOKBACK_PERIOD).to_numpy()
+
+        self.volume_eligible = rows_seen >= VOLUME_LOOKBACK_PERIOD
+        self.oi_eligible = (rows_seen >= VOLUME_LOOKBACK_PERIOD) & ~np.isnan(self.oi)
+        self.ls_eligible = rows_seen >= LS_RATIO_LOOKBACK_PERIOD
+        # 每根 K 线的开盘时间 (毫秒)
+        self.timestamps = self.index.to_numpy(dtype='datetime64[ms]').astype(np.int64)
+
+    def evaluate(self, thresholds: dict):
+        """
+        返回各信号在每根 K 线上是否触发的布尔矩阵。
+        OI 的三类信号与 OpenInterestSignal 一样按 24H 变化 > 连续涨跌 > 突变 的优先级互斥。
+        """
+        with np.errstate(invalid='ignore'):
+            volume = self.volume_eligible & (np.abs(self.volume_z) > thresholds['VOLUME_Z_SCORE_THRESHOLD'])
+            oi_24h = self.oi_eligible & (np.abs(self.oi_24h_change) > thresholds['OI_24H_CHANGE_THRESHOLD'])
+            oi_rise = self.oi_eligible & ~oi_24h & self.oi_rise
+            oi_fall = self.oi_eligible & ~oi_24h & ~oi_rise & self.oi_fall
+            oi_sudden = (self.oi_eligible & ~oi_24h & ~oi_rise & ~oi_fall
+                         & (np.abs(self.oi_pct_change) > thresholds['OI_SUDDEN_CHANGE_THRESHOLD']))
+            ls = self.ls_eligible & (np.abs(self.ls_z) > thresholds['LS_RATIO_Z_SCORE_THRESHOLD'])
+        return {
+            'volume': volume, 'oi_24h': oi_24h, 'oi_rise': oi_rise, 'oi_fall': oi_fall,
+            'oi_sudden': oi_sudden, 'ls': ls,
+        }
+
+# 去重时比较的字段: SignalStateManager.has_significant_change 检查的 z_score 与百分比变化类字段
+DEDUP_FIELDS = ('z_score',) + CHANGE_FIELDS
+
+def _event_fields(features: ReplayFeatures, kind: str, t_idx: np.ndarray, s_idx: np.ndarray):
+    """触发信号的记录中各去重字段的值 (该类信号没有的字段为 NaN，对应 SignalRecord 中的 None)"""
+    nan = np.full(len(t_idx), np.nan)
+    fields = dict.fromkeys(DEDUP_FIELDS, nan)
+    if kind == 'volume':
+        fields['z_score'] = features.volume_z[t_idx, s_idx]
+        fields['price_change'] = features.price_change[t_idx, s_idx]
+    elif kind == 'oi_24h':
+        fields['change_24h'] = features.oi_24h_change[t_idx, s_idx]
+    elif kind == 'oi_sudden':
+        fields['change_1_period'] = features.oi_pct_change[t_idx, s_idx]
+    elif kind == 'ls':
+        fields['z_score'] = features.ls_z[t_idx, s_idx]
+    return [fields[name] for name in DEDUP_FIELDS]
+
+# 各类信号对应的指标 (同一指标共用一个去重状态)
+KIND_INDICATORS = {
+    'volume': Indicator.VOLUME, 'oi_24h': Indicator.OPEN_INTEREST, 'oi_rise': Indicator.OPEN_INTEREST,
+    'oi_fall': Indicator.OPEN_INTEREST, 'oi_sudden': Indicator.OPEN_INTEREST, 'ls': Indicator.LS_RATIO,
+}
+INDICATORS = list(Indicator)
+
+def count_sent_alerts(features: ReplayFeatures, fired: dict, thresholds: dict):
+    """
+    按 SignalStateManager.should_send_alert 的规则对触发的信号去重，返回每个指标实际发送的告警数。
+    规则与线上一致: 每个 (币种, 指标) 的第一个信号、距上次发送超过 STATE_TTL_SECONDS 的信号、
+    或 z_score / 百分比字段与上次发送的值相差达到阈值的信号才会发送。
+    为了处理数十万个信号，这里直接扫描浮点数组而不是为每个信号构建 SignalRecord；
+    与 NaN 的比较恒为 False，等价于 is_significant_diff 对缺失字段的处理。
+    """
+    keys, times, columns = [], [], [[] for _ in DEDUP_FIELDS]
+    for kind, mask in fired.items():
+        t_idx, s_idx = np.nonzero(mask)
+        keys.append(s_idx * len(INDICATORS) + INDICATORS.index(KIND_INDICATORS[kind]))
+        times.append(features.timestamps[t_idx] / 1000)
+        for column, values in zip(columns, _event_fields(features, kind, t_idx, s_idx)):
+            column.append(values)
+    keys, times = np.concatenate(keys), np.concatenate(times)
+    columns = [np.concatenate(column) for column in columns]
+
+    order = np.lexsort((times, keys))
+    z_threshold, pct_threshold = thresholds['Z_SCORE_CHANGE_THRESHOLD'], thresholds['PERCENTAGE_CHANGE_THRESHOLD']
+    sent = np.zeros(len(keys), dtype=bool)
+    last_key = last_time = None
+    last_z = last_price = last_24h = last_1p = np.nan
+    events = zip(order.tolist(), keys[order].tolist(), times[order].tolist(), *[c[order].tolist() for c in columns])
+    for i, key, now, z, price, change_24h, change_1p in events:
+        if (key != last_key or now - last_time > STATE_TTL_SECONDS
+                or abs(z - last_z) >= z_threshold
+                or abs(price - last_price) >= pct_threshold
+                or abs(change_24h - last_24h) >= pct_threshold
+                or abs(change_1p - last_1p) >= pct_threshold):
+            sent[i] = True
+            last_key, last_time = key, now
+            last_z, last_price, last_24h, last_1p = z, price, change_24h, change_1p
+
+    counts = np.bincount(keys[sent] % len(INDICATORS), minlength=len(INDICATORS))
+    return {indicator: int(counts[n]) for n, indicator in enumerate(INDICATORS)}
+
+def run_backtest(frames: dict, threshold_sets: list, timeframe: str = TIMEFRAME, dedup: bool = True):
+    """对每组阈值回放全部历史，返回每组的统计结果列表"""
+    if timeframe != TIMEFRAME:
+        frames = {symbol: resample_frame(df, timeframe) for symbol, df in frames.items()}
+    features = ReplayFeatures(frames)
+    results = []
+    for thresholds in threshold_sets:
+        fired = features.evaluate(thresholds)
+        row = dict(thresholds)
+        row['volume_fired'] = int(fired['volume'].sum())
+        row['oi_fired'] = int(sum(fired[k].sum() for k in ('oi_24h', 'oi_rise', 'oi_fall', 'oi_sudden')))
+        row['ls_fired'] = int(fired['ls'].sum())
+        if dedup:
+            sent = count_sent_alerts(features, fired, thresholds)
+            row['volume_sent'] = sent[Indicator.VOLUME]
+            row['oi_sent'] = sent[Indicator.OPEN_INTEREST]
+            row['ls_sent'] = sent[Indicator.LS_RATIO]
+            row['total_sent'] = sum(sent.values())
+        results.append(row)
+    return results
+
+def parse_grid(items: list):
+    """将 ["NAME=v1,v2", ...] 展开为阈值组合 (未指定的阈值使用 config.py 中的值)"""
+    grid = {}
+    for item in items:
+        name, _, values = item.partition('=')
+        name = name.strip().upper()
+        if name not in THRESHOLD_NAMES:
+            raise ValueError(f"Unknown threshold {name}, expected one of: {', '.join(THRESHOLD_NAMES)}")
+        grid[name] = [float(v) for v in values.split(',') if v.strip()]
+    names = list(grid)
+    return [dict(DEFAULT_THRESHOLDS, **dict(zip(names, combo))) for combo in itertools.product(*grid.values())]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('history', help='历史数据目录或文件 (CSV / Parquet)')
+    parser.add_argument('--grid', action='append', default=[], metavar='NAME=v1,v2,...', help='要扫描的阈值取值')
+    parser.add_argument('--timeframe', default=TIMEFRAME, help='回测周期 (由历史数据聚合得到，需为 TIMEFRAME 的整数倍)')
+    parser.add_argument('--no-dedup', action='store_true', help='只统计触发次数，不做去重')
+    parser.add_argument('--output', help='将结果保存为 CSV')
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    frames = load_history(args.history)
+    loaded = time.perf_counter()
+    threshold_sets = parse_grid(args.grid)
+    results = pd.DataFrame(run_backtest(frames, threshold_sets, args.timeframe, dedup=not args.no_dedup))
+    finished = time.perf_counter()
+
+    # 只显示被扫描的阈值列
+    varying = [name for name in THRESHOLD_NAMES if results[name].nunique() > 1]
+    columns = varying + [c for c in results.columns if c not in THRESHOLD_NAMES]
+    candles = sum(len(df) for df in frames.values())
+    print(f"{len(frames)} symbols, {candles} candles, {len(threshold_sets)} threshold set(s) "
+          f"(load {loaded - started:.2f}s, replay {finished - loaded:.2f}s)")
+    print(results[columns].to_string(index=False))
+    if args.output:
+        results.to_csv(args.output, index=False)
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+    main()
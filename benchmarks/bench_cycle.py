@@ -0,0 +1,208 @@
+"""
+端到端检查周期基准测试：对 mock_server 模拟的 Binance / DeepSeek / webhook 运行完整的检查流程，
+测量 10 / 100 / 500 个币种时的周期耗时、各阶段耗时 (获取数据、计算信号、去重 + AI + 告警) 与峰值内存。
+
+每个币种数量在独立的子进程中运行 (模块级缓存与内存统计互不影响)：
+先运行一次冷启动周期 (全量获取)，再推进模拟时钟运行若干次增量周期。
+结果追加到 --record 文件 (JSON Lines)，并与该文件中相同配置的上一次结果比较，便于发现性能回退。
+
+用法: python benchmarks/bench_cycle.py [--symbols 10 100 500] [--cycles 3] [--binance-latency 0.02]
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+import urllib.request
+
+import aiohttp
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+DEFAULT_RECORD = os.path.join(BENCH_DIR, 'results', 'bench_cycle.jsonl')
+STAGES = ('fetch', 'evaluate', 'dispatch')
+
+def _peak_rss_mb():
+    # Linux 上 ru_maxrss 单位为 KB，macOS 上为字节
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+def _mock_request(base_url: str, path: str, method: str = 'POST'):
+    with urllib.request.urlopen(urllib.request.Request(base_url + path, method=method)) as response:
+        return json.loads(response.read())
+
+async def _run_worker(args):
+    """在子进程中运行：环境变量已指向模拟服务器，此时才导入项目模块"""
+    sys.path.insert(0, REPO_DIR)
+    import alerter
+    import main
+    from data_fetcher import get_binance_data
+    from request_scheduler import scheduler
+    from resampler import derive_timeframe_frames
+    from signal_engine import evaluate_signals
+    from mock_server import symbol_names
+
+    # 告警间隔属于限速而不是性能，默认不计入
+    alerter.ALERT_MIN_INTERVAL = args.alert_interval
+    if not args.rate_limits:
+        # 500 个币种的全量获取会超过 /futures/data/* 每 5 分钟的请求限额，调度器会等待下一个窗口
+        scheduler.weight_bucket.capacity = scheduler.data_bucket.capacity = float('inf')
+
+    symbols = symbol_names(args.worker)
+    _mock_request(args.base_url, '/_mock/reset')
+    cycles = []
+    async with aiohttp.ClientSession(connector=main.create_connector()) as session:
+        semaphore = asyncio.Semaphore(main.CONCURRENCY_LIMIT)
+        for cycle in range(args.cycles + 1):
+            if cycle:
+                _mock_request(args.base_url, '/_mock/advance')
+            timings = {}
+            started = time.perf_counter()
+
+            results = await asyncio.gather(*[get_binance_data(s, session) for s in symbols])
+            frames = {s: df for s, df in zip(symbols, results) if not df.empty}
+            timings['fetch'] = time.perf_counter() - started
+
+            stage_started = time.perf_counter()
+            signals = []
+            for timeframe_frames in derive_timeframe_frames(frames).values():
+                signals.extend(evaluate_signals(timeframe_frames))
+            timings['evaluate'] = time.perf_counter() - stage_started
+
+            stage_started = time.perf_counter()
+            await main.dispatch_signals(signals, semaphore)
+            # 告警由发件箱后台任务发送，等待本轮告警发送完毕
+            await alerter.drain_outbox()
+            timings['dispatch'] = time.perf_counter() - stage_started
+
+            timings['total'] = time.perf_counter() - started
+            timings['signals'] = len(signals)
+            timings['frames'] = len(frames)
+            cycles.append(timings)
+    await main.close_alert_session()
+    await main.close_ai_client()
+
+    warm = cycles[1:] or cycles
+    result = {
+        'symbols': args.worker,
+        'cold': {k: round(v, 4) for k, v in cycles[0].items()},
+        'warm': {k: round(sum(c[k] for c in warm) / len(warm), 4) for k in ('total',) + STAGES},
+        'warm_signals': sum(c['signals'] for c in warm),
+        'peak_rss_mb': round(_peak_rss_mb(), 1),
+        'requests': _mock_request(args.base_url, '/_mock/stats', method='GET')['requests'],
+    }
+    print(json.dumps(result))
+
+def _git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def _wait_for_server(base_url: str, process: subprocess.Popen, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("Mock server exited during startup")
+        try:
+            _mock_request(base_url, '/_mock/stats', method='GET')
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("Mock server did not start in time")
+
+def _previous_results(path: str, config: dict):
+    """读取记录文件中相同配置的最近一次结果: symbols -> result"""
+    previous = {}
+    if not os.path.exists(path):
+        return previous
+    with open(path) as f:
+        for line in f:
+            record = json.loads(line)
+            if record.get('config') == config:
+                previous[record['result']['symbols']] = record['result']
+    return previous
+
+def _change(current: float, previous: dict, key: str):
+    if not previous:
+        return ''
+    before = previous['warm'][key]
+    return f"{(current - before) / before:+.0%}" if before else ''
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--symbols', type=int, nargs='+', default=[10, 100, 500], help='要测试的币种数量')
+    parser.add_argument('--cycles', type=int, default=3, help='冷启动之后的增量周期数')
+    parser.add_argument('--alert-interval', type=float, default=0, help='同一 webhook 的最小发送间隔 (秒)')
+    parser.add_argument('--rate-limits', action='store_true', help='保留 Binance 请求权重限额 (默认关闭以只测量处理耗时)')
+    parser.add_argument('--record', default=DEFAULT_RECORD, help='结果记录文件 (JSON Lines)，设为空字符串则不记录')
+    parser.add_argument('--worker', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--base-url', help=argparse.SUPPRESS)
+    from mock_server import add_server_arguments
+    add_server_arguments(parser)
+    args = parser.parse_args()
+
+    if args.worker:
+        asyncio.run(_run_worker(args))
+        return
+
+    base_url = f"http://{args.host}:{args.port}"
+    server = subprocess.Popen([
+        sys.executable, os.path.join(BENCH_DIR, 'mock_server.py'), '--symbols', str(max(args.symbols)),
+        '--host', args.host, '--port', str(args.port), '--binance-latency', str(args.binance_latency),
+        '--ai-latency', str(args.ai_latency), '--webhook-latency', str(args.webhook_latency),
+    ], stdout=subprocess.DEVNULL)
+    env = dict(
+        os.environ, BINANCE_API_URL=base_url, DEEPSEEK_API_KEY='mock', DEEPSEEK_API_BASE_URL=f"{base_url}/v1",
+        NOTIFYX_WEBHOOK_URL=f"{base_url}/notifyx/bench", GOTIFY_URL=f"{base_url}/gotify", GOTIFY_TOKEN='mock',
+        STATE_DB_PATH='', ALERT_OUTBOX_PATH='', HTTP_PROXY='', HTTPS_PROXY='', SOCKS5_PROXY_HOST='', NO_PROXY=args.host,
+        PYTHONPATH=BENCH_DIR,
+    )
+    config = {
+        'cycles': args.cycles, 'alert_interval': args.alert_interval, 'rate_limits': args.rate_limits,
+        'binance_latency': args.binance_latency, 'ai_latency': args.ai_latency, 'webhook_latency': args.webhook_latency,
+    }
+    previous = _previous_results(args.record, config) if args.record else {}
+
+    results = []
+    try:
+        _wait_for_server(base_url, server)
+        for count in args.symbols:
+            command = [
+                sys.executable, os.path.abspath(__file__), '--worker', str(count), '--base-url', base_url,
+                '--cycles', str(args.cycles), '--alert-interval', str(args.alert_interval),
+            ] + (['--rate-limits'] if args.rate_limits else [])
+            output = subprocess.run(command, env=env, cwd=REPO_DIR, capture_output=True, text=True, check=True).stdout
+            results.append(json.loads(output.strip().splitlines()[-1]))
+    finally:
+        server.terminate()
+        server.wait()
+
+    print(f"{'symbols':>8} {'cold (s)':>9} {'warm (s)':>9} {'change':>7} "
+          + " ".join(f"{stage + ' (s)':>13}" for stage in STAGES) + f" {'signals':>8} {'peak RSS (MB)':>14}")
+    for result in results:
+        warm = result['warm']
+        print(f"{result['symbols']:>8} {result['cold']['total']:>9.3f} {warm['total']:>9.3f} "
+              f"{_change(warm['total'], previous.get(result['symbols']), 'total'):>7} "
+              + " ".join(f"{warm[stage]:>13.3f}" for stage in STAGES)
+              + f" {result['warm_signals']:>8} {result['peak_rss_mb']:>14.1f}")
+
+    if args.record:
+        os.makedirs(os.path.dirname(os.path.abspath(args.record)), exist_ok=True)
+        recorded_at = time.strftime('%Y-%m-%dT%H:%M:%S')
+        with open(args.record, 'a') as f:
+            for result in results:
+                f.write(json.dumps({
+                    'recorded_at': recorded_at, 'revision': _git_revision(), 'python': platform.python_version(),
+                    'config': config, 'result': result,
+                }) + "\n")
+        print(f"Results appended to {args.record}")
+
+if __name__ == '__main__':
+    main()
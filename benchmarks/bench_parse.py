@@ -0,0 +1,100 @@
+"""
+比较两种原始数据解析方式的单币种耗时与峰值内存：
+- legacy: 旧版 pandas 路径 (object DataFrame + apply(pd.to_numeric) + 按 datetime 索引对齐 + bfill/ffill)
+- numpy:  data_fetcher.parse_market_data (直接解析为 NumPy 列)
+- frame:  data_fetcher._build_dataframe (numpy 路径 + 最终包装为 DataFrame)
+同时比较 json 与 orjson (若已安装) 的响应解码耗时。
+
+用法: python benchmarks/bench_parse.py [--rows 200] [--repeat 200]
+"""
+import argparse
+import json
+import os
+import sys
+import timeit
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from data_fetcher import parse_market_data, _build_dataframe
+from synthetic import generate_market_data
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def legacy_build_dataframe(klines_data: list, oi_data: list, ls_data: list):
+    """旧版 data_fetcher._build_dataframe，作为对照"""
+    df = pd.DataFrame(klines_data, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume', 'close_time', 'quote_asset_volume', 'number_of_trades', 'taker_buy_base_asset_volume', 'taker_buy_quote_asset_volume', 'ignore'])
+    df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
+    df.set_index('timestamp', inplace=True)
+    numeric_cols = ['open', 'high', 'low', 'close', 'volume', 'taker_buy_base_asset_volume']
+    df[numeric_cols] = df[numeric_cols].apply(pd.to_numeric)
+
+    volume_delta = df['taker_buy_base_asset_volume'] - (df['volume'] - df['taker_buy_base_asset_volume'])
+    df['cvd'] = volume_delta.cumsum()
+
+    oi_df = pd.DataFrame(oi_data)
+    oi_df['timestamp'] = pd.to_datetime(oi_df['timestamp'], unit='ms')
+    oi_df.set_index('timestamp', inplace=True)
+    oi_df = oi_df[~oi_df.index.duplicated(keep='last')]
+    df['oi'] = pd.to_numeric(oi_df['sumOpenInterestValue'])
+
+    ls_df = pd.DataFrame(ls_data)
+    ls_df['timestamp'] = pd.to_datetime(ls_df['timestamp'], unit='ms')
+    ls_df.set_index('timestamp', inplace=True)
+    ls_df = ls_df[~ls_df.index.duplicated(keep='last')]
+    df['ls_ratio'] = pd.to_numeric(ls_df['longShortRatio'])
+
+    df.bfill(inplace=True)
+    df.ffill(inplace=True)
+    return df
+
+def check_equivalent(data):
+    """确认新旧路径的数值列一致"""
+    legacy = legacy_build_dataframe(*data)
+    fast = _build_dataframe(*data)
+    assert legacy.index.equals(fast.index), "index mismatch"
+    for column in ['open', 'high', 'low', 'close', 'volume', 'cvd', 'oi', 'ls_ratio']:
+        np.testing.assert_allclose(fast[column].to_numpy(), legacy[column].to_numpy(dtype=float), rtol=1e-12, err_msg=column)
+
+def measure(func, args, repeat: int):
+    """返回 (单次平均耗时 µs, 单次调用峰值内存 KiB)"""
+    func(*args)
+    seconds = min(timeit.repeat(lambda: func(*args), number=repeat, repeat=3)) / repeat
+    tracemalloc.start()
+    func(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return seconds * 1e6, peak / 1024
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=200, help='每个币种的 K 线数量')
+    parser.add_argument('--repeat', type=int, default=200, help='每轮计时的调用次数')
+    args = parser.parse_args()
+
+    data = generate_market_data(rows=args.rows)
+    check_equivalent(data)
+
+    print(f"rows per symbol: {args.rows}")
+    print(f"{'path':<10}{'time/symbol (µs)':>20}{'peak memory (KiB)':>20}")
+    results = {}
+    for name, func in [('legacy', legacy_build_dataframe), ('numpy', parse_market_data), ('frame', _build_dataframe)]:
+        results[name] = measure(func, data, args.repeat)
+        print(f"{name:<10}{results[name][0]:>20.1f}{results[name][1]:>20.1f}")
+    print(f"speedup (legacy / frame): {results['legacy'][0] / results['frame'][0]:.1f}x")
+
+    payloads = [json.dumps(part).encode() for part in data]
+    decoders = [('json', json.loads)] + ([('orjson', orjson.loads)] if orjson else [])
+    print(f"\n{'decoder':<10}{'time/symbol (µs)':>20}")
+    for name, loads in decoders:
+        elapsed, _ = measure(lambda: [loads(p) for p in payloads], (), args.repeat)
+        print(f"{name:<10}{elapsed:>20.1f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,228 @@
+"""
+本地模拟服务器：模拟 Binance 期货 REST 接口、OpenAI 兼容的 chat 接口以及 NotifyX / Gotify webhook，
+用于基准测试与离线端到端运行。各类接口的响应延迟可配置。
+
+- GET  /fapi/v1/klines, /futures/data/openInterestHist, /futures/data/globalLongShortAccountRatio
+  (支持 symbol / limit / startTime，返回 X-MBX-USED-WEIGHT-1M 响应头)
+- GET  /fapi/v1/ticker/24hr, /fapi/v1/exchangeInfo
+- POST /v1/chat/completions (OpenAI 兼容，支持批量解读的分隔格式)
+- POST /notifyx/{token}, /gotify/message
+- WS   /stream?streams=<symbol>@kline_<interval>/... (组合 K 线流，advance 时推送新收盘的 K 线)
+- POST /_mock/advance (推进一根 K 线), /_mock/reset, GET /_mock/stats
+
+用法: python benchmarks/mock_server.py --port 18080 --symbols 100 --binance-latency 0.02
+然后设置 BINANCE_API_URL=http://127.0.0.1:18080、DEEPSEEK_API_BASE_URL=http://127.0.0.1:18080/v1、
+NOTIFYX_WEBHOOK_URL=http://127.0.0.1:18080/notifyx/token、GOTIFY_URL=http://127.0.0.1:18080/gotify 运行 main.py。
+流模式另外设置 BINANCE_WS_URL=ws://127.0.0.1:18080 与 STREAMING_MODE=true，再调用 /_mock/advance 触发 K 线收盘。
+"""
+import argparse
+import asyncio
+import json
+import re
+import time
+import zlib
+from collections import Counter
+
+from aiohttp import web
+
+from synthetic import generate_market_data
+
+# 与 ai_interpreter.BATCH_SEPARATOR 相同的批量分隔格式
+BATCH_SEPARATOR = re.compile(r'^=== SIGNAL (\d+) ===\s*$', re.MULTILINE)
+INTERPRETATION = "【核心信号解读】模拟解读。\n【市场背景分析】模拟背景。\n【潜在影响与后续关注】模拟关注点。"
+
+def symbol_names(count: int):
+    return [f"S{i:04d}USDT" for i in range(count)]
+
+class MockMarket:
+    """
+    每个币种一段固定的合成历史 (种子由币种名决定)，history 根 K 线中只有前 visible 根 "已发生"，
+    advance() 模拟新 K 线生成。
+    """
+    def __init__(self, symbols: int = 100, history: int = 700, visible: int = 500, interval: str = '1h'):
+        self.symbols = symbol_names(symbols)
+        self.symbol_set = set(self.symbols)
+        self.history = history
+        self.interval = interval
+        self.initial_visible = visible
+        self.visible = visible
+        self._data = {}
+
+    def data(self, symbol: str):
+        if symbol not in self._data:
+            self._data[symbol] = generate_market_data(rows=self.history, seed=zlib.crc32(symbol.encode()), interval=self.interval)
+        return self._data[symbol]
+
+    def advance(self, candles: int = 1):
+        self.visible = min(self.history, self.visible + candles)
+
+    def reset(self):
+        self.visible = self.initial_visible
+
+    def rows(self, kind: int, symbol: str, limit: int, start_time: int = None):
+        rows = self.data(symbol)[kind][:self.visible]
+        if start_time is None:
+            return rows[-limit:]
+        key = (lambda row: row[0]) if kind == 0 else (lambda row: row['timestamp'])
+        return [row for row in rows if key(row) >= start_time][:limit]
+
+class MockServer:
+    def __init__(self, market: MockMarket, binance_latency: float = 0.0, ai_latency: float = 0.0,
+                 webhook_latency: float = 0.0):
+        self.market = market
+        self.latency = {'binance': binance_latency, 'ai': ai_latency, 'webhook': webhook_latency}
+        self.requests = Counter()
+        self.weight_minute = None
+        self.used_weight = 0
+        # 已连接的 K 线流: WebSocketResponse -> 订阅的币种列表
+        self.streams = {}
+
+    async def _delay(self, group: str, route: str):
+        self.requests[route] += 1
+        if self.latency[group]:
+            await asyncio.sleep(self.latency[group])
+
+    def _weight_header(self, weight: int):
+        minute = int(time.time() // 60)
+        if minute != self.weight_minute:
+            self.weight_minute, self.used_weight = minute, 0
+        self.used_weight += weight
+        return {'X-MBX-USED-WEIGHT-1M': str(self.used_weight)}
+
+    def _series_handler(self, kind: int, route: str):
+        async def handler(request):
+            await self._delay('binance', route)
+            query = request.query
+            symbol = query.get('symbol')
+            if symbol not in self.market.symbol_set:
+                return web.json_response({"code": -1121, "msg": "Invalid symbol."}, status=400)
+            start_time = int(query['startTime']) if 'startTime' in query else None
+            rows = self.market.rows(kind, symbol, int(query.get('limit', 500)), start_time)
+            return web.json_response(rows, headers=self._weight_header(2 if kind == 0 else 0))
+        return handler
+
+    async def ticker(self, request):
+        await self._delay('binance', 'ticker')
+        tickers = [
+            {"symbol": symbol, "quoteVolume": str(1e9 / (n + 1)), "lastPrice": "1"}
+            for n, symbol in enumerate(self.market.symbols)
+        ]
+        return web.json_response(tickers, headers=self._weight_header(40))
+
+    async def exchange_info(self, request):
+        await self._delay('binance', 'exchangeInfo')
+        symbols = [
+            {"symbol": symbol, "contractType": "PERPETUAL", "quoteAsset": "USDT", "status": "TRADING"}
+            for symbol in self.market.symbols
+        ]
+        return web.json_response({"symbols": symbols}, headers=self._weight_header(1))
+
+    async def chat(self, request):
+        body = await request.json()
+        await self._delay('ai', 'chat')
+        user_prompt = body['messages'][-1]['content']
+        numbers = BATCH_SEPARATOR.findall(user_prompt)
+        if numbers:
+            content = "\n".join(f"=== SIGNAL {n} ===\n{INTERPRETATION}" for n in numbers)
+        else:
+            content = INTERPRETATION
+        prompt_tokens = sum(len(m['content']) for m in body['messages']) // 4
+        return web.json_response({
+            "id": "mock", "object": "chat.completion", "created": int(time.time()), "model": body.get('model', 'mock'),
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(content) // 4,
+                      "total_tokens": prompt_tokens + len(content) // 4},
+        })
+
+    async def webhook(self, request):
+        await request.read()
+        await self._delay('webhook', 'gotify' if request.path.startswith('/gotify') else 'notifyx')
+        return web.json_response({"ok": True})
+
+    async def kline_stream(self, request):
+        """组合 K 线流 (只推送 advance 产生的已收盘 K 线)"""
+        symbols = [stream.split('@', 1)[0].upper() for stream in request.query.get('streams', '').split('/') if stream]
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        self.requests['stream'] += 1
+        self.streams[ws] = [symbol for symbol in symbols if symbol in self.market.symbol_set]
+        try:
+            async for _ in ws:
+                pass
+        finally:
+            self.streams.pop(ws, None)
+        return ws
+
+    def _kline_event(self, symbol: str, row: list):
+        k = {
+            "t": row[0], "T": row[6], "s": symbol, "i": self.market.interval, "o": row[1], "h": row[2], "l": row[3],
+            "c": row[4], "v": row[5], "n": row[8], "x": True, "q": row[7], "V": row[9], "Q": row[10], "B": row[11],
+        }
+        stream = f"{symbol.lower()}@kline_{self.market.interval}"
+        return json.dumps({"stream": stream, "data": {"e": "kline", "E": int(time.time() * 1000), "s": symbol, "k": k}})
+
+    async def advance(self, request):
+        previous = self.market.visible
+        self.market.advance(int(request.query.get('candles', 1)))
+        # 新出现的 K 线作为已收盘事件推送给订阅者
+        for ws, symbols in list(self.streams.items()):
+            for symbol in symbols:
+                for row in self.market.data(symbol)[0][previous:self.market.visible]:
+                    await ws.send_str(self._kline_event(symbol, row))
+        return web.json_response({"visible": self.market.visible})
+
+    async def reset(self, request):
+        self.market.reset()
+        self.requests.clear()
+        return web.json_response({"visible": self.market.visible})
+
+    async def stats(self, request):
+        return web.json_response({"visible": self.market.visible, "requests": dict(self.requests)})
+
+    def app(self):
+        app = web.Application()
+        app.add_routes([
+            web.get('/fapi/v1/klines', self._series_handler(0, 'klines')),
+            web.get('/futures/data/openInterestHist', self._series_handler(1, 'openInterestHist')),
+            web.get('/futures/data/globalLongShortAccountRatio', self._series_handler(2, 'globalLongShortAccountRatio')),
+            web.get('/fapi/v1/ticker/24hr', self.ticker),
+            web.get('/fapi/v1/exchangeInfo', self.exchange_info),
+            web.post('/v1/chat/completions', self.chat),
+            web.post('/notifyx/{token}', self.webhook),
+            web.post('/gotify/message', self.webhook),
+            web.get('/stream', self.kline_stream),
+            web.post('/_mock/advance', self.advance),
+            web.post('/_mock/reset', self.reset),
+            web.get('/_mock/stats', self.stats),
+        ])
+        return app
+
+async def start_mock_server(server: MockServer, host: str = '127.0.0.1', port: int = 18080):
+    """在当前事件循环中启动服务器，返回 AppRunner (调用 runner.cleanup() 停止)"""
+    runner = web.AppRunner(server.app(), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
+
+def add_server_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=18080)
+    parser.add_argument('--binance-latency', type=float, default=0.02, help='Binance 接口响应延迟 (秒)')
+    parser.add_argument('--ai-latency', type=float, default=0.5, help='chat 接口响应延迟 (秒)')
+    parser.add_argument('--webhook-latency', type=float, default=0.05, help='webhook 响应延迟 (秒)')
+
+async def serve_forever(args):
+    market = MockMarket(symbols=args.symbols)
+    server = MockServer(market, args.binance_latency, args.ai_latency, args.webhook_latency)
+    await start_mock_server(server, args.host, args.port)
+    print(f"Mock server listening on http://{args.host}:{args.port} with {args.symbols} symbols", flush=True)
+    await asyncio.Event().wait()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--symbols', type=int, default=100, help='模拟的币种数量')
+    add_server_arguments(parser)
+    try:
+        asyncio.run(serve_forever(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
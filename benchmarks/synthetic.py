@@ -0,0 +1,41 @@
+"""
+基准测试用的合成行情数据，格式与 Binance REST 接口的 JSON 响应一致。
+"""
+import math
+import random
+
+INTERVAL_MS = {'5m': 300_000, '15m': 900_000, '1h': 3_600_000, '4h': 14_400_000}
+
+def generate_market_data(rows: int = 200, seed: int = 0, interval: str = '1h', start: int = 1_700_000_000_000):
+    """
+    生成一个币种的 (klines, oi, ls) 原始响应：
+    - klines: /fapi/v1/klines 的行 (数值为字符串)
+    - oi: /futures/data/openInterestHist 的记录
+    - ls: /futures/data/globalLongShortAccountRatio 的记录
+    """
+    rng = random.Random(seed)
+    step = INTERVAL_MS[interval]
+    price, oi, ls = 100.0 * (1 + seed % 50), 1e7, 1.0
+    klines, oi_data, ls_data = [], [], []
+    for i in range(rows):
+        ts = start + i * step
+        close = price * math.exp(rng.gauss(0, 0.01))
+        volume = abs(rng.gauss(1000, 300))
+        taker_buy = volume * rng.random()
+        klines.append([
+            ts, f"{price:.4f}", f"{max(price, close) * 1.002:.4f}", f"{min(price, close) * 0.998:.4f}",
+            f"{close:.4f}", f"{volume:.3f}", ts + step - 1, f"{volume * close:.2f}", rng.randint(100, 5000),
+            f"{taker_buy:.3f}", f"{taker_buy * close:.2f}", "0",
+        ])
+        price = close
+        oi *= math.exp(rng.gauss(0, 0.01))
+        ls *= math.exp(rng.gauss(0, 0.01))
+        oi_data.append({
+            "symbol": "SYNUSDT", "sumOpenInterest": f"{oi / close:.3f}",
+            "sumOpenInterestValue": f"{oi:.2f}", "timestamp": ts,
+        })
+        ls_data.append({
+            "symbol": "SYNUSDT", "longShortRatio": f"{ls:.4f}", "longAccount": f"{ls / (1 + ls):.4f}",
+            "shortAccount": f"{1 / (1 + ls):.4f}", "timestamp": ts,
+        })
+    return klines, oi_data, ls_data
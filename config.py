@@ -13,10 +13,37 @@ NOTIFYX_WEBHOOK_URLS = [url.strip() for url in webhook_urls_str.split(',') if ur
 GOTIFY_URL = os.getenv("GOTIFY_URL")
 GOTIFY_TOKEN = os.getenv("GOTIFY_TOKEN")
 
+# --- Alert Delivery Settings ---
+ALERT_TIMEOUT = 10               # 单次 webhook 请求超时 (秒)
+ALERT_MAX_RETRIES = 3            # 失败后的最大重试次数 (超时、网络错误、429、5xx)
+ALERT_RETRY_BACKOFF = 1          # 重试退避基数 (秒)，第 n 次重试等待 ALERT_RETRY_BACKOFF * 2^n 秒
+ALERT_MIN_INTERVAL = 1           # 同一 webhook 两次发送之间的最小间隔 (秒)
+# 告警发件箱: 渲染好的告警先写入 SQLite，再由后台任务发送，失败的告警跨重启保留并继续重试 (为空时只保存在内存中)
+ALERT_OUTBOX_PATH = os.getenv("ALERT_OUTBOX_PATH", "alert_outbox.db")
+ALERT_OUTBOX_MAX_ATTEMPTS = 20   # 发件箱中单条告警的最大发送次数 (每次包含上面的重试)，超过后标记为 failed 保留在数据库中
+ALERT_OUTBOX_RETRY_DELAY = 30    # 发送失败后再次尝试的基础间隔 (秒)，按次数翻倍，最长 1 小时
+# 一轮检查中某个渠道的告警超过此数量时，合并为一条汇总消息 (0 表示不合并)
+ALERT_DIGEST_THRESHOLD = int(os.getenv("ALERT_DIGEST_THRESHOLD", "5"))
+# 两阶段告警: 信号通过去重后立即发送不含 AI 解读的告警，AI 解读 (流式获取) 完成后再发送一条补充消息
+ALERT_TWO_PHASE = False
+# 两阶段告警时，AI 解读每完成一个【】段落就发送一条补充消息 (False 时整体完成后发送一条)
+ALERT_FOLLOWUP_PER_SECTION = False
+
 # --- AI Model Settings ---
 # DeepSeek Model Settings
 DEEPSEEK_MODEL_NAME = os.getenv("DEEPSEEK_MODEL_NAME", "deepseek-chat")
 DEEPSEEK_API_BASE_URL = os.getenv("DEEPSEEK_API_BASE_URL", "https://api.deepseek.com/v1")
+AI_CONCURRENCY_LIMIT = 4         # 同时进行的 AI 请求上限
+AI_TIMEOUT = 60                  # 单次 AI 请求超时 (秒)
+AI_CACHE_TTL = 1800              # AI 解读缓存有效期 (秒)
+AI_CACHE_SIZE = 256              # AI 解读缓存最大条数 (LRU)
+AI_CACHE_SIGNIFICANT_DIGITS = 3  # 计算信号指纹时数值保留的有效数字位数 (越小越容易命中缓存)
+# 批量解读: 将一轮检查中所有需要发送的信号合并为一次 AI 请求
+AI_BATCH_MODE = False
+AI_BATCH_MAX_SIZE = 10           # 每次批量请求最多包含的信号数
+# 单个信号的用户提示词 token 上限，超出时裁剪最早的 K 线
+AI_PROMPT_TOKEN_BUDGET = int(os.getenv("AI_PROMPT_TOKEN_BUDGET", "600"))
+AI_PROMPT_MIN_KLINES = 4         # 裁剪时至少保留的 K 线数
 
 # --- Gemini Model Settings (Archived) ---
 # 默认模型名称
@@ -26,12 +53,33 @@ DEEPSEEK_API_BASE_URL = os.getenv("DEEPSEEK_API_BASE_URL", "https://api.deepseek
 # --- Monitoring Settings ---
 # 动态币种监控开关 (True: 自动获取热门币种, False: 使用下面的 SYMBOLS 列表)
 DYNAMIC_SYMBOLS = False
-TOP_N_SYMBOLS = 20 # 如果开启动态监控，获取流动性前 N 名的币种
+TOP_N_SYMBOLS = int(os.getenv("TOP_N_SYMBOLS", "20")) # 如果开启动态监控，获取流动性前 N 名的币种 (支持数百个)
+UNIVERSE_REFRESH_INTERVAL = 3600         # 动态币种列表的刷新间隔 (秒)
+EXCHANGE_INFO_REFRESH_INTERVAL = 6 * 3600  # 合约信息 (exchangeInfo，用于过滤非永续/已下架合约) 的刷新间隔 (秒)
 
 # 静态币种列表 (当 DYNAMIC_SYMBOLS = False 时生效，或作为动态获取失败时的备用列表)
 SYMBOLS = ['BTCUSDT','ETHUSDT','SOLUSDT','DOGEUSDT'] # 要监控的币种列表
-TIMEFRAME = '1h'                # K线周期
-DATA_FETCH_LIMIT = 200           # 每次获取数据条数
+TIMEFRAME = os.getenv("TIMEFRAME", "1h")  # K线周期 (获取数据的基础周期)
+# 多周期分析: 只从 Binance 获取 TIMEFRAME 的数据，更粗的周期在本地由已收盘的 K 线聚合得到
+# 每个周期都必须是 TIMEFRAME 的整数倍，例如 TIMEFRAME='15m'、TIMEFRAMES='15m,1h'。
+# 滚动窗口最多 500 根 TIMEFRAME K 线 (OI / 多空比历史接口的上限)，最粗的周期也要能聚合出回看周期 (96 根) 以上的 K 线，
+# 即最粗周期不超过 TIMEFRAME 的 5 倍，否则启动时报错
+TIMEFRAMES = [tf.strip() for tf in os.getenv("TIMEFRAMES", TIMEFRAME).split(',') if tf.strip()]
+DATA_FETCH_LIMIT = 200           # 每次获取数据条数 (滚动窗口长度，多周期时按最粗周期的条数自动放大)
+# 增量获取: 缓存每个币种的滚动窗口，之后只请求比缓存更新的数据
+INCREMENTAL_FETCH = True
+INCREMENTAL_FETCH_LIMIT = 10     # 增量请求的最大条数 (返回条数达到此值时回退为全量获取)
+# 向量化引擎: 先获取所有币种数据，再在 (币种 x 时间) 矩阵上一次性计算所有信号
+# (False 时逐个币种调用 VolumeSignal / OpenInterestSignal / LSRatioSignal)
+VECTORIZED_ENGINE = True
+# 声明式信号规则文件 (JSON，见 rule_engine.py)，启动时编译为向量化表达式；为空时使用内置的向量化引擎
+RULES_PATH = os.getenv("RULES_PATH", "")
+# 信号计算进程池: 大于 0 时，各币种数据通过共享内存交给 N 个子进程计算 (不阻塞事件循环)，0 表示在主进程中计算
+PROCESS_POOL_WORKERS = int(os.getenv("PROCESS_POOL_WORKERS", "0"))
+# 轮询模式的检查周期: 在每根 CHECK_INTERVAL K 线收盘后 CHECK_SETTLE_SECONDS 秒执行检查
+# (默认与 TIMEFRAME 相同；设为更短的周期如 '15m' 时，非 TIMEFRAME 收盘时刻的检查使用未收盘的 K 线)
+CHECK_INTERVAL = os.getenv("CHECK_INTERVAL", TIMEFRAME)
+CHECK_SETTLE_SECONDS = 5         # 收盘后等待的秒数，等待交易所完成 K 线与 OI/多空比数据的更新
 # --- Indicator Thresholds ---
 # Volume Anomaly
 VOLUME_Z_SCORE_THRESHOLD = 2.0   # 成交量Z-Score异动阈值
@@ -54,9 +102,38 @@ Z_SCORE_CHANGE_THRESHOLD = 0.5
 # 只有当新的百分比与上次发送的百分比差值的绝对值大于此阈值时，才被视为新信号
 PERCENTAGE_CHANGE_THRESHOLD = 0.05 # 5%
 
+# 信号状态持久化 (SQLite, WAL 模式)，重启后恢复，避免重启引发的告警风暴
+# 设为空字符串则只保存在内存中。Docker 部署时建议挂载数据卷，例如 STATE_DB_PATH=/data/signal_state.db
+STATE_DB_PATH = os.getenv("STATE_DB_PATH", "signal_state.db")
+STATE_TTL_SECONDS = 24 * 3600    # 信号状态保留时间 (秒)，超过后同类信号视为新信号
+INDICATOR_CHECKPOINT_INTERVAL = 300  # 流式指标状态 (Z-Score/EMA/RSI 累加器) 写入状态库的最小间隔 (秒)，退出时也会写入一次
+
+# --- Sharding ---
+# 多个 worker 分担币种列表: 设置为同一个 SQLite 文件路径 (同一台机器或支持文件锁的共享卷) 即开启，
+# 各 worker 通过该文件续租、按一致性哈希分配币种，并共享告警去重状态。为空时单进程处理所有币种
+SHARD_DB_PATH = os.getenv("SHARD_DB_PATH", "")
+SHARD_WORKER_ID = os.getenv("SHARD_WORKER_ID", "")  # 为空时使用 <主机名>-<进程号>
+SHARD_LEASE_SECONDS = 30         # 超过此时间未续租的 worker 视为已退出，其币种分配给其他 worker
+SHARD_HEARTBEAT_INTERVAL = 10    # 续租间隔 (秒)
+
+# --- Streaming Mode Settings ---
+# 开启后订阅 Binance 组合 K 线 WebSocket 流 (<symbol>@kline_<interval>)，在 K 线收盘时触发检查，
+# OI / 多空比仍通过 REST 获取。关闭时使用定时轮询 REST。
+STREAMING_MODE = os.getenv("STREAMING_MODE", "false").lower() == "true"
+WS_STREAMS_PER_CONNECTION = 100  # 每个 WebSocket 连接订阅的流数量 (Binance 上限 200)
+WS_CLOSE_SETTLE_SECONDS = 2      # K 线收盘后等待的秒数，用于合并同一时刻收盘的币种并等待 OI/多空比数据更新
+WS_INTRA_CANDLE_CHECK = False    # 是否在 K 线未收盘时也进行检查 (使用缓存的 OI/多空比)
+WS_INTRA_CANDLE_INTERVAL = 60    # 盘中检查的最小间隔 (秒/币种)
+WS_RESEED_INTERVAL = 60          # 没有滚动窗口缓存 (启动时 REST 获取失败) 的币种重新通过 REST 获取的最小间隔 (秒/币种)
+
 # --- Network Settings ---
+BINANCE_API_URL = os.getenv("BINANCE_API_URL", "https://fapi.binance.com")
+BINANCE_WS_URL = os.getenv("BINANCE_WS_URL", "wss://fstream.binance.com")
 HTTP_PROXY = os.getenv("HTTP_PROXY")
 HTTPS_PROXY = os.getenv("HTTPS_PROXY")
+# 整个运行期间共用一个 HTTP 连接池
+HTTP_DNS_CACHE_TTL = 300         # DNS 解析结果缓存时间 (秒)
+HTTP_KEEPALIVE_TIMEOUT = 75      # 空闲长连接的保持时间 (秒)
 
 # SOCKS5 Proxy Support
 SOCKS5_PROXY_HOST = os.getenv("SOCKS5_PROXY_HOST")
@@ -70,8 +147,37 @@ elif HTTP_PROXY:
 elif HTTPS_PROXY:
     PROXY_URL = HTTPS_PROXY
 
+# Prometheus 指标: main.py 运行时在 http://METRICS_HOST:METRICS_PORT/metrics 提供各阶段耗时与计数，设为 0 则关闭
+METRICS_HOST = os.getenv("METRICS_HOST", "0.0.0.0")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9108"))
+
 # SSL Verification (Set to False if you use a proxy with self-signed certs)
 VERIFY_SSL = os.getenv("VERIFY_SSL", "true").lower() == "true"
 
 # Concurrency Limit (Reduce if OOM/Crash occurs)
+# 告警处理的并发数，同时也是 Binance 请求的初始并发数 (之后由请求调度器根据已用权重自动调整)
 CONCURRENCY_LIMIT = int(os.getenv("CONCURRENCY_LIMIT", "2"))
+MAX_CONCURRENCY_LIMIT = int(os.getenv("MAX_CONCURRENCY_LIMIT", "20"))  # Binance 请求并发数上限
+
+# --- Binance Rate Limits ---
+BINANCE_WEIGHT_LIMIT = 2400      # 每分钟请求权重上限 (REQUEST_WEIGHT)
+BINANCE_DATA_RATE_LIMIT = 1000   # /futures/data/* 接口每 5 分钟请求次数上限
+BINANCE_RATE_SAFETY_RATIO = 0.8  # 只使用上限的这一比例，超过时降低并发
+
+# --- Binance 请求的超时、重试与对冲 ---
+FETCH_TIMEOUT = 10               # 单次请求超时 (秒)，不包括在调度器中排队的时间
+# 按接口覆盖 FETCH_TIMEOUT (键为 URL 路径的最后一段)
+FETCH_TIMEOUTS = {
+    'klines': 8,
+    'openInterestHist': 8,
+    'globalLongShortAccountRatio': 8,
+    'exchangeInfo': 20,
+    '24hr': 20,
+}
+FETCH_MAX_RETRIES = 2            # 超时、网络错误、429、5xx 后的最大重试次数
+FETCH_RETRY_BACKOFF = 0.5        # 重试退避基数 (秒)，第 n 次重试随机等待 0 ~ FETCH_RETRY_BACKOFF * 2^n 秒
+# 对冲请求: 请求超过该接口最近耗时的 p95 仍未返回时，再发送一个相同的请求，使用先成功的结果 (会额外消耗请求权重)
+FETCH_HEDGE = os.getenv("FETCH_HEDGE", "false").lower() == "true"
+FETCH_HEDGE_MIN_DELAY = 0.2      # 对冲请求的最小等待时间 (秒)
+# 获取失败时，使用缓存中最新数据不早于这么多根 TIMEFRAME K 线之前的序列 (标记为 stale)，0 表示不使用缓存
+FETCH_STALE_MAX_PERIODS = 3
@@ -1,111 +1,242 @@
 import aiohttp
 import asyncio
+import numpy as np
 import pandas as pd
 import logging
-from config import TIMEFRAME, DATA_FETCH_LIMIT, TOP_N_SYMBOLS, VERIFY_SSL
+import time
+from urllib.parse import urlparse
+from config import (
+    TIMEFRAME, TIMEFRAMES, DATA_FETCH_LIMIT, INCREMENTAL_FETCH, INCREMENTAL_FETCH_LIMIT, BINANCE_API_URL,
+    FETCH_TIMEOUT, FETCH_TIMEOUTS, FETCH_MAX_RETRIES, FETCH_HEDGE, FETCH_STALE_MAX_PERIODS,
+)
+from request_scheduler import scheduler
+from timeframes import interval_seconds
+from metrics import PARSE_SECONDS, CACHE_EVENTS
 
 logger = logging.getLogger(__name__)
 
-BASE_URL = "https://fapi.binance.com"
+BASE_URL = BINANCE_API_URL
 
-async def get_top_liquid_symbols(session: aiohttp.ClientSession):
-    """获取币安期货市场流动性最高的 N 个 USDT 交易对 (Async)"""
-    try:
-        ticker_url = f"{BASE_URL}/fapi/v1/ticker/24hr"
-        # Use verify_ssl=VERIFY_SSL if session supports it, but session.get usually handles ssl=Boolean or SSLContext
-        # For aiohttp 3.x, verify_ssl is passed as ssl=Boolean to request
-        async with session.get(ticker_url, ssl=VERIFY_SSL) as response:
-            if response.status != 200:
-                logger.error(f"Error fetching top symbols: HTTP {response.status}")
-                return []
-            tickers = await response.json()
-        
-        # 过滤出 USDT 永续合约并转换为 DataFrame
-        usdt_futures = [t for t in tickers if t['symbol'].endswith('USDT')]
-        df = pd.DataFrame(usdt_futures)
-        
-        # 将交易量转换为数值类型以便排序
-        df['quoteVolume'] = pd.to_numeric(df['quoteVolume'])
-        
-        # 按 24 小时交易额降序排序
-        top_symbols = df.sort_values(by='quoteVolume', ascending=False)
-        
-        # 提取前 N 个币种的名称
-        symbol_list = top_symbols['symbol'].head(TOP_N_SYMBOLS).tolist()
-        
-        logger.info(f"动态获取到流动性前 {TOP_N_SYMBOLS} 的币种: {', '.join(symbol_list)}")
-        return symbol_list
-        
-    except Exception as e:
-        logger.error(f"动态获取热门币种列表失败: {e}", exc_info=True)
-        return []
+# 滚动窗口长度 (TIMEFRAME K 线条数): 尽量让最粗的分析周期也有 DATA_FETCH_LIMIT 根 K 线，
+# 但 OI / 多空比历史接口单次最多返回 HIST_MAX_LIMIT 条
+HIST_MAX_LIMIT = 500
+MAX_TIMEFRAME_RATIO = max(interval_seconds(tf) // interval_seconds(TIMEFRAME) for tf in TIMEFRAMES)
+WINDOW_LIMIT = max(DATA_FETCH_LIMIT, min(DATA_FETCH_LIMIT * MAX_TIMEFRAME_RATIO, HIST_MAX_LIMIT))
+
+# 每个币种的滚动窗口缓存: symbol -> {'klines': [...], 'oi': [...], 'ls': [...]}
+# 保存的是 Binance 返回的原始行，跨运行周期保留在进程内
+_window_cache = {}
+
+def _kline_time(row):
+    return int(row[0])
+
+def _hist_time(row):
+    return int(row['timestamp'])
+
+def _merge_rows(cached_rows: list, new_rows: list, key):
+    """按时间戳合并新旧数据 (新数据覆盖旧数据)，并只保留最近 WINDOW_LIMIT 条"""
+    merged = {key(row): row for row in cached_rows}
+    for row in new_rows:
+        merged[key(row)] = row
+    return [merged[ts] for ts in sorted(merged)][-WINDOW_LIMIT:]
+
+async def _cached_rows(rows: list):
+    return rows
+
+async def _fetch_rows(session: aiohttp.ClientSession, url: str, params: dict, cached_rows: list, key):
+    """
+    增量获取一个数据序列。
+    有缓存时只请求最后一条缓存记录之后的数据 (包含最后一条，因为当前 K 线可能仍在变化)，
+    返回条数达到上限说明缺口过大，回退到全量获取。
+    """
+    if INCREMENTAL_FETCH and cached_rows:
+        incremental_params = dict(params, startTime=key(cached_rows[-1]), limit=INCREMENTAL_FETCH_LIMIT)
+        new_rows = await fetch_json(session, url, incremental_params)
+        if new_rows is None:
+            return None
+        if len(new_rows) < INCREMENTAL_FETCH_LIMIT:
+            CACHE_EVENTS.inc(cache='window', result='hit')
+            return _merge_rows(cached_rows, new_rows, key)
+        logger.info(f"Gap too large for incremental fetch of {url} ({params.get('symbol')}), doing full refresh.")
+
+    CACHE_EVENTS.inc(cache='window', result='miss')
+    rows = await fetch_json(session, url, dict(params, limit=WINDOW_LIMIT))
+    if not rows:
+        return rows
+    return _merge_rows([], rows, key)
 
 async def fetch_json(session: aiohttp.ClientSession, url: str, params: dict):
-    try:
-        async with session.get(url, params=params, ssl=VERIFY_SSL) as response:
-            if response.status == 200:
-                return await response.json()
-            else:
-                logger.error(f"Error fetching {url}: HTTP {response.status}")
-                return None
-    except Exception as e:
-        logger.error(f"Exception fetching {url}: {e}")
+    # 由调度器统一控制权重、限流与并发；超时按接口配置，失败后重试，可选对冲请求
+    endpoint = urlparse(url).path.rsplit('/', 1)[-1]
+    return await scheduler.request(
+        session, url, params,
+        timeout=FETCH_TIMEOUTS.get(endpoint, FETCH_TIMEOUT), retries=FETCH_MAX_RETRIES, hedge=FETCH_HEDGE,
+    )
+
+def _stale_rows(cached_rows: list, key):
+    """获取失败时可以代替的缓存序列：最新一条不早于 FETCH_STALE_MAX_PERIODS 根 K 线之前，否则返回 None"""
+    if not FETCH_STALE_MAX_PERIODS or not cached_rows:
         return None
+    max_age_ms = (FETCH_STALE_MAX_PERIODS + 1) * interval_seconds(TIMEFRAME) * 1000
+    if time.time() * 1000 - key(cached_rows[-1]) > max_age_ms:
+        return None
+    return cached_rows
+
+# K 线行中各字段的位置 (REST /fapi/v1/klines 与 WebSocket 转换后的行格式相同)
+KLINE_FIELDS = {
+    'open': 1, 'high': 2, 'low': 3, 'close': 4, 'volume': 5, 'close_time': 6,
+    'quote_asset_volume': 7, 'number_of_trades': 8,
+    'taker_buy_base_asset_volume': 9, 'taker_buy_quote_asset_volume': 10,
+}
+INT_FIELDS = ('close_time', 'number_of_trades')
+
+def _fill_gaps(values: np.ndarray):
+    """先向后填充 (bfill) 再向前填充 (ffill) NaN，与 DataFrame.bfill().ffill() 一致"""
+    missing = np.isnan(values)
+    if not missing.any() or missing.all():
+        return values
+    n = len(values)
+    positions = np.arange(n)
+    # bfill: 每个位置之后 (含自身) 第一个有效值的位置
+    next_valid = np.where(missing, n, positions)
+    next_valid = np.minimum.accumulate(next_valid[::-1])[::-1]
+    # ffill: 每个位置之前 (含自身) 最后一个有效值的位置
+    prev_valid = np.maximum.accumulate(np.where(missing, -1, positions))
+    source = np.where(next_valid < n, next_valid, prev_valid)
+    return values[source]
+
+def _align_to_klines(kline_times: np.ndarray, times: np.ndarray, values: np.ndarray):
+    """按整数毫秒时间戳将序列对齐到 K 线 (重复时间戳保留最后一条)，缺失处按 bfill/ffill 填充"""
+    aligned = np.full(len(kline_times), np.nan)
+    if len(times) == 0:
+        return aligned
+    order = np.argsort(times, kind='stable')
+    times, values = times[order], values[order]
+    keep_last = np.append(times[1:] != times[:-1], True)
+    times, values = times[keep_last], values[keep_last]
+
+    positions = np.minimum(np.searchsorted(times, kline_times), len(times) - 1)
+    matched = times[positions] == kline_times
+    aligned[matched] = values[positions[matched]]
+    return _fill_gaps(aligned)
+
+def parse_market_data(klines_data: list, oi_data: list, ls_data: list):
+    """
+    不经过 pandas，直接将原始数据解析为连续的 NumPy 列。
+    返回 (timestamps, columns)：timestamps 为 int64 毫秒时间戳，columns 为 {列名: float64/int64 数组}。
+    """
+    raw = np.array(klines_data, dtype=np.float64)
+    timestamps = raw[:, 0].astype(np.int64)
+    columns = {}
+    for name, index in KLINE_FIELDS.items():
+        column = np.ascontiguousarray(raw[:, index])
+        columns[name] = column.astype(np.int64) if name in INT_FIELDS else column
 
-async def get_binance_data(symbol: str, session: aiohttp.ClientSession):
-    """获取一个币种的所有相关数据：K-line, OI, L/S Ratio (Async)"""
+    # CVD: 主动买入量 - 主动卖出量 的累计值 (原地累加)
+    cvd = columns['taker_buy_base_asset_volume'] - (columns['volume'] - columns['taker_buy_base_asset_volume'])
+    np.cumsum(cvd, out=cvd)
+    columns['cvd'] = cvd
+
+    oi_times = np.fromiter((int(row['timestamp']) for row in oi_data), dtype=np.int64, count=len(oi_data))
+    oi_values = np.fromiter((float(row['sumOpenInterestValue']) for row in oi_data), dtype=np.float64, count=len(oi_data))
+    columns['oi'] = _align_to_klines(timestamps, oi_times, oi_values)
+
+    ls_times = np.fromiter((int(row['timestamp']) for row in ls_data), dtype=np.int64, count=len(ls_data))
+    ls_values = np.fromiter((float(row['longShortRatio']) for row in ls_data), dtype=np.float64, count=len(ls_data))
+    columns['ls_ratio'] = _align_to_klines(timestamps, ls_times, ls_values)
+
+    return timestamps, columns
+
+@PARSE_SECONDS.time()
+def _build_dataframe(klines_data: list, oi_data: list, ls_data: list):
+    """将 K-line, OI, L/S Ratio 原始数据合并为一个 DataFrame (数值列已是 float64，无需逐列转换)"""
+    timestamps, columns = parse_market_data(klines_data, oi_data, ls_data)
+    index = pd.to_datetime(timestamps, unit='ms')
+    index.name = 'timestamp'
+    return pd.DataFrame(columns, index=index, copy=False)
+
+def apply_stream_kline(symbol: str, row: list):
+    """将 WebSocket 推送的 K 线 (REST klines 行格式) 合并进滚动窗口缓存；该币种尚无缓存时返回 False"""
+    cached = _window_cache.get(symbol)
+    if not cached:
+        return False
+    cached['klines'] = _merge_rows(cached['klines'], [row], _kline_time)
+    return True
+
+def get_cached_data(symbol: str):
+    """只用缓存的滚动窗口构建 DataFrame，不发起任何请求"""
+    cached = _window_cache.get(symbol)
+    if not cached:
+        return pd.DataFrame()
+    df = _build_dataframe(cached['klines'], cached['oi'], cached['ls'])
+    df.attrs['symbol'] = symbol
+    return df
+
+def _closed_klines(klines_data: list):
+    """去掉尚未收盘的 K 线 (close_time 晚于当前时间)"""
+    now_ms = int(time.time() * 1000)
+    return [row for row in klines_data if int(row[6]) < now_ms]
+
+async def get_binance_data(symbol: str, session: aiohttp.ClientSession, fetch_klines: bool = True, closed_only: bool = False):
+    """
+    获取一个币种的所有相关数据：K-line, OI, L/S Ratio (Async, 增量更新滚动窗口)
+    fetch_klines=False 时直接使用缓存的 K 线 (例如已由 WebSocket 推送更新)，只通过 REST 获取 OI 与多空比。
+    closed_only=True 时返回的 DataFrame 以刚收盘的 K 线结尾 (用于 K 线收盘时的检查，缓存中仍保留未收盘的 K 线)。
+    某个序列获取失败时使用缓存中的旧序列 (见 FETCH_STALE_MAX_PERIODS)，这些序列的名称记录在 df.attrs['stale']，
+    依赖它们的指标不会被检查 (见 indicators.uses_stale_data)。
+    """
     try:
         # 1. Prepare URLs and params
         klines_url = f"{BASE_URL}/fapi/v1/klines"
-        klines_params = {'symbol': symbol, 'interval': TIMEFRAME, 'limit': DATA_FETCH_LIMIT}
-        
+        klines_params = {'symbol': symbol, 'interval': TIMEFRAME}
+
         oi_url = f"{BASE_URL}/futures/data/openInterestHist"
-        oi_params = {'symbol': symbol, 'period': TIMEFRAME, 'limit': DATA_FETCH_LIMIT}
-        
+        oi_params = {'symbol': symbol, 'period': TIMEFRAME}
+
         ls_url = f"{BASE_URL}/futures/data/globalLongShortAccountRatio"
-        ls_params = {'symbol': symbol, 'period': TIMEFRAME, 'limit': DATA_FETCH_LIMIT}
-        
-        # 2. Fetch all data concurrently
-        klines_task = fetch_json(session, klines_url, klines_params)
-        oi_task = fetch_json(session, oi_url, oi_params)
-        ls_task = fetch_json(session, ls_url, ls_params)
-        
+        ls_params = {'symbol': symbol, 'period': TIMEFRAME}
+
+        cached = _window_cache.get(symbol, {})
+
+        # 2. Fetch all data concurrently (only rows newer than the cached window)
+        if fetch_klines or not cached.get('klines'):
+            klines_task = _fetch_rows(session, klines_url, klines_params, cached.get('klines'), _kline_time)
+        else:
+            klines_task = _cached_rows(cached['klines'])
+        oi_task = _fetch_rows(session, oi_url, oi_params, cached.get('oi'), _hist_time)
+        ls_task = _fetch_rows(session, ls_url, ls_params, cached.get('ls'), _hist_time)
+
         klines_data, oi_data, ls_data = await asyncio.gather(klines_task, oi_task, ls_task)
-        
+
+        # 某个序列获取失败时，用足够新的缓存序列代替 (标记为 stale)，而不是跳过整个币种
+        stale = []
+        if not klines_data:
+            klines_data = _stale_rows(cached.get('klines'), _kline_time)
+            stale.append('klines')
+        if not oi_data:
+            oi_data = _stale_rows(cached.get('oi'), _hist_time)
+            stale.append('oi')
+        if not ls_data:
+            ls_data = _stale_rows(cached.get('ls'), _hist_time)
+            stale.append('ls')
+
         if not klines_data or not oi_data or not ls_data:
             logger.warning(f"Incomplete data for {symbol}, skipping.")
             return pd.DataFrame()
+        if stale:
+            CACHE_EVENTS.inc(cache='window', result='stale')
+            logger.warning(f"Using cached {', '.join(stale)} data for {symbol} after a failed fetch.")
+
+        _window_cache[symbol] = {'klines': klines_data, 'oi': oi_data, 'ls': ls_data}
+        if closed_only:
+            klines_data = _closed_klines(klines_data)
+            if not klines_data:
+                return pd.DataFrame()
 
-        # 3. Process K-lines
-        df = pd.DataFrame(klines_data, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume', 'close_time', 'quote_asset_volume', 'number_of_trades', 'taker_buy_base_asset_volume', 'taker_buy_quote_asset_volume', 'ignore'])
-        df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
-        df.set_index('timestamp', inplace=True)
-        numeric_cols = ['open', 'high', 'low', 'close', 'volume', 'taker_buy_base_asset_volume']
-        df[numeric_cols] = df[numeric_cols].apply(pd.to_numeric)
-
-        # 4. Calculate CVD
-        volume_delta = df['taker_buy_base_asset_volume'] - (df['volume'] - df['taker_buy_base_asset_volume'])
-        df['cvd'] = volume_delta.cumsum()
-        
-        # 5. Process OI
-        oi_df = pd.DataFrame(oi_data)
-        oi_df['timestamp'] = pd.to_datetime(oi_df['timestamp'], unit='ms')
-        oi_df.set_index('timestamp', inplace=True)
-        # Handle duplicate indices if any
-        oi_df = oi_df[~oi_df.index.duplicated(keep='last')]
-        df['oi'] = pd.to_numeric(oi_df['sumOpenInterestValue'])
-        
-        # 6. Process LS Ratio
-        ls_df = pd.DataFrame(ls_data)
-        ls_df['timestamp'] = pd.to_datetime(ls_df['timestamp'], unit='ms')
-        ls_df.set_index('timestamp', inplace=True)
-        ls_df = ls_df[~ls_df.index.duplicated(keep='last')]
-        df['ls_ratio'] = pd.to_numeric(ls_df['longShortRatio'])
-        
-        # 7. Fill missing data
-        df.bfill(inplace=True)
-        df.ffill(inplace=True)
-        
+        df = _build_dataframe(klines_data, oi_data, ls_data)
+        df.attrs['symbol'] = symbol
+        if stale:
+            df.attrs['stale'] = stale
         return df
     except Exception as e:
         logger.error(f"Error fetching data for {symbol}: {e}", exc_info=True)
@@ -1,5 +1,9 @@
+import math
 import pandas as pd
+from collections import deque
 from config import *
+from signals import Indicator, SignalRecord
+from metrics import SNAPSHOT_SECONDS
 
 def calculate_ema(series: pd.Series, length: int):
     """手动计算指数移动平均线 (EMA)"""
@@ -13,44 +17,259 @@ def calculate_rsi(series: pd.Series, length: int):
     rs = gain / loss
     return 100 - (100 / (1 + rs))
 
-def _create_market_snapshot(df: pd.DataFrame, primary_signal: dict):
+class RollingZScore:
     """
-    创建一个包含主要信号和市场背景快照的丰富数据包。
+    固定回看窗口的流式 Z-Score (滑动窗口 Welford 方差)，每根新 K 线 O(1) 更新。
+    结果与 calculate_z_score(series, lookback) 的最后一个值一致。
     """
-    # 1. 提取最近16条K线数据
-    recent_klines = df.tail(16).copy()
-    klines_data = recent_klines[['open', 'high', 'low', 'close', 'volume']].to_dict(orient='records')
-
-    # 2. 提取关键指标的最新值
-    latest_indicators = df.tail(1).copy()
-    context_indicators = {
-        "oi": f"${latest_indicators['oi'].iloc[0]:,.0f}",
-        "price": f"{latest_indicators['close'].iloc[0]:.2f}",
-        "volume": f"{latest_indicators['volume'].iloc[0]:,.0f}",
-        "cvd": f"{latest_indicators['cvd'].iloc[0]:,.0f}",
-        "long_short_ratio": f"{latest_indicators['ls_ratio'].iloc[0]:.3f}"
-    }
-    
-    # 3. 计算额外的技术指标 (RSI, EMA)
-    df['RSI_14'] = calculate_rsi(df['close'], 14)
-    df['EMA_12'] = calculate_ema(df['close'], 12)
-    df['EMA_26'] = calculate_ema(df['close'], 26)
-    
-    latest_tech_indicators = df.tail(1)
-    tech_indicators = {
-        "rsi_14": f"{latest_tech_indicators['RSI_14'].iloc[0]:.2f}",
-        "ema_12": f"{latest_tech_indicators['EMA_12'].iloc[0]:.2f}",
-        "ema_26": f"{latest_tech_indicators['EMA_26'].iloc[0]:.2f}",
-    }
+    def __init__(self, lookback: int):
+        self.lookback = lookback
+        self.window = deque()
+        self.mean = 0.0
+        self.m2 = 0.0
 
-    return {
-        "primary_signal": primary_signal,
-        "market_context": {
-            "recent_klines": klines_data,
-            "key_indicators": context_indicators,
-            "technical_indicators": tech_indicators
+    def _updated(self, value: float):
+        """返回加入 value 后的 (n, mean, m2)，不修改状态"""
+        n = len(self.window)
+        if self.mean != self.mean:
+            # 窗口中有 NaN 时递推值已失效，按窗口直接计算 (NaN 移出窗口后恢复递推)
+            values = list(self.window)[1:] if n == self.lookback else list(self.window)
+            values.append(value)
+            mean = math.fsum(values) / len(values)
+            return len(values), mean, math.fsum((v - mean) ** 2 for v in values)
+        if n < self.lookback:
+            n += 1
+            delta = value - self.mean
+            mean = self.mean + delta / n
+            m2 = self.m2 + delta * (value - mean)
+        else:
+            oldest = self.window[0]
+            mean = self.mean + (value - oldest) / n
+            m2 = self.m2 + (value - oldest) * (value - mean + oldest - self.mean)
+        return n, mean, max(m2, 0.0)
+
+    def _z_score(self, value: float, n: int, mean: float, m2: float):
+        if n < self.lookback or n < 2:
+            return float('nan')
+        std = math.sqrt(m2 / (n - 1))
+        if std == 0:
+            return float('nan') if value == mean else math.copysign(float('inf'), value - mean)
+        return (value - mean) / std
+
+    def update(self, value: float):
+        n, self.mean, self.m2 = self._updated(value)
+        if len(self.window) == self.lookback:
+            self.window.popleft()
+        self.window.append(value)
+        return self._z_score(value, n, self.mean, self.m2)
+
+    def peek(self, value: float):
+        """计算 value 作为下一个值时的 Z-Score (用于尚未收盘的 K 线)"""
+        return self._z_score(value, *self._updated(value))
+
+    def to_state(self):
+        return {"lookback": self.lookback, "window": list(self.window), "mean": self.mean, "m2": self.m2}
+
+    @classmethod
+    def from_state(cls, state: dict):
+        obj = cls(state["lookback"])
+        obj.window = deque(state["window"])
+        obj.mean = state["mean"]
+        obj.m2 = state["m2"]
+        return obj
+
+class StreamingEMA:
+    """递推计算的 EMA，与 calculate_ema (adjust=False) 一致"""
+    def __init__(self, length: int):
+        self.length = length
+        self.alpha = 2 / (length + 1)
+        self.value = None
+
+    def peek(self, value: float):
+        if self.value is None:
+            return value
+        return self.value + self.alpha * (value - self.value)
+
+    def update(self, value: float):
+        self.value = self.peek(value)
+        return self.value
+
+    def to_state(self):
+        return {"length": self.length, "value": self.value}
+
+    @classmethod
+    def from_state(cls, state: dict):
+        obj = cls(state["length"])
+        obj.value = state["value"]
+        return obj
+
+class StreamingRSI:
+    """
+    流式 RSI：保存最近 length 个涨跌幅及其滚动和，每根新 K 线 O(1) 更新。
+    与 calculate_rsi 一样使用简单平均 (第一根 K 线的涨跌幅记为 0)。
+    """
+    def __init__(self, length: int):
+        self.length = length
+        self.prev_close = None
+        self.gains = deque()
+        self.losses = deque()
+        self.gain_sum = 0.0
+        self.loss_sum = 0.0
+
+    def _updated(self, value: float):
+        delta = 0.0 if self.prev_close is None else value - self.prev_close
+        gain, loss = max(delta, 0.0), max(-delta, 0.0)
+        gain_sum, loss_sum = self.gain_sum + gain, self.loss_sum + loss
+        n = len(self.gains) + 1
+        if n > self.length:
+            gain_sum -= self.gains[0]
+            loss_sum -= self.losses[0]
+            n = self.length
+        return gain, loss, n, max(gain_sum, 0.0), max(loss_sum, 0.0)
+
+    def _rsi(self, n: int, gain_sum: float, loss_sum: float):
+        if n < self.length:
+            return float('nan')
+        if loss_sum == 0:
+            return float('nan') if gain_sum == 0 else 100.0
+        return 100 - (100 / (1 + gain_sum / loss_sum))
+
+    def update(self, value: float):
+        gain, loss, n, self.gain_sum, self.loss_sum = self._updated(value)
+        if len(self.gains) == self.length:
+            self.gains.popleft()
+            self.losses.popleft()
+        self.gains.append(gain)
+        self.losses.append(loss)
+        self.prev_close = value
+        return self._rsi(n, self.gain_sum, self.loss_sum)
+
+    def peek(self, value: float):
+        _, _, n, gain_sum, loss_sum = self._updated(value)
+        return self._rsi(n, gain_sum, loss_sum)
+
+    def to_state(self):
+        return {
+            "length": self.length, "prev_close": self.prev_close,
+            "gains": list(self.gains), "losses": list(self.losses),
+            "gain_sum": self.gain_sum, "loss_sum": self.loss_sum,
         }
-    }
+
+    @classmethod
+    def from_state(cls, state: dict):
+        obj = cls(state["length"])
+        obj.prev_close = state["prev_close"]
+        obj.gains = deque(state["gains"])
+        obj.losses = deque(state["losses"])
+        obj.gain_sum = state["gain_sum"]
+        obj.loss_sum = state["loss_sum"]
+        return obj
+
+# 每次同步时核对最近写入的几根 K 线：OI/多空比历史数据晚到时，已收盘 K 线的 ls_ratio 会从前值填充改为实际值
+REVISION_CHECK_ROWS = 3
+
+def _same_value(a: float, b: float):
+    return a == b or (a != a and b != b)
+
+class SymbolIndicatorState:
+    """
+    单个币种的流式指标状态。只有已收盘的 K 线会被写入累加器，
+    最新 (未收盘) 的 K 线通过 peek 计算，不修改状态。
+    """
+    def __init__(self):
+        self.last_timestamp = None
+        # 最近写入的 (timestamp, volume, ls_ratio)，用于发现已写入的 K 线被修正
+        self.recent = deque(maxlen=REVISION_CHECK_ROWS)
+        self.volume_z = RollingZScore(VOLUME_LOOKBACK_PERIOD)
+        self.ls_z = RollingZScore(LS_RATIO_LOOKBACK_PERIOD)
+        self.ema_12 = StreamingEMA(12)
+        self.ema_26 = StreamingEMA(26)
+        self.rsi_14 = StreamingRSI(14)
+
+    def update(self, timestamp, row):
+        """写入一根已收盘的 K 线"""
+        self.volume_z.update(float(row['volume']))
+        self.ls_z.update(float(row['ls_ratio']))
+        self.ema_12.update(float(row['close']))
+        self.ema_26.update(float(row['close']))
+        self.rsi_14.update(float(row['close']))
+        self.last_timestamp = timestamp
+        self.recent.append((timestamp, float(row['volume']), float(row['ls_ratio'])))
+
+    def _revised(self, closed: pd.DataFrame):
+        """最近写入的 K 线在 closed 中的值是否与写入时不同"""
+        positions = closed.index.get_indexer([timestamp for timestamp, _, _ in self.recent])
+        if (positions < 0).any():
+            return True
+        volume = closed['volume'].to_numpy()[positions]
+        ls_ratio = closed['ls_ratio'].to_numpy()[positions]
+        return not all(
+            _same_value(v, row_v) and _same_value(l, row_l)
+            for (_, row_v, row_l), v, l in zip(self.recent, volume, ls_ratio)
+        )
+
+    def sync(self, df: pd.DataFrame):
+        """将 df 中 (除最后一根外) 尚未写入的已收盘 K 线写入状态；无法衔接或已写入的 K 线被修正时从 df 重建"""
+        closed = df.iloc[:-1]
+        if self.last_timestamp is None or self.last_timestamp not in closed.index or self._revised(closed):
+            self.__init__()
+            new_rows = closed
+        else:
+            new_rows = closed[closed.index > self.last_timestamp]
+        for timestamp, row in zip(new_rows.index, new_rows[['volume', 'ls_ratio', 'close']].to_dict(orient='records')):
+            self.update(timestamp, row)
+
+    def peek(self, row):
+        """计算把 row 作为最新一根 K 线时的各项指标"""
+        return {
+            "volume_z_score": self.volume_z.peek(float(row['volume'])),
+            "ls_z_score": self.ls_z.peek(float(row['ls_ratio'])),
+            "ema_12": self.ema_12.peek(float(row['close'])),
+            "ema_26": self.ema_26.peek(float(row['close'])),
+            "rsi_14": self.rsi_14.peek(float(row['close'])),
+        }
+
+    def to_state(self):
+        return {
+            "last_timestamp": None if self.last_timestamp is None else pd.Timestamp(self.last_timestamp).isoformat(),
+            "volume_z": self.volume_z.to_state(),
+            "ls_z": self.ls_z.to_state(),
+            "ema_12": self.ema_12.to_state(),
+            "ema_26": self.ema_26.to_state(),
+            "rsi_14": self.rsi_14.to_state(),
+            "recent": [[pd.Timestamp(timestamp).isoformat(), volume, ls_ratio] for timestamp, volume, ls_ratio in self.recent],
+        }
+
+    @classmethod
+    def from_state(cls, state: dict):
+        obj = cls()
+        obj.last_timestamp = None if state["last_timestamp"] is None else pd.Timestamp(state["last_timestamp"])
+        obj.volume_z = RollingZScore.from_state(state["volume_z"])
+        obj.ls_z = RollingZScore.from_state(state["ls_z"])
+        obj.ema_12 = StreamingEMA.from_state(state["ema_12"])
+        obj.ema_26 = StreamingEMA.from_state(state["ema_26"])
+        obj.rsi_14 = StreamingRSI.from_state(state["rsi_14"])
+        obj.recent.extend((pd.Timestamp(timestamp), volume, ls_ratio) for timestamp, volume, ls_ratio in state.get("recent", []))
+        return obj
+
+# 每个 (币种, 周期) 的流式指标状态: (symbol, timeframe) -> SymbolIndicatorState
+_indicator_states = {}
+
+def get_indicator_state(symbol: str, timeframe: str = TIMEFRAME):
+    key = (symbol, timeframe)
+    if key not in _indicator_states:
+        _indicator_states[key] = SymbolIndicatorState()
+    return _indicator_states[key]
+
+def checkpoint_indicator_states():
+    """导出所有币种的流式指标状态 (可 JSON 序列化)，键为 <symbol>_<timeframe>"""
+    return {f"{symbol}_{timeframe}": state.to_state() for (symbol, timeframe), state in _indicator_states.items()}
+
+def restore_indicator_states(states: dict):
+    """从 checkpoint_indicator_states() 的结果恢复流式指标状态"""
+    for key, state in states.items():
+        symbol, timeframe = key.rsplit('_', 1)
+        _indicator_states[(symbol, timeframe)] = SymbolIndicatorState.from_state(state)
 
 def calculate_z_score(series: pd.Series, lookback: int):
     """计算 Z-Score"""
@@ -58,105 +277,260 @@ def calculate_z_score(series: pd.Series, lookback: int):
     std = series.rolling(window=lookback).std()
     return (series - mean) / std
 
+def _candle_timestamp(df: pd.DataFrame):
+    """最新一根 K 线的开盘时间 (毫秒)"""
+    return int(pd.Timestamp(df.index[-1]).value // 1_000_000)
+
+# 各指标依赖的原始序列；获取失败时用缓存代替的序列由 data_fetcher 记录在 df.attrs['stale']
+INDICATOR_SERIES = {
+    Indicator.VOLUME: ('klines',),
+    Indicator.OPEN_INTEREST: ('klines', 'oi'),
+    Indicator.LS_RATIO: ('klines', 'ls'),
+}
+
+def uses_stale_data(df: pd.DataFrame, indicator: Indicator):
+    """indicator 依赖的序列中是否有旧的缓存序列 (此时不检查该指标，以免用旧数据触发或重复告警)"""
+    stale = df.attrs.get('stale')
+    return bool(stale) and any(series in stale for series in INDICATOR_SERIES[indicator])
+
+# 派生特征的声明: name -> fn(features)，由 FeatureFrame 在首次访问时计算
+FEATURES = {}
+
+def feature(name: str):
+    """注册一个派生特征 (装饰器)"""
+    def register(fn):
+        FEATURES[name] = fn
+        return fn
+    return register
+
+class FeatureFrame:
+    """
+    单个币种 (单个周期) 本轮检查的特征层：派生序列在 FEATURES 中声明一次，首次访问时计算并缓存，
+    由所有 checker 和快照构建共享；原始 DataFrame 不会被修改。
+    features[name] 先查找派生特征，否则返回 DataFrame 中的原始列。
+    """
+    def __init__(self, df: pd.DataFrame):
+        self.df = df
+        self._cache = {}
+
+    @classmethod
+    def of(cls, data):
+        """checker 可以接收 DataFrame 或已有的 FeatureFrame"""
+        return data if isinstance(data, cls) else cls(data)
+
+    def __len__(self):
+        return len(self.df)
+
+    @property
+    def attrs(self):
+        return self.df.attrs
+
+    def __getitem__(self, name: str):
+        if name in self._cache:
+            return self._cache[name]
+        if name not in FEATURES:
+            return self.df[name]
+        value = self._cache[name] = FEATURES[name](self)
+        return value
+
+@feature('latest')
+def _latest_row(features: FeatureFrame):
+    return features.df.iloc[-1]
+
+@feature('streaming_indicators')
+def _streaming_indicators(features: FeatureFrame):
+    """
+    该币种流式累加器在最新一根 K 线上的各项指标 (只需写入新收盘的 K 线，每根 O(1))；
+    DataFrame 没有 symbol 时 (例如离线分析) 返回 None，由各特征按整个窗口计算。
+    """
+    df = features.df
+    symbol = df.attrs.get('symbol')
+    if not symbol:
+        return None
+    state = get_indicator_state(symbol, df.attrs.get('timeframe', TIMEFRAME))
+    state.sync(df)
+    return state.peek(features['latest'])
+
+@feature('volume_z_score')
+def _volume_z_score(features: FeatureFrame):
+    """最新一根 K 线的成交量 Z-Score"""
+    streaming = features['streaming_indicators']
+    if streaming is not None:
+        return streaming['volume_z_score']
+    return calculate_z_score(features.df['volume'], VOLUME_LOOKBACK_PERIOD).iloc[-1]
+
+@feature('ls_z_score')
+def _ls_z_score(features: FeatureFrame):
+    """最新一根 K 线的多空比 Z-Score"""
+    streaming = features['streaming_indicators']
+    if streaming is not None:
+        return streaming['ls_z_score']
+    return calculate_z_score(features.df['ls_ratio'], LS_RATIO_LOOKBACK_PERIOD).iloc[-1]
+
+@feature('oi_pct_change')
+def _oi_pct_change(features: FeatureFrame):
+    return features.df['oi'].pct_change()
+
+@feature('technical_indicators')
+def _technical_indicators(features: FeatureFrame):
+    """最新一根 K 线的 RSI / EMA"""
+    df = features.df
+    streaming = features['streaming_indicators']
+    if streaming is not None:
+        rsi_14, ema_12, ema_26 = streaming['rsi_14'], streaming['ema_12'], streaming['ema_26']
+    else:
+        rsi_14 = calculate_rsi(df['close'], 14).iloc[-1]
+        ema_12 = calculate_ema(df['close'], 12).iloc[-1]
+        ema_26 = calculate_ema(df['close'], 26).iloc[-1]
+    return {
+        "rsi_14": f"{rsi_14:.2f}",
+        "ema_12": f"{ema_12:.2f}",
+        "ema_26": f"{ema_26:.2f}",
+    }
+
+@feature('market_context')
+def _market_context(features: FeatureFrame):
+    """市场背景快照，同一币种触发的多个信号共用"""
+    latest = features['latest']
+    return {
+        # 最近16条K线数据
+        "recent_klines": features.df[['open', 'high', 'low', 'close', 'volume']].tail(16).to_dict(orient='records'),
+        # 关键指标的最新值
+        "key_indicators": {
+            "oi": f"${latest['oi']:,.0f}",
+            "price": f"{latest['close']:.2f}",
+            "volume": f"{latest['volume']:,.0f}",
+            "cvd": f"{latest['cvd']:,.0f}",
+            "long_short_ratio": f"{latest['ls_ratio']:.3f}"
+        },
+        "technical_indicators": features['technical_indicators'],
+    }
+
+@SNAPSHOT_SECONDS.time()
+def _create_market_snapshot(data, primary_signal: SignalRecord):
+    """
+    创建一个包含主要信号和市场背景快照的丰富数据包。
+    data 为 DataFrame 或 FeatureFrame (同一币种的多个信号传入同一个 FeatureFrame 时只构建一次背景快照)。
+    """
+    features = FeatureFrame.of(data)
+    primary_signal.timeframe = features.attrs.get('timeframe', TIMEFRAME)
+    return {
+        "primary_signal": primary_signal,
+        "market_context": features['market_context'],
+    }
+
 class VolumeSignal:
-    def check(self, df: pd.DataFrame):
-        if len(df) < VOLUME_LOOKBACK_PERIOD:
+    indicator = Indicator.VOLUME
+
+    def check(self, df):
+        features = FeatureFrame.of(df)
+        if uses_stale_data(features.df, self.indicator):
+            return None
+        if len(features) < VOLUME_LOOKBACK_PERIOD:
             return None
             
-        df['volume_z_score'] = calculate_z_score(df['volume'], VOLUME_LOOKBACK_PERIOD)
-        latest = df.iloc[-1]
+        latest = features['latest']
+        volume_z_score = features['volume_z_score']
         
         # Check if z_score is valid (not NaN)
-        if pd.isna(latest['volume_z_score']):
+        if pd.isna(volume_z_score):
             return None
             
-        if abs(latest['volume_z_score']) > VOLUME_Z_SCORE_THRESHOLD:
-            signal = {
-                "indicator": "Volume",
-                "signal_type": "Spike Alert",
-                "value": f"{latest['volume']:,.0f}",
-                "z_score": f"{latest['volume_z_score']:.2f}",
-                "price_change": f"{(latest['close']/df.iloc[-2]['close'] - 1):.2%}"
-            }
-            return _create_market_snapshot(df, signal)
+        if abs(volume_z_score) > VOLUME_Z_SCORE_THRESHOLD:
+            signal = SignalRecord(
+                Indicator.VOLUME, "Spike Alert",
+                timestamp=_candle_timestamp(features.df),
+                value=float(latest['volume']),
+                z_score=float(volume_z_score),
+                price_change=float(latest['close']/features['close'].iloc[-2] - 1),
+            )
+            return _create_market_snapshot(features, signal)
         return None
 
 class OpenInterestSignal:
-    def check(self, df: pd.DataFrame):
-        if len(df) < VOLUME_LOOKBACK_PERIOD:
+    indicator = Indicator.OPEN_INTEREST
+
+    def check(self, df):
+        features = FeatureFrame.of(df)
+        if uses_stale_data(features.df, self.indicator):
+            return None
+        if len(features) < VOLUME_LOOKBACK_PERIOD:
             return None
             
-        latest = df.iloc[-1]
+        latest = features['latest']
         
         # 1. 24小时变化检测
         try:
-            oi_24h_ago = df['oi'].iloc[-VOLUME_LOOKBACK_PERIOD]
+            oi_24h_ago = features['oi'].iloc[-VOLUME_LOOKBACK_PERIOD]
         except IndexError:
             return None
             
         oi_24h_change = (latest['oi'] / oi_24h_ago) - 1
         if abs(oi_24h_change) > OI_24H_CHANGE_THRESHOLD:
-            signal = {
-                "indicator": "Open Interest",
-                "signal_type": "24H Change Alert",
-                "value": f"${latest['oi']:,.0f}",
-                "change_24h": f"{oi_24h_change:+.2%}",
-                "price": f"{latest['close']:.2f}"
-            }
-            return _create_market_snapshot(df, signal)
+            signal = SignalRecord(
+                Indicator.OPEN_INTEREST, "24H Change Alert",
+                timestamp=_candle_timestamp(features.df),
+                value=float(latest['oi']),
+                change_24h=float(oi_24h_change),
+                price=float(latest['close']),
+            )
+            return _create_market_snapshot(features, signal)
 
         # 2. 连续上涨/下跌检测
-        oi_pct_change = df['oi'].pct_change()
+        oi_pct_change = features['oi_pct_change']
         if (oi_pct_change.iloc[-OI_CONTINUOUS_RISE_PERIODS:] > 0).all():
-            signal = {
-                "indicator": "Open Interest",
-                "signal_type": f"Continuous Rise ({OI_CONTINUOUS_RISE_PERIODS} periods)",
-                "value": f"${latest['oi']:,.0f}",
-                "price": f"{latest['close']:.2f}"
-            }
-            return _create_market_snapshot(df, signal)
+            signal = SignalRecord(
+                Indicator.OPEN_INTEREST, f"Continuous Rise ({OI_CONTINUOUS_RISE_PERIODS} periods)",
+                timestamp=_candle_timestamp(features.df),
+                value=float(latest['oi']),
+                price=float(latest['close']),
+            )
+            return _create_market_snapshot(features, signal)
         
         if (oi_pct_change.iloc[-OI_CONTINUOUS_RISE_PERIODS:] < 0).all():
-            signal = {
-                "indicator": "Open Interest",
-                "signal_type": f"Continuous Fall ({OI_CONTINUOUS_RISE_PERIODS} periods)",
-                "value": f"${latest['oi']:,.0f}",
-                "price": f"{latest['close']:.2f}"
-            }
-            return _create_market_snapshot(df, signal)
+            signal = SignalRecord(
+                Indicator.OPEN_INTEREST, f"Continuous Fall ({OI_CONTINUOUS_RISE_PERIODS} periods)",
+                timestamp=_candle_timestamp(features.df),
+                value=float(latest['oi']),
+                price=float(latest['close']),
+            )
+            return _create_market_snapshot(features, signal)
 
         # 3. 突然剧烈变化
         if abs(oi_pct_change.iloc[-1]) > OI_SUDDEN_CHANGE_THRESHOLD:
-            signal = {
-                "indicator": "Open Interest",
-                "signal_type": "Sudden Change Alert",
-                "value": f"${latest['oi']:,.0f}",
-                "change_1_period": f"{oi_pct_change.iloc[-1]:+.2%}",
-                "price": f"{latest['close']:.2f}"
-            }
-            return _create_market_snapshot(df, signal)
+            signal = SignalRecord(
+                Indicator.OPEN_INTEREST, "Sudden Change Alert",
+                timestamp=_candle_timestamp(features.df),
+                value=float(latest['oi']),
+                change_1_period=float(oi_pct_change.iloc[-1]),
+                price=float(latest['close']),
+            )
+            return _create_market_snapshot(features, signal)
             
         return None
 
 class LSRatioSignal:
-    def check(self, df: pd.DataFrame):
-        if len(df) < LS_RATIO_LOOKBACK_PERIOD:
+    indicator = Indicator.LS_RATIO
+
+    def check(self, df):
+        features = FeatureFrame.of(df)
+        if uses_stale_data(features.df, self.indicator):
+            return None
+        if len(features) < LS_RATIO_LOOKBACK_PERIOD:
             return None
             
-        df['ls_z_score'] = calculate_z_score(df['ls_ratio'], LS_RATIO_LOOKBACK_PERIOD)
-        latest = df.iloc[-1]
+        latest = features['latest']
+        ls_z_score = features['ls_z_score']
         
-        if pd.isna(latest['ls_z_score']):
+        if pd.isna(ls_z_score):
             return None
         
-        if abs(latest['ls_z_score']) > LS_RATIO_Z_SCORE_THRESHOLD:
-            sentiment = "Extremely Bullish (Contrarian Bearish)" if latest['ls_z_score'] > 0 else "Extremely Bearish (Contrarian Bullish)"
-            signal = {
-                "indicator": "Long/Short Ratio",
-                "signal_type": "Sentiment Extreme Alert",
-                "value": f"{latest['ls_ratio']:.3f}",
-                "z_score": f"{latest['ls_z_score']:.2f}",
-                "sentiment": sentiment
-            }
-            return _create_market_snapshot(df, signal)
+        if abs(ls_z_score) > LS_RATIO_Z_SCORE_THRESHOLD:
+            signal = SignalRecord(
+                Indicator.LS_RATIO, "Sentiment Extreme Alert",
+                timestamp=_candle_timestamp(features.df),
+                value=float(latest['ls_ratio']),
+                z_score=float(ls_z_score),
+            )
+            return _create_market_snapshot(features, signal)
         return None
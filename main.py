@@ -1,26 +1,78 @@
 import time
-import schedule
 import asyncio
 import aiohttp
 import gc
 import logging
 import os
 from datetime import datetime
-from config import SYMBOLS, TIMEFRAME, DYNAMIC_SYMBOLS, PROXY_URL, CONCURRENCY_LIMIT
-from data_fetcher import get_binance_data, get_top_liquid_symbols
-from indicators import VolumeSignal, OpenInterestSignal, LSRatioSignal
+from config import (
+    SYMBOLS, TIMEFRAME, DYNAMIC_SYMBOLS, PROXY_URL, CONCURRENCY_LIMIT, VECTORIZED_ENGINE, STREAMING_MODE, AI_BATCH_MODE,
+    CHECK_INTERVAL, CHECK_SETTLE_SECONDS, MAX_CONCURRENCY_LIMIT, HTTP_DNS_CACHE_TTL, HTTP_KEEPALIVE_TIMEOUT,
+    PROCESS_POOL_WORKERS, SHARD_DB_PATH, ALERT_TWO_PHASE, ALERT_FOLLOWUP_PER_SECTION, INDICATOR_CHECKPOINT_INTERVAL,
+)
+from data_fetcher import get_binance_data
+from universe import universe
+from indicators import VolumeSignal, OpenInterestSignal, LSRatioSignal, FeatureFrame, checkpoint_indicator_states, restore_indicator_states
+from rule_engine import evaluate_frames
+from stream_monitor import StreamMonitor
+from timeframes import interval_seconds, next_candle_close, is_candle_close
+from resampler import derive_frames, derive_timeframe_frames
+from process_pool import evaluate_in_pool, shutdown_pool, checkpoint_pool_states, restore_pool_states
+from metrics import CYCLE_SECONDS, CHECK_SECONDS, SIGNALS, SYMBOLS_MONITORED, start_metrics_server
 
 # Try to import ProxyConnector for SOCKS5 support
 try:
     from aiohttp_socks import ProxyConnector
 except ImportError:
     ProxyConnector = None
-from ai_interpreter import get_ai_interpretation
-from alerter import send_alert
+from ai_interpreter import (
+    get_ai_interpretation_async, get_batch_ai_interpretations_async, stream_ai_interpretation_async,
+    close_client as close_ai_client,
+)
+from alerter import send_alert, send_ai_followup, alert_batch, start_outbox_worker, close_session as close_alert_session
 from state_manager import SignalStateManager
+from sharding import ShardCoordinator
+
+# 状态管理器与分片协调器在首次使用时创建：process_pool 的 spawn 子进程会以 __mp_main__ 重新导入本模块，
+# 不应在子进程中打开数据库
+_state_manager = None
+_shard = None
+
+def get_state_manager():
+    global _state_manager
+    if _state_manager is None:
+        _state_manager = SignalStateManager(SHARD_DB_PATH, shared=True) if SHARD_DB_PATH else SignalStateManager()
+    return _state_manager
+
+def get_shard():
+    """分片模式: 多个 worker 通过 SHARD_DB_PATH 分担币种列表并共享去重状态，未配置时返回 None"""
+    global _shard
+    if _shard is None and SHARD_DB_PATH:
+        _shard = ShardCoordinator()
+    return _shard
 
-# 初始化状态管理器
-state_manager = SignalStateManager()
+# 上次写入流式指标状态的时间 (time.monotonic)
+_last_indicator_checkpoint = 0
+
+async def restore_indicator_checkpoint():
+    """启动时从状态库恢复各币种的流式指标状态 (进程池模式下分发到各子进程)"""
+    states = await asyncio.to_thread(get_state_manager().load_indicator_states)
+    if PROCESS_POOL_WORKERS:
+        await restore_pool_states(states)
+    else:
+        restore_indicator_states(states)
+
+async def save_indicator_checkpoint(force: bool = False):
+    """把流式指标状态写入状态库，两次写入间隔至少 INDICATOR_CHECKPOINT_INTERVAL 秒 (force=True 时立即写入)"""
+    global _last_indicator_checkpoint
+    if not force and time.monotonic() - _last_indicator_checkpoint < INDICATOR_CHECKPOINT_INTERVAL:
+        return
+    _last_indicator_checkpoint = time.monotonic()
+    try:
+        states = await checkpoint_pool_states() if PROCESS_POOL_WORKERS else checkpoint_indicator_states()
+        await asyncio.to_thread(get_state_manager().save_indicator_states, states)
+    except Exception as e:
+        logger.error(f"Failed to save indicator states: {e}", exc_info=True)
 
 # Set up logging
 logging.basicConfig(
@@ -29,116 +81,311 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-async def process_symbol(symbol: str, session: aiohttp.ClientSession, indicator_checkers: list):
+async def handle_signal(symbol: str, signal: dict, prev_signal: dict, ai_insight: str = None):
+    """
+    处理一个需要发送的信号：AI 解读 (若尚未批量获取)、发送通知
+    """
+    try:
+        if ai_insight is None:
+            # 获取 AI 解读 (异步、限流、带缓存)
+            ai_insight = await get_ai_interpretation_async(symbol, signal['primary_signal'].timeframe, signal, prev_signal)
+        
+        # 发送通知 (并发发送到所有渠道)
+        await send_alert(symbol, signal, ai_insight)
+    except Exception as e:
+        logger.error(f"Error processing signal for {symbol}: {e}", exc_info=True)
+
+async def handle_followup(symbol: str, signal: dict, prev_signal: dict, ai_insight: str = None):
+    """
+    两阶段告警的第二阶段：流式获取 AI 解读 (若尚未批量获取)，完成后 (或每完成一段) 发送补充消息
+    """
+    try:
+        if ai_insight is not None:
+            await send_ai_followup(symbol, signal, ai_insight)
+            return
+        sections = []
+        async for section in stream_ai_interpretation_async(symbol, signal['primary_signal'].timeframe, signal, prev_signal):
+            if ALERT_FOLLOWUP_PER_SECTION:
+                await send_ai_followup(symbol, signal, section)
+            sections.append(section)
+        if sections and not ALERT_FOLLOWUP_PER_SECTION:
+            await send_ai_followup(symbol, signal, "".join(sections))
+    except Exception as e:
+        logger.error(f"Error sending AI follow-up for {symbol}: {e}", exc_info=True)
+
+async def dispatch_signals(signals: list, semaphore: asyncio.Semaphore):
     """
-    处理单个 symbol 的逻辑
+    对本轮触发的所有信号去重，再获取 AI 解读并发送通知。
+    开启 AI_BATCH_MODE 时，所有需要发送的信号合并为一次 AI 请求。
+    本轮的告警属于同一发件箱批次，数量超过 ALERT_DIGEST_THRESHOLD 时每个渠道合并为一条汇总消息。
+    开启 ALERT_TWO_PHASE 时，先立即发送不含 AI 解读的告警，AI 解读完成后再逐个发送补充消息。
     """
+    # 检查是否应该发送警报 (状态存储的读写在线程中执行，不阻塞事件循环)
+    decisions = await asyncio.to_thread(get_state_manager().should_send_alerts, signals)
+    pending = []
+    for (symbol, signal), (should_send, prev_signal) in zip(signals, decisions):
+        logger.info(f"Potential signal for {symbol}: {signal['primary_signal']}")
+        labels = dict(indicator=signal['primary_signal'].indicator.value, timeframe=signal['primary_signal'].timeframe)
+        SIGNALS.inc(outcome='fired', **labels)
+        SIGNALS.inc(outcome='sent' if should_send else 'suppressed', **labels)
+        if should_send:
+            pending.append((symbol, signal, prev_signal))
+
+    if ALERT_TWO_PHASE:
+        # 第一阶段: 告警只等待数据，不等待 AI
+        async with alert_batch():
+            for symbol, signal, _ in pending:
+                await send_alert(symbol, signal)
+
+    ai_insights = [None] * len(pending)
+    if AI_BATCH_MODE and len(pending) > 1:
+        # 每个周期的信号合并为一次批量请求
+        by_timeframe = {}
+        for n, (_, signal, _) in enumerate(pending):
+            by_timeframe.setdefault(signal['primary_signal'].timeframe, []).append(n)
+
+        async def batch_task(timeframe, indexes):
+            try:
+                insights = await get_batch_ai_interpretations_async(timeframe, [pending[n] for n in indexes])
+                for n, ai_insight in zip(indexes, insights):
+                    ai_insights[n] = ai_insight
+            except Exception as e:
+                logger.error(f"Error in batch AI interpretation: {e}", exc_info=True)
+
+        await asyncio.gather(*[batch_task(tf, indexes) for tf, indexes in by_timeframe.items() if len(indexes) > 1])
+
+    async def signal_task(item, ai_insight):
+        async with semaphore:
+            await handle_signal(*item, ai_insight=ai_insight)
+
+    async def followup_task(item, ai_insight):
+        async with semaphore:
+            await handle_followup(*item, ai_insight=ai_insight)
+
+    if ALERT_TWO_PHASE:
+        # 第二阶段: 补充消息各自在 AI 解读完成后立即发送，不参与汇总
+        await asyncio.gather(*[followup_task(item, ai_insight) for item, ai_insight in zip(pending, ai_insights)])
+        return
+
+    async with alert_batch():
+        await asyncio.gather(*[signal_task(item, ai_insight) for item, ai_insight in zip(pending, ai_insights)])
+
+async def process_symbol(symbol: str, session: aiohttp.ClientSession, indicator_checkers: list, closed_only: bool = False):
+    """
+    处理单个 symbol 的逻辑，返回触发的 [(symbol, signal), ...]
+    """
+    signals = []
     try:
         logger.info(f"Checking {symbol}...")
-        df = await get_binance_data(symbol, session)
+        df = await get_binance_data(symbol, session, closed_only=closed_only)
         
         if df.empty:
             logger.warning(f"Failed to fetch data for {symbol}, skipping.")
-            return
+            return signals
             
-        for checker in indicator_checkers:
-            # check is CPU bound, fast enough to run in main thread usually, 
-            # but if very heavy, could use run_in_executor
-            try:
-                signal = checker.check(df)
-                if signal:
-                    logger.info(f"Potential signal for {symbol}: {signal['primary_signal']}")
-                    # 检查是否应该发送警报
-                    should_send, prev_signal = state_manager.should_send_alert(symbol, signal)
-                    if should_send:
-                        # 获取 AI 解读 (Blocking I/O, run in executor)
-                        loop = asyncio.get_running_loop()
-                        ai_insight = await loop.run_in_executor(
-                            None, 
-                            get_ai_interpretation, 
-                            symbol, TIMEFRAME, signal, prev_signal
-                        )
-                        
-                        # 发送通知 (Blocking I/O, run in executor)
-                        await loop.run_in_executor(
-                            None,
-                            send_alert,
-                            symbol, signal, ai_insight
-                        )
-            except Exception as e:
-                logger.error(f"Error processing signal for {symbol}: {e}", exc_info=True)
+        # 更粗的周期由 TIMEFRAME 的数据在本地聚合得到
+        for timeframe, timeframe_df in derive_frames(df).items():
+            if timeframe_df.empty:
+                continue
+            # 各 checker 共用同一个特征层，派生序列与背景快照只计算一次
+            features = FeatureFrame(timeframe_df)
+            for checker in indicator_checkers:
+                # check is CPU bound, fast enough to run in main thread usually, 
+                # but if very heavy, could use run_in_executor
+                try:
+                    with CHECK_SECONDS.time(checker=type(checker).__name__):
+                        signal = checker.check(features)
+                    if signal:
+                        signals.append((symbol, signal))
+                except Exception as e:
+                    logger.error(f"Error processing {timeframe} signal for {symbol}: {e}", exc_info=True)
                 
     except Exception as e:
         logger.error(f"Error in process_symbol for {symbol}: {e}", exc_info=True)
+    return signals
+
+async def evaluate_and_alert(frames: dict, semaphore: asyncio.Semaphore):
+    """
+    用向量化引擎 (或 RULES_PATH 配置的规则) 一次性计算 frames 中所有币种的信号，并处理触发的信号。
+    frames 为 TIMEFRAME 的数据，每个分析周期 (TIMEFRAMES) 分别聚合后计算。
+    PROCESS_POOL_WORKERS > 0 时在进程池中计算 (VECTORIZED_ENGINE=False 时子进程逐个调用各 checker)。
+    """
+    if PROCESS_POOL_WORKERS:
+        with CHECK_SECONDS.time(checker='process_pool'):
+            signals = await evaluate_in_pool(frames, vectorized=VECTORIZED_ENGINE)
+    else:
+        signals = []
+        with CHECK_SECONDS.time(checker='vectorized'):
+            for timeframe_frames in derive_timeframe_frames(frames).values():
+                signals.extend(evaluate_frames(timeframe_frames))
+    await dispatch_signals(signals, semaphore)
+    await save_indicator_checkpoint()
+
+async def run_vectorized_check(symbols: list, session: aiohttp.ClientSession, semaphore: asyncio.Semaphore, closed_only: bool = False):
+    """
+    先并发获取所有币种的数据，再一次性计算所有信号 (见 evaluate_and_alert)
+    """
+    # 请求并发由 request_scheduler 根据 Binance 权重自动控制
+    async def fetch_task(sym):
+        logger.info(f"Checking {sym}...")
+        return sym, await get_binance_data(sym, session, closed_only=closed_only)
 
-async def run_check_async():
-    connector = None
+    frames = {}
+    for sym, df in await asyncio.gather(*[fetch_task(s) for s in symbols]):
+        if df.empty:
+            logger.warning(f"Failed to fetch data for {sym}, skipping.")
+        else:
+            frames[sym] = df
+
+    await evaluate_and_alert(frames, semaphore)
+
+def create_connector():
+    """连接池: 保持长连接并缓存 DNS，配置了代理时通过代理连接"""
+    connector_kwargs = dict(
+        limit=MAX_CONCURRENCY_LIMIT * 2,
+        ttl_dns_cache=HTTP_DNS_CACHE_TTL,
+        keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT,
+    )
     if PROXY_URL:
         if ProxyConnector:
             try:
-                connector = ProxyConnector.from_url(PROXY_URL)
+                connector = ProxyConnector.from_url(PROXY_URL, **connector_kwargs)
                 logger.info(f"Using proxy: {PROXY_URL}")
+                return connector
             except Exception as e:
                 logger.error(f"Failed to create proxy connector: {e}")
         elif PROXY_URL.startswith('socks'):
             logger.warning("SOCKS5 proxy configured but aiohttp-socks not installed. Proxy may not work.")
+    return aiohttp.TCPConnector(**connector_kwargs)
 
+async def resolve_symbols(session: aiohttp.ClientSession):
+    # 根据配置决定使用哪个币种列表
+    if DYNAMIC_SYMBOLS:
+        symbols_to_check = await universe.get_symbols(session)
+        # 如果动态获取失败，则使用静态列表作为备用
+        if not symbols_to_check:
+            logger.warning("动态获取币种列表失败，将使用 config.py 中的静态列表作为备用。")
+            symbols_to_check = SYMBOLS
+    else:
+        symbols_to_check = SYMBOLS
+    return symbols_to_check
+
+async def run_check_async(session: aiohttp.ClientSession, closed_only: bool = False):
+    """
+    执行一轮检查。closed_only=True 时 (K 线收盘时刻的检查) 只计算已收盘的 K 线。
+    """
+    started = time.perf_counter()
     try:
-        async with aiohttp.ClientSession(connector=connector) as session:
-            # 根据配置决定使用哪个币种列表
-            if DYNAMIC_SYMBOLS:
-                symbols_to_check = await get_top_liquid_symbols(session)
-                # 如果动态获取失败，则使用静态列表作为备用
-                if not symbols_to_check:
-                    logger.warning("动态获取币种列表失败，将使用 config.py 中的静态列表作为备用。")
-                    symbols_to_check = SYMBOLS
-            else:
-                symbols_to_check = SYMBOLS
-
-            logger.info(f"开始执行检查，目标币种: {', '.join(symbols_to_check)}...")
-            
+        symbols_to_check = await resolve_symbols(session)
+        shard = get_shard()
+        if shard:
+            all_symbols, symbols_to_check = symbols_to_check, await asyncio.to_thread(shard.owned_symbols, symbols_to_check)
+            logger.info(f"Shard {shard.worker_id}: {len(symbols_to_check)}/{len(all_symbols)} symbols assigned to this worker")
+        SYMBOLS_MONITORED.set(len(symbols_to_check))
+
+        logger.info(f"开始执行检查，目标币种: {', '.join(symbols_to_check)}...")
+
+        # Use semaphore to limit concurrency of AI calls / alerts
+        semaphore = asyncio.Semaphore(CONCURRENCY_LIMIT)
+
+        if VECTORIZED_ENGINE or PROCESS_POOL_WORKERS:
+            await run_vectorized_check(symbols_to_check, session, semaphore, closed_only=closed_only)
+        else:
             # 初始化所有指标检查器
             indicator_checkers = [VolumeSignal(), OpenInterestSignal(), LSRatioSignal()]
-            
-            # Use semaphore to limit concurrency
-            semaphore = asyncio.Semaphore(CONCURRENCY_LIMIT)
-            
-            async def sem_task(sym):
-                async with semaphore:
-                    await process_symbol(sym, session, indicator_checkers)
 
-            tasks = [sem_task(symbol) for symbol in symbols_to_check]
-            await asyncio.gather(*tasks)
-            
-            logger.info("检查完成。")
-            
+            # 请求并发由 request_scheduler 根据 Binance 权重自动控制
+            tasks = [process_symbol(symbol, session, indicator_checkers, closed_only=closed_only) for symbol in symbols_to_check]
+            results = await asyncio.gather(*tasks)
+            await dispatch_signals([item for signals in results for item in signals], semaphore)
+
+        logger.info("检查完成。")
+
     except Exception as e:
         logger.error(f"Error in run_check_async: {e}", exc_info=True)
     finally:
+        CYCLE_SECONDS.observe(time.perf_counter() - started, mode='poll')
+        await save_indicator_checkpoint()
         # Force garbage collection to free memory
         gc.collect()
 
-def run_check():
-    """Wrapper to run async check from sync schedule"""
+async def run_scheduled_async():
+    """
+    轮询模式：整个运行期间使用同一个事件循环与 HTTP 会话 (连接池、告警会话、AI 客户端均跨周期复用)，
+    每根 CHECK_INTERVAL K 线收盘后 CHECK_SETTLE_SECONDS 秒执行一次检查。
+    上一轮检查超时未完成时，不会与下一轮重叠，而是跳过错过的收盘时刻。
+    """
+    period = interval_seconds(CHECK_INTERVAL)
+    metrics_runner = await start_metrics_server()
+    shard = get_shard()
+    heartbeat_task = asyncio.create_task(shard.run_heartbeat()) if shard else None
+    # 发送上次运行遗留在发件箱中的告警
+    start_outbox_worker()
     try:
-        asyncio.run(run_check_async())
-    except Exception as e:
-        logger.error(f"Critical error in run_check: {e}", exc_info=True)
+        await restore_indicator_checkpoint()
+        async with aiohttp.ClientSession(connector=create_connector()) as session:
+            # 首次启动立即执行一次
+            await run_check_async(session)
+            logger.info(f"定时任务已设置，程序将在每根 {CHECK_INTERVAL} K 线收盘后 {CHECK_SETTLE_SECONDS} 秒运行一次检查。")
+
+            while True:
+                # 下一个检查时刻尚未到达的收盘时间
+                candle_close = next_candle_close(time.time() - CHECK_SETTLE_SECONDS, CHECK_INTERVAL)
+                await asyncio.sleep(max(0, candle_close + CHECK_SETTLE_SECONDS - time.time()))
+
+                started = time.time()
+                await run_check_async(session, closed_only=is_candle_close(candle_close, TIMEFRAME))
+                elapsed = time.time() - started
+
+                missed = int((time.time() - CHECK_SETTLE_SECONDS - candle_close) // period)
+                if missed > 0:
+                    logger.warning(f"检查耗时 {elapsed:.1f}s，超过检查周期 {CHECK_INTERVAL}，跳过了 {missed} 次检查。")
+    finally:
+        if heartbeat_task:
+            heartbeat_task.cancel()
+            await asyncio.to_thread(shard.leave)
+        await save_indicator_checkpoint(force=True)
+        await close_alert_session()
+        await close_ai_client()
+        shutdown_pool()
+        if metrics_runner:
+            await metrics_runner.cleanup()
+
+async def run_streaming_async():
+    """
+    WebSocket 流模式：先用 REST 检查一次并填充滚动窗口，之后由 K 线收盘事件驱动检查
+    """
+    metrics_runner = await start_metrics_server()
+    start_outbox_worker()
+    try:
+        await restore_indicator_checkpoint()
+        async with aiohttp.ClientSession(connector=create_connector()) as session:
+            symbols_to_check = await resolve_symbols(session)
+            semaphore = asyncio.Semaphore(CONCURRENCY_LIMIT)
+            if SHARD_DB_PATH:
+                # 流模式的订阅在启动时确定，不参与重新分配；告警去重仍通过共享状态保证只发送一次
+                logger.warning("SHARD_DB_PATH is set but sharding only applies to polling mode; streaming all symbols.")
+
+            logger.info(f"流模式启动，目标币种: {', '.join(symbols_to_check)}...")
+            await run_vectorized_check(symbols_to_check, session, semaphore)
+
+            monitor = StreamMonitor(
+                symbols_to_check, session,
+                on_frames=lambda frames: evaluate_and_alert(frames, semaphore),
+            )
+            await monitor.run()
+    finally:
+        await save_indicator_checkpoint(force=True)
+        await close_alert_session()
+        await close_ai_client()
+        shutdown_pool()
+        if metrics_runner:
+            await metrics_runner.cleanup()
 
 if __name__ == "__main__":
     logger.info("启动加密货币指标监控器...")
     logger.info(f"Configuration: CONCURRENCY_LIMIT={CONCURRENCY_LIMIT}, VERIFY_SSL={os.getenv('VERIFY_SSL', 'true')} (Active: {'Enabled' if os.getenv('VERIFY_SSL', 'true').lower() == 'true' else 'Disabled'})")
-    # 首次启动立即执行一次
-    run_check()
-    
-    # 设置定时任务, 例如每15分钟运行一次
-    schedule.every(15).minutes.do(run_check)
-    logger.info("定时任务已设置，程序将每 15 分钟运行一次检查。")
-    
-    while True:
-        try:
-            schedule.run_pending()
-            time.sleep(1)
-        except Exception as e:
-            logger.error(f"Error in schedule loop: {e}", exc_info=True)
-            time.sleep(5) # Wait before retrying
+    try:
+        asyncio.run(run_streaming_async() if STREAMING_MODE else run_scheduled_async())
+    except KeyboardInterrupt:
+        logger.info("监控器已停止。")
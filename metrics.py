@@ -0,0 +1,160 @@
+import bisect
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from aiohttp import web
+from config import METRICS_HOST, METRICS_PORT
+
+logger = logging.getLogger(__name__)
+
+# 默认的耗时直方图分桶 (秒)
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(labelnames: tuple, values: tuple, extra: str = ''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def _format_value(value: float):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+class _Metric:
+    """Prometheus 指标基类：按标签值组合分别记录"""
+    kind = None
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def _key(self, labels: dict):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(labels[name] for name in self.labelnames)
+
+    def _samples(self):
+        raise NotImplementedError
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            lines.extend(self._samples())
+        return lines
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self):
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(v)}" for key, v in self._values.items()]
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def _samples(self):
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(v)}" for key, v in self._values.items()]
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        """记录 with 代码块 (或被装饰的同步函数) 的耗时"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def _samples(self):
+        lines = []
+        for key, (counts, total) in self._values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                le = 'le="' + _format_value(bound) + '"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+REGISTRY = []
+
+# --- 各阶段耗时 ---
+CYCLE_SECONDS = Histogram('oibot_cycle_seconds', 'Duration of a full check cycle.', ('mode',))
+FETCH_SECONDS = Histogram('oibot_binance_request_seconds', 'Duration of Binance REST requests (including scheduler waits).', ('endpoint',))
+PARSE_SECONDS = Histogram('oibot_parse_seconds', 'Duration of building the DataFrame from raw Binance rows.')
+CHECK_SECONDS = Histogram('oibot_check_seconds', 'Duration of signal evaluation per checker (vectorized = whole-universe engine).', ('checker',))
+SNAPSHOT_SECONDS = Histogram('oibot_snapshot_seconds', 'Duration of building the market snapshot of a fired signal.')
+AI_SECONDS = Histogram('oibot_ai_request_seconds', 'Duration of AI interpretation requests.', ('mode', 'outcome'))
+ALERT_SECONDS = Histogram('oibot_alert_seconds', 'Duration of alert delivery per channel (including retries).', ('channel', 'outcome'))
+
+# --- 计数器 ---
+HTTP_RESPONSES = Counter('oibot_http_responses_total', 'HTTP responses by service and status code (error = no response, timeout = timed out).', ('service', 'status'))
+FETCH_RETRIES = Counter('oibot_binance_retries_total', 'Binance request retries and hedged duplicates by endpoint.', ('endpoint', 'kind'))
+CACHE_EVENTS = Counter('oibot_cache_events_total', 'Cache lookups by cache and result.', ('cache', 'result'))
+SIGNALS = Counter('oibot_signals_total', 'Signals by indicator, timeframe and outcome (fired, sent, suppressed).', ('indicator', 'timeframe', 'outcome'))
+
+# --- 当前状态 ---
+BINANCE_USED_WEIGHT = Gauge('oibot_binance_used_weight', 'Last X-MBX-USED-WEIGHT-1M reported by Binance.')
+BINANCE_CONCURRENCY = Gauge('oibot_binance_concurrency', 'Current Binance request concurrency chosen by the scheduler.')
+SYMBOLS_MONITORED = Gauge('oibot_symbols_monitored', 'Number of symbols checked in the last cycle.')
+ALERT_OUTBOX_PENDING = Gauge('oibot_alert_outbox_pending', 'Alerts waiting in the outbox for delivery.')
+SHARD_MEMBERS = Gauge('oibot_shard_members', 'Number of live shard workers seen by this worker.')
+
+def render_metrics():
+    """Prometheus 文本格式 (text/plain; version=0.0.4)"""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+async def _handle_metrics(request):
+    return web.Response(text=render_metrics(), content_type='text/plain', charset='utf-8')
+
+async def start_metrics_server(host: str = METRICS_HOST, port: int = METRICS_PORT):
+    """在当前事件循环中启动 /metrics HTTP 服务，METRICS_PORT 为 0 时不启动；返回 AppRunner 或 None"""
+    if not port:
+        return None
+    app = web.Application()
+    app.add_routes([web.get('/metrics', _handle_metrics)])
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, host, port).start()
+    except OSError as e:
+        logger.error(f"Failed to start metrics server on {host}:{port}: {e}")
+        await runner.cleanup()
+        return None
+    logger.info(f"Metrics available at http://{host}:{port}/metrics")
+    return runner
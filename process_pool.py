@@ -0,0 +1,174 @@
+import asyncio
+import logging
+import multiprocessing
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+import numpy as np
+import pandas as pd
+from config import PROCESS_POOL_WORKERS
+from indicators import (
+    VolumeSignal, OpenInterestSignal, LSRatioSignal, FeatureFrame, checkpoint_indicator_states, restore_indicator_states,
+)
+from resampler import derive_frames, derive_timeframe_frames
+from rule_engine import evaluate_frames
+
+logger = logging.getLogger(__name__)
+
+# 每个子进程是一个单 worker 的执行器，币种按名称哈希固定分配到某个子进程，
+# 这样子进程中的流式指标状态 (RSI/EMA 累加器) 可以跨周期复用
+_workers = []
+
+def _get_workers():
+    if not _workers:
+        # spawn: 子进程不继承事件循环、连接池与各模块的锁
+        context = multiprocessing.get_context('spawn')
+        _workers.extend(ProcessPoolExecutor(max_workers=1, mp_context=context) for _ in range(PROCESS_POOL_WORKERS))
+        logger.info(f"Started {PROCESS_POOL_WORKERS} worker processes for signal evaluation")
+    return _workers
+
+def _worker_index(symbol: str):
+    return zlib.crc32(symbol.encode()) % PROCESS_POOL_WORKERS
+
+def shutdown_pool():
+    """关闭所有子进程 (在程序退出前调用)"""
+    for worker in _workers:
+        worker.shutdown(cancel_futures=True)
+    _workers.clear()
+
+def pack_frames(frames: dict):
+    """
+    把 {symbol: df} 打包到共享内存，子进程按名称直接映射，不需要 pickle DataFrame。
+    所有币种的数值列首尾相接存成一个 (列 x 行) 的 float64 矩阵，时间索引另存为一个 int64 数组。
+    返回 (blocks, layout, entries)：blocks 为 SharedMemory 列表 (由调用方 release_blocks)，
+    layout 为可 pickle 的布局描述，entries 为每个币种的 (symbol, start, stop, attrs)。
+    """
+    symbols = [s for s, df in frames.items() if not df.empty]
+    first = frames[symbols[0]]
+    columns = list(first.columns)
+    lengths = [len(frames[s]) for s in symbols]
+    offsets = np.concatenate([[0], np.cumsum(lengths)])
+    total = int(offsets[-1])
+
+    values_block = SharedMemory(create=True, size=max(1, len(columns) * total * 8))
+    index_block = SharedMemory(create=True, size=max(1, total * 8))
+    values = np.ndarray((len(columns), total), dtype=np.float64, buffer=values_block.buf)
+    index = np.ndarray(total, dtype=np.int64, buffer=index_block.buf)
+    for symbol, start, stop in zip(symbols, offsets[:-1], offsets[1:]):
+        df = frames[symbol]
+        if list(df.columns) != columns:
+            df = df[columns]
+        values[:, start:stop] = df.to_numpy(dtype=np.float64).T
+        index[start:stop] = df.index.to_numpy().view(np.int64)
+    del values, index
+
+    layout = {
+        'values': values_block.name,
+        'index': index_block.name,
+        'total': total,
+        'columns': columns,
+        'dtypes': [str(first[c].dtype) for c in columns],
+        'index_dtype': str(first.index.dtype),
+        'index_name': first.index.name,
+    }
+    entries = [
+        (symbol, int(start), int(stop), dict(frames[symbol].attrs))
+        for symbol, start, stop in zip(symbols, offsets[:-1], offsets[1:])
+    ]
+    return [values_block, index_block], layout, entries
+
+def release_blocks(blocks: list):
+    for block in blocks:
+        block.close()
+        block.unlink()
+
+def unpack_frames(layout: dict, entries: list):
+    """在子进程中映射共享内存，还原 entries 对应币种的 DataFrame (复制出需要的部分后立即解除映射)"""
+    values_block = SharedMemory(name=layout['values'])
+    index_block = SharedMemory(name=layout['index'])
+    try:
+        values = np.ndarray((len(layout['columns']), layout['total']), dtype=np.float64, buffer=values_block.buf)
+        index = np.ndarray(layout['total'], dtype=np.int64, buffer=index_block.buf)
+        frames = {}
+        for symbol, start, stop, attrs in entries:
+            timestamps = pd.Index(index[start:stop].copy().view(layout['index_dtype']), name=layout['index_name'])
+            df = pd.DataFrame({
+                column: values[n, start:stop].astype(dtype)
+                for n, (column, dtype) in enumerate(zip(layout['columns'], layout['dtypes']))
+            }, index=timestamps)
+            df.attrs = attrs
+            frames[symbol] = df
+        del values, index
+    finally:
+        values_block.close()
+        index_block.close()
+    return frames
+
+def _evaluate_chunk(layout: dict, entries: list, vectorized: bool):
+    """子进程入口：计算一组币种的信号，只返回触发的 [(symbol, signal), ...]"""
+    frames = unpack_frames(layout, entries)
+    signals = []
+    if vectorized:
+        for timeframe_frames in derive_timeframe_frames(frames).values():
+            signals.extend(evaluate_frames(timeframe_frames))
+        return signals
+
+    checkers = [VolumeSignal(), OpenInterestSignal(), LSRatioSignal()]
+    for symbol, df in frames.items():
+        for timeframe_df in derive_frames(df).values():
+            if timeframe_df.empty:
+                continue
+            features = FeatureFrame(timeframe_df)
+            for checker in checkers:
+                try:
+                    signal = checker.check(features)
+                    if signal:
+                        signals.append((symbol, signal))
+                except Exception as e:
+                    logger.error(f"Error processing {timeframe_df.attrs.get('timeframe')} signal for {symbol}: {e}", exc_info=True)
+    return signals
+
+async def evaluate_in_pool(frames: dict, vectorized: bool = True):
+    """
+    在进程池中计算 {symbol: df} 的信号，事件循环在此期间可以继续处理网络 I/O。
+    币种按名称分配到 PROCESS_POOL_WORKERS 个子进程中的一个 (vectorized=True 时使用向量化引擎，
+    否则逐个调用各 checker)，子进程只返回触发的信号。
+    """
+    if not any(not df.empty for df in frames.values()):
+        return []
+    blocks, layout, entries = pack_frames(frames)
+    try:
+        chunks = {}
+        for entry in entries:
+            chunks.setdefault(_worker_index(entry[0]), []).append(entry)
+        loop = asyncio.get_running_loop()
+        workers = _get_workers()
+        results = await asyncio.gather(*[
+            loop.run_in_executor(workers[n], _evaluate_chunk, layout, chunk, vectorized)
+            for n, chunk in chunks.items()
+        ])
+    finally:
+        release_blocks(blocks)
+    return [item for signals in results for item in signals]
+
+async def checkpoint_pool_states():
+    """合并各子进程的流式指标状态 (子进程尚未启动时返回空字典)"""
+    if not _workers:
+        return {}
+    loop = asyncio.get_running_loop()
+    results = await asyncio.gather(*[loop.run_in_executor(worker, checkpoint_indicator_states) for worker in _workers])
+    return {key: state for states in results for key, state in states.items()}
+
+async def restore_pool_states(states: dict):
+    """把流式指标状态按币种分发到负责该币种的子进程"""
+    if not states:
+        return
+    chunks = {}
+    for key, state in states.items():
+        symbol = key.rsplit('_', 1)[0]
+        chunks.setdefault(_worker_index(symbol), {})[key] = state
+    loop = asyncio.get_running_loop()
+    workers = _get_workers()
+    await asyncio.gather(*[
+        loop.run_in_executor(workers[n], restore_indicator_states, chunk) for n, chunk in chunks.items()
+    ])
@@ -0,0 +1,288 @@
+import asyncio
+import json
+import logging
+import random
+import time
+from collections import deque
+from urllib.parse import urlparse
+import aiohttp
+from config import (
+    VERIFY_SSL, CONCURRENCY_LIMIT, MAX_CONCURRENCY_LIMIT,
+    BINANCE_WEIGHT_LIMIT, BINANCE_DATA_RATE_LIMIT, BINANCE_RATE_SAFETY_RATIO,
+    FETCH_RETRY_BACKOFF, FETCH_HEDGE_MIN_DELAY,
+)
+from metrics import FETCH_SECONDS, FETCH_RETRIES, HTTP_RESPONSES, BINANCE_USED_WEIGHT, BINANCE_CONCURRENCY
+
+# 可选的更快的 JSON 解析器
+try:
+    import orjson
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
+
+logger = logging.getLogger(__name__)
+
+# 429 未返回 Retry-After 时的默认等待时间 (秒)
+DEFAULT_RETRY_AFTER = 60
+# 两次降低并发之间的最小间隔 (秒)，避免同一批响应把并发连续减半
+DECREASE_COOLDOWN = 1
+# 每个接口保留的最近成功请求耗时样本数，以及开始对冲请求前至少需要的样本数
+LATENCY_SAMPLES = 200
+HEDGE_MIN_SAMPLES = 20
+HEDGE_QUANTILE = 0.95
+
+def endpoint_weight(url: str, params: dict):
+    """
+    Binance USDⓈ-M 期货接口的请求权重。
+    /futures/data/* (openInterestHist, globalLongShortAccountRatio) 不计入权重，
+    而是单独限制为每 5 分钟 BINANCE_DATA_RATE_LIMIT 次，返回 0 表示使用该限额。
+    """
+    path = urlparse(url).path
+    if path.endswith('/fapi/v1/klines'):
+        limit = int(params.get('limit', 500))
+        if limit < 100:
+            return 1
+        if limit < 500:
+            return 2
+        if limit <= 1000:
+            return 5
+        return 10
+    if path.endswith('/fapi/v1/ticker/24hr'):
+        return 1 if 'symbol' in params else 40
+    if path.startswith('/futures/data/'):
+        return 0
+    return 1
+
+class WeightBucket:
+    """
+    按固定时间窗口计量的权重桶 (与 Binance 按自然分钟统计 X-MBX-USED-WEIGHT-1M 的方式一致)：
+    每个 period 秒的窗口内最多消耗 capacity，进入新窗口时清零。
+    """
+    def __init__(self, capacity: float, period: float):
+        self.capacity = capacity
+        self.period = period
+        self.window = None
+        self.used = 0
+
+    def _roll(self):
+        window = int(time.time() // self.period)
+        if window != self.window:
+            self.window = window
+            self.used = 0
+
+    def try_consume(self, cost: float):
+        """消耗 cost 并返回 0；当前窗口剩余不足时返回距下一个窗口的秒数"""
+        self._roll()
+        if self.used + cost <= self.capacity:
+            self.used += cost
+            return 0
+        return self.period - time.time() % self.period
+
+    def sync_used(self, used: float):
+        """用服务器返回的实际用量校准 (只会增加用量，以兼顾同一 IP 上的其他进程)"""
+        self._roll()
+        self.used = max(self.used, used)
+
+class RequestScheduler:
+    """
+    所有 Binance REST 请求的统一调度器：
+    - 按接口权重从权重桶扣减，并用 X-MBX-USED-WEIGHT-1M 响应头校准
+    - 遇到 429/418 时按 Retry-After 暂停所有请求
+    - 并发数按 AIMD 自适应：用量低时逐步增加，接近上限或被限流时减半
+    - 单次请求带超时，超时、网络错误、429、5xx 时按随机退避 (full jitter) 重试
+    - 可选的对冲请求：超过该接口最近耗时的 p95 仍未返回时发送一个相同的请求，使用先成功的结果
+    """
+    def __init__(self):
+        self.weight_limit = BINANCE_WEIGHT_LIMIT
+        self.weight_bucket = WeightBucket(BINANCE_WEIGHT_LIMIT * BINANCE_RATE_SAFETY_RATIO, 60)
+        self.data_bucket = WeightBucket(BINANCE_DATA_RATE_LIMIT * BINANCE_RATE_SAFETY_RATIO, 300)
+        self.concurrency = CONCURRENCY_LIMIT
+        BINANCE_CONCURRENCY.set(self.concurrency)
+        self.in_flight = 0
+        self.blocked_until = 0
+        self.used_weight = 0
+        self._last_decrease = 0
+        # endpoint -> 最近成功请求的耗时 (秒)，不包括排队时间
+        self.latencies = {}
+        self._cond = None
+        self._loop = None
+
+    def _condition(self):
+        # asyncio 原语绑定到事件循环，按需创建
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._cond = asyncio.Condition()
+            self._loop = loop
+            self.in_flight = 0
+        return self._cond
+
+    async def _acquire_slot(self):
+        cond = self._condition()
+        async with cond:
+            await cond.wait_for(lambda: self.in_flight < self.concurrency)
+            self.in_flight += 1
+
+    def _try_acquire_slot(self):
+        """有空闲并发槽时立即占用并返回 True，否则返回 False (不等待)"""
+        self._condition()
+        if self.in_flight >= self.concurrency:
+            return False
+        self.in_flight += 1
+        return True
+
+    async def _release_slot(self):
+        cond = self._condition()
+        async with cond:
+            self.in_flight -= 1
+            cond.notify_all()
+
+    async def _wait_for_tokens(self, bucket: WeightBucket, cost: float):
+        while True:
+            now = time.monotonic()
+            if now < self.blocked_until:
+                await asyncio.sleep(self.blocked_until - now)
+                continue
+            delay = bucket.try_consume(cost)
+            if delay == 0:
+                return
+            await asyncio.sleep(delay)
+
+    def _set_concurrency(self, concurrency: int):
+        concurrency = max(1, min(MAX_CONCURRENCY_LIMIT, concurrency))
+        if concurrency != self.concurrency:
+            logger.info(f"Binance request concurrency {self.concurrency} -> {concurrency} (used weight {self.used_weight}/{self.weight_limit})")
+            self.concurrency = concurrency
+            BINANCE_CONCURRENCY.set(concurrency)
+
+    def _decrease_concurrency(self):
+        now = time.monotonic()
+        if now - self._last_decrease >= DECREASE_COOLDOWN:
+            self._last_decrease = now
+            self._set_concurrency(self.concurrency // 2)
+
+    def _on_response(self, response: aiohttp.ClientResponse):
+        HTTP_RESPONSES.inc(service='binance', status=response.status)
+        if response.status in (418, 429):
+            retry_after = response.headers.get('Retry-After', '')
+            retry_after = int(retry_after) if retry_after.isdigit() else DEFAULT_RETRY_AFTER
+            self.blocked_until = max(self.blocked_until, time.monotonic() + retry_after)
+            logger.warning(f"Binance rate limit hit (HTTP {response.status}), pausing requests for {retry_after}s")
+            self._decrease_concurrency()
+            return
+
+        used = response.headers.get('X-MBX-USED-WEIGHT-1M')
+        if used is None or not used.isdigit():
+            return
+        self.used_weight = int(used)
+        self.weight_bucket.sync_used(self.used_weight)
+        BINANCE_USED_WEIGHT.set(self.used_weight)
+
+        utilization = self.used_weight / self.weight_limit
+        if utilization >= BINANCE_RATE_SAFETY_RATIO:
+            self._decrease_concurrency()
+        elif utilization < BINANCE_RATE_SAFETY_RATIO / 2 and self.in_flight >= self.concurrency:
+            # 并发已用满且权重充裕，增加并发
+            self._set_concurrency(self.concurrency + 1)
+
+    def _record_latency(self, endpoint: str, seconds: float):
+        self.latencies.setdefault(endpoint, deque(maxlen=LATENCY_SAMPLES)).append(seconds)
+
+    def hedge_delay(self, endpoint: str):
+        """发送对冲请求前的等待时间 (该接口最近耗时的 p95)，样本不足时返回 None"""
+        samples = self.latencies.get(endpoint)
+        if not samples or len(samples) < HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(samples)
+        return max(FETCH_HEDGE_MIN_DELAY, ordered[int(HEDGE_QUANTILE * (len(ordered) - 1))])
+
+    async def _get_json(self, session: aiohttp.ClientSession, url: str, params: dict, timeout: float):
+        """单次 GET，返回 (status, data)，data 只在 HTTP 200 时有值"""
+        client_timeout = aiohttp.ClientTimeout(total=timeout) if timeout else None
+        async with session.get(url, params=params, ssl=VERIFY_SSL, timeout=client_timeout) as response:
+            self._on_response(response)
+            if response.status == 200:
+                return 200, await response.json(loads=json_loads)
+            return response.status, None
+
+    async def _hedged_get_json(self, session: aiohttp.ClientSession, url: str, params: dict, timeout: float,
+                               bucket: WeightBucket, cost: float):
+        endpoint = urlparse(url).path.rsplit('/', 1)[-1]
+        delay = self.hedge_delay(endpoint)
+        primary = asyncio.ensure_future(self._get_json(session, url, params, timeout))
+        tasks = [primary]
+        hedge_slot = False
+        try:
+            if delay is None or (timeout and delay >= timeout):
+                return await primary
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+            # 已返回，或当前窗口没有多余的权重 / 并发槽时不发送对冲请求 (对冲请求同样占用一个并发槽)
+            if done or time.monotonic() < self.blocked_until or bucket.try_consume(cost) != 0:
+                return await primary
+            hedge_slot = self._try_acquire_slot()
+            if not hedge_slot:
+                return await primary
+
+            FETCH_RETRIES.inc(endpoint=endpoint, kind='hedge')
+            hedge = asyncio.ensure_future(self._get_json(session, url, params, timeout))
+            tasks.append(hedge)
+            pending = {primary, hedge}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if not task.cancelled() and task.exception() is None and task.result()[0] == 200:
+                        return task.result()
+            # 两个请求都失败时按原请求的结果处理
+            return primary.result()
+        finally:
+            # 调用方被取消时也要取消两个请求
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+            if hedge_slot:
+                await self._release_slot()
+
+    async def request(self, session: aiohttp.ClientSession, url: str, params: dict,
+                      timeout: float = None, retries: int = 0, hedge: bool = False):
+        """
+        发送 GET 请求并返回 JSON，失败时返回 None。
+        timeout 为单次请求的超时 (秒)；超时、网络错误、429、5xx 时最多重试 retries 次；
+        hedge=True 时允许发送对冲请求。
+        """
+        weight = endpoint_weight(url, params)
+        bucket, cost = (self.data_bucket, 1) if weight == 0 else (self.weight_bucket, weight)
+        endpoint = urlparse(url).path.rsplit('/', 1)[-1]
+        started = time.perf_counter()
+        try:
+            for attempt in range(retries + 1):
+                if attempt:
+                    FETCH_RETRIES.inc(endpoint=endpoint, kind='retry')
+                    await asyncio.sleep(random.uniform(0, FETCH_RETRY_BACKOFF * 2 ** attempt))
+                await self._acquire_slot()
+                try:
+                    await self._wait_for_tokens(bucket, cost)
+                    sent = time.perf_counter()
+                    if hedge:
+                        status, data = await self._hedged_get_json(session, url, params, timeout, bucket, cost)
+                    else:
+                        status, data = await self._get_json(session, url, params, timeout)
+                    if status == 200:
+                        self._record_latency(endpoint, time.perf_counter() - sent)
+                        return data
+                    logger.error(f"Error fetching {url}: HTTP {status}")
+                    # 418 (IP 被封禁) 与其他 4xx 重试也不会成功
+                    if status != 429 and status < 500:
+                        return None
+                except asyncio.TimeoutError:
+                    HTTP_RESPONSES.inc(service='binance', status='timeout')
+                    logger.warning(f"Timeout fetching {url} ({params.get('symbol', '')}) after {timeout}s")
+                except Exception as e:
+                    HTTP_RESPONSES.inc(service='binance', status='error')
+                    logger.error(f"Exception fetching {url}: {e}")
+                finally:
+                    # 被取消 (例如对冲请求中较慢的一个) 时也要归还并发槽位
+                    await asyncio.shield(self._release_slot())
+            return None
+        finally:
+            FETCH_SECONDS.observe(time.perf_counter() - started, endpoint=endpoint)
+
+scheduler = RequestScheduler()
@@ -0,0 +1,94 @@
+import time
+import numpy as np
+import pandas as pd
+from config import TIMEFRAME, TIMEFRAMES, VOLUME_LOOKBACK_PERIOD, LS_RATIO_LOOKBACK_PERIOD
+from data_fetcher import WINDOW_LIMIT
+from timeframes import interval_seconds, candle_open_ms
+
+# 由 TIMEFRAME K 线聚合为更粗周期时各列的聚合方式 (cvd 为累计值，oi / ls_ratio 为时点值，均取最后一个)
+AGGREGATIONS = {
+    'open': 'first', 'high': 'max', 'low': 'min', 'close': 'last', 'volume': 'sum',
+    'close_time': 'last', 'quote_asset_volume': 'sum', 'number_of_trades': 'sum',
+    'taker_buy_base_asset_volume': 'sum', 'taker_buy_quote_asset_volume': 'sum',
+    'cvd': 'last', 'oi': 'last', 'ls_ratio': 'last',
+}
+
+def timeframe_ratio(timeframe: str):
+    """timeframe 包含多少根 TIMEFRAME K 线"""
+    ratio, remainder = divmod(interval_seconds(timeframe), interval_seconds(TIMEFRAME))
+    if ratio < 1 or remainder:
+        raise ValueError(f"Timeframe {timeframe} is not a multiple of TIMEFRAME {TIMEFRAME}")
+    return ratio
+
+def check_timeframe(timeframe: str):
+    """校验分析周期：必须是 TIMEFRAME 的整数倍，且滚动窗口能聚合出足够回看周期的完整 K 线"""
+    ratio = timeframe_ratio(timeframe)
+    lookback = max(VOLUME_LOOKBACK_PERIOD, LS_RATIO_LOOKBACK_PERIOD)
+    # 窗口开头与末尾各可能有一根不完整的 K 线被丢弃
+    bars = WINDOW_LIMIT // ratio - (1 if ratio > 1 else 0)
+    if bars < lookback:
+        raise ValueError(
+            f"Timeframe {timeframe} only gets {bars} complete candles from a {WINDOW_LIMIT}-candle {TIMEFRAME} window, "
+            f"fewer than the {lookback}-candle lookback; use a coarser TIMEFRAME or drop {timeframe} from TIMEFRAMES"
+        )
+    return ratio
+
+# 启动时校验所有分析周期，配置错误时立即失败而不是在第一次检查时 (否则该周期永远不会产生信号)
+for _timeframe in TIMEFRAMES:
+    check_timeframe(_timeframe)
+
+def resample_frame(df: pd.DataFrame, timeframe: str, now_ms: int = None):
+    """
+    将 TIMEFRAME 的 DataFrame 聚合为 timeframe 周期。
+    只保留完整的 K 线 (包含全部 ratio 根基础 K 线，且收盘时间不晚于 now_ms，默认为当前时间)，
+    窗口开头不完整的和仍在形成中的 K 线都会被丢弃，以免半根 K 线的成交量被误判为异动。
+    """
+    ratio = timeframe_ratio(timeframe)
+    if ratio == 1 or df.empty:
+        result = df
+    else:
+        timestamps = df.index.to_numpy(dtype='datetime64[ms]').astype(np.int64)
+        opens = candle_open_ms(timestamps, timeframe)
+        starts = np.flatnonzero(np.r_[True, opens[1:] != opens[:-1]])
+        ends = np.r_[starts[1:], len(opens)] - 1
+        # 行数齐全还不够：最后一根基础 K 线可能仍在形成中
+        if now_ms is None:
+            now_ms = int(time.time() * 1000)
+        period_ms = interval_seconds(timeframe) * 1000
+        complete = ((ends - starts + 1) == ratio) & (opens[starts] + period_ms <= now_ms)
+
+        columns = {}
+        for column, how in AGGREGATIONS.items():
+            if column not in df:
+                continue
+            values = df[column].to_numpy()
+            if how == 'first':
+                aggregated = values[starts]
+            elif how == 'last':
+                aggregated = values[ends]
+            elif how == 'max':
+                aggregated = np.maximum.reduceat(values, starts)
+            elif how == 'min':
+                aggregated = np.minimum.reduceat(values, starts)
+            else:
+                aggregated = np.add.reduceat(values, starts)
+            columns[column] = aggregated[complete]
+
+        index = pd.to_datetime(opens[starts][complete], unit='ms')
+        index.name = 'timestamp'
+        result = pd.DataFrame(columns, index=index)
+    result.attrs = dict(df.attrs, timeframe=timeframe)
+    return result
+
+def derive_frames(df: pd.DataFrame):
+    """由一个 TIMEFRAME 的 DataFrame 得到所有分析周期的 DataFrame: {timeframe: df}"""
+    return {timeframe: resample_frame(df, timeframe) for timeframe in TIMEFRAMES}
+
+def derive_timeframe_frames(frames: dict):
+    """{symbol: df} -> {timeframe: {symbol: df}}，空的 DataFrame 会被忽略"""
+    by_timeframe = {timeframe: {} for timeframe in TIMEFRAMES}
+    for symbol, df in frames.items():
+        for timeframe, timeframe_df in derive_frames(df).items():
+            if not timeframe_df.empty:
+                by_timeframe[timeframe][symbol] = timeframe_df
+    return by_timeframe
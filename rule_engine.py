@@ -0,0 +1,248 @@
+"""
+声明式信号规则：从 JSON 文件加载，启动时编译为在 (币种 x 时间) 矩阵上计算的向量化表达式。
+
+规则文件是一个列表，每条规则:
+    {
+        "name": "oi_24h_change",
+        "indicator": "Open Interest",            # Volume / Open Interest / Long/Short Ratio
+        "signal_type": "24H Change Alert",       # 可引用 config 常量，如 "Continuous Rise ({OI_CONTINUOUS_RISE_PERIODS} periods)"
+        "when": "bars >= VOLUME_LOOKBACK_PERIOD and abs(change(oi, VOLUME_LOOKBACK_PERIOD - 1)) > OI_24H_CHANGE_THRESHOLD",
+        "fields": {"value": "oi", "change_24h": "change(oi, VOLUME_LOOKBACK_PERIOD - 1)", "price": "close"}
+    }
+
+表达式语法 (Python 表达式的子集):
+- 小写名称: DataFrame 的列 (close, volume, oi, ls_ratio, cvd ...)，表示最新一根 K 线的值；bars 为 K 线数量
+- 大写名称: config.py 中的常量
+- zscore(col, n): 最新值相对最近 n 个值的 Z-Score
+- change(col, n): 最新值相对 n 根 K 线之前的变化率
+- rising(col, n) / falling(col, n): 最近 n 根 K 线连续上涨 / 下跌
+- abs(x)，+ - * /，比较运算，and / or / not
+
+同一 indicator 的规则按文件中的顺序匹配，每个币种只触发第一条满足条件的规则
+(与 SignalStateManager 按 币种/周期/指标 去重一致)。
+fields 的键为 SignalRecord 的数值字段: value, z_score, price, price_change, change_24h, change_1_period。
+"""
+import ast
+import functools
+import json
+import logging
+import numpy as np
+import config
+from config import RULES_PATH
+from data_fetcher import KLINE_FIELDS
+from indicators import FeatureFrame, _create_market_snapshot, _candle_timestamp, uses_stale_data
+from signal_engine import _stack_column, _latest_z_score, evaluate_signals
+from signals import Indicator, SignalRecord
+
+logger = logging.getLogger(__name__)
+
+SIGNAL_FIELDS = ('value', 'z_score', 'price', 'price_change', 'change_24h', 'change_1_period')
+CONSTANTS = {name: value for name, value in vars(config).items() if name.isupper()}
+# 规则中可以使用的列 (与 data_fetcher 构建的 DataFrame 一致)
+COLUMNS = tuple(KLINE_FIELDS) + ('cvd', 'oi', 'ls_ratio')
+
+class RuleContext:
+    """一轮检查中所有币种的特征矩阵，列与函数结果在首次使用时计算并在各规则间共享"""
+    def __init__(self, frames: dict):
+        self.frames = frames
+        self.symbols = [s for s, df in frames.items() if not df.empty]
+        self.lengths = np.array([len(frames[s]) for s in self.symbols])
+        self.length = int(self.lengths.max()) if self.symbols else 0
+        self._cache = {}
+
+    def column(self, name: str):
+        key = ('column', name)
+        if key not in self._cache:
+            self._cache[key] = _stack_column(self.frames, self.symbols, name, self.length)
+        return self._cache[key]
+
+    def fresh(self, indicator: Indicator):
+        """按币种: indicator 依赖的序列都不是旧的缓存序列"""
+        key = ('fresh', indicator)
+        if key not in self._cache:
+            self._cache[key] = np.array([not uses_stale_data(self.frames[s], indicator) for s in self.symbols], dtype=bool)
+        return self._cache[key]
+
+    def call(self, function: str, column: str, n: int):
+        key = (function, column, n)
+        if key not in self._cache:
+            with np.errstate(invalid='ignore', divide='ignore'):
+                self._cache[key] = FUNCTIONS[function](self.column(column), n)
+        return self._cache[key]
+
+def _change(matrix: np.ndarray, n: int):
+    if matrix.shape[1] <= n:
+        return np.full(matrix.shape[0], np.nan)
+    return matrix[:, -1] / matrix[:, -1 - n] - 1
+
+def _pct_changes(matrix: np.ndarray, n: int):
+    """最近 n 个逐根变化率 (不足时用 NaN 补齐)"""
+    changes = np.full((matrix.shape[0], n), np.nan)
+    recent = matrix[:, -n - 1:]
+    changes[:, n + 1 - recent.shape[1]:] = recent[:, 1:] / recent[:, :-1] - 1
+    return changes
+
+FUNCTIONS = {
+    'zscore': _latest_z_score,
+    'change': _change,
+    'rising': lambda matrix, n: (_pct_changes(matrix, n) > 0).all(axis=1),
+    'falling': lambda matrix, n: (_pct_changes(matrix, n) < 0).all(axis=1),
+}
+
+COMPARISONS = {
+    ast.Gt: np.greater, ast.GtE: np.greater_equal, ast.Lt: np.less,
+    ast.LtE: np.less_equal, ast.Eq: np.equal, ast.NotEq: np.not_equal,
+}
+ARITHMETIC = {ast.Add: np.add, ast.Sub: np.subtract, ast.Mult: np.multiply, ast.Div: np.true_divide}
+
+def _constant(node: ast.AST, expression: str):
+    """编译期求值的常量表达式 (数字、config 常量及其四则运算)"""
+    if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)) and not isinstance(node.value, bool):
+        return node.value
+    if isinstance(node, ast.Name) and node.id in CONSTANTS:
+        return CONSTANTS[node.id]
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub):
+        return -_constant(node.operand, expression)
+    if isinstance(node, ast.BinOp) and type(node.op) in ARITHMETIC:
+        return ARITHMETIC[type(node.op)](_constant(node.left, expression), _constant(node.right, expression))
+    raise ValueError(f"Expected a constant in {expression!r}, got {ast.unparse(node)!r}")
+
+def _column(node: ast.AST, expression: str):
+    if not isinstance(node, ast.Name) or node.id not in COLUMNS:
+        raise ValueError(f"Unknown column {ast.unparse(node)!r} in {expression!r}, expected one of {COLUMNS}")
+    return node.id
+
+def _compile_node(node: ast.AST, expression: str):
+    """把 AST 节点编译为 fn(context) -> 标量或按币种的向量"""
+    if isinstance(node, ast.BoolOp):
+        operands = [_compile_node(value, expression) for value in node.values]
+        combine = np.logical_and if isinstance(node.op, ast.And) else np.logical_or
+        # functools.reduce 使标量与按币种的向量可以广播 (ufunc.reduce 要求形状一致)
+        return lambda ctx: functools.reduce(combine, [operand(ctx) for operand in operands])
+    if isinstance(node, ast.UnaryOp):
+        operand = _compile_node(node.operand, expression)
+        if isinstance(node.op, ast.Not):
+            return lambda ctx: np.logical_not(operand(ctx))
+        if isinstance(node.op, ast.USub):
+            return lambda ctx: np.negative(operand(ctx))
+    if isinstance(node, ast.BinOp) and type(node.op) in ARITHMETIC:
+        op, left, right = ARITHMETIC[type(node.op)], _compile_node(node.left, expression), _compile_node(node.right, expression)
+        def arithmetic(ctx):
+            with np.errstate(invalid='ignore', divide='ignore'):
+                return op(left(ctx), right(ctx))
+        return arithmetic
+    if isinstance(node, ast.Compare) and all(type(op) in COMPARISONS for op in node.ops):
+        operands = [_compile_node(n, expression) for n in [node.left] + node.comparators]
+        ops = [COMPARISONS[type(op)] for op in node.ops]
+        def compare(ctx):
+            values = [operand(ctx) for operand in operands]
+            with np.errstate(invalid='ignore'):
+                return functools.reduce(np.logical_and, [op(a, b) for op, a, b in zip(ops, values, values[1:])])
+        return compare
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and not node.keywords:
+        name = node.func.id
+        if name == 'abs' and len(node.args) == 1:
+            operand = _compile_node(node.args[0], expression)
+            return lambda ctx: np.abs(operand(ctx))
+        if name in FUNCTIONS and len(node.args) == 2:
+            column, n = _column(node.args[0], expression), int(_constant(node.args[1], expression))
+            if n < 1:
+                raise ValueError(f"{name}() needs a window of at least 1 in {expression!r}")
+            return lambda ctx: ctx.call(name, column, n)
+        raise ValueError(f"Unsupported call {ast.unparse(node)!r} in {expression!r}")
+    if isinstance(node, ast.Name):
+        if node.id == 'bars':
+            return lambda ctx: ctx.lengths
+        if node.id in CONSTANTS or not node.id.islower():
+            value = _constant(node, expression)
+            return lambda ctx: value
+        column = _column(node, expression)
+        return lambda ctx: ctx.column(column)[:, -1]
+    if isinstance(node, ast.Constant):
+        value = _constant(node, expression)
+        return lambda ctx: value
+    raise ValueError(f"Unsupported syntax {ast.unparse(node)!r} in {expression!r}")
+
+def compile_expression(expression: str):
+    try:
+        tree = ast.parse(expression, mode='eval')
+    except SyntaxError as e:
+        raise ValueError(f"Invalid rule expression {expression!r}: {e}") from e
+    return _compile_node(tree.body, expression)
+
+class Rule:
+    """编译后的规则"""
+    def __init__(self, name: str, indicator: str, signal_type: str, when: str, fields: dict = None):
+        self.name = name
+        self.indicator = Indicator(indicator)
+        self.signal_type = signal_type.format(**CONSTANTS)
+        self.when = compile_expression(when)
+        fields = fields or {}
+        unknown = set(fields) - set(SIGNAL_FIELDS)
+        if unknown:
+            raise ValueError(f"Rule {name!r} has unknown fields {sorted(unknown)}, expected a subset of {SIGNAL_FIELDS}")
+        self.fields = {field: compile_expression(expression) for field, expression in fields.items()}
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        try:
+            return cls(**data)
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"Invalid rule {data.get('name', data)!r}: {e}") from e
+
+def load_rules(path: str):
+    """加载并编译规则文件，格式错误时抛出 ValueError"""
+    with open(path, encoding='utf-8') as f:
+        rules = [Rule.from_dict(data) for data in json.load(f)]
+    logger.info(f"Loaded {len(rules)} signal rules from {path}")
+    return rules
+
+def evaluate_rules(frames: dict, rules: list):
+    """
+    对所有币种一次性计算所有规则，返回 [(symbol, signal), ...]，signal 的格式与 checker.check() 的返回值相同。
+    """
+    ctx = RuleContext(frames)
+    if not ctx.symbols:
+        return []
+
+    # 每个 indicator 只保留第一条满足条件的规则
+    claimed = {}
+    fired = []
+    for rule in rules:
+        mask = np.broadcast_to(np.asarray(rule.when(ctx), dtype=bool), len(ctx.symbols))
+        taken = claimed.setdefault(rule.indicator, np.zeros(len(ctx.symbols), dtype=bool))
+        mask = mask & ~taken & ctx.fresh(rule.indicator)
+        taken |= mask
+        fired.append(mask)
+
+    # 只为有币种触发的规则计算字段
+    field_values = [
+        {field: np.broadcast_to(expression(ctx), len(ctx.symbols)) for field, expression in rule.fields.items()}
+        if mask.any() else None
+        for rule, mask in zip(rules, fired)
+    ]
+
+    results = []
+    for i in np.flatnonzero(functools.reduce(np.logical_or, fired)):
+        symbol = ctx.symbols[i]
+        df = frames[symbol]
+        # 同一币种的多个信号共用一个背景快照
+        features = FeatureFrame(df)
+        for rule, mask, values in zip(rules, fired, field_values):
+            if not mask[i]:
+                continue
+            signal = SignalRecord(
+                rule.indicator, rule.signal_type, timestamp=_candle_timestamp(df),
+                **{field: float(vector[i]) for field, vector in values.items()},
+            )
+            results.append((symbol, _create_market_snapshot(features, signal)))
+    return results
+
+# 配置了 RULES_PATH 时在启动时加载并编译规则，否则使用内置的向量化引擎 (signal_engine)
+RULES = load_rules(RULES_PATH) if RULES_PATH else None
+
+def evaluate_frames(frames: dict):
+    """计算 {symbol: df} (同一周期) 的信号"""
+    if RULES is None:
+        return evaluate_signals(frames)
+    return evaluate_rules(frames, RULES)
@@ -0,0 +1,92 @@
+import asyncio
+import bisect
+import hashlib
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+from config import SHARD_DB_PATH, SHARD_WORKER_ID, SHARD_LEASE_SECONDS, SHARD_HEARTBEAT_INTERVAL
+from metrics import SHARD_MEMBERS
+
+logger = logging.getLogger(__name__)
+
+# 一致性哈希环上每个 worker 的虚拟节点数 (越多分配越均匀)
+VIRTUAL_NODES = 64
+
+def _hash(key: str):
+    # 不使用内置 hash()：它在不同进程中的结果不同
+    return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], 'big')
+
+class HashRing:
+    """一致性哈希环：worker 增减时只有约 1/N 的币种需要换 worker"""
+    def __init__(self, members: list, virtual_nodes: int = VIRTUAL_NODES):
+        self.members = tuple(sorted(members))
+        points = sorted((_hash(f"{member}#{n}"), member) for member in self.members for n in range(virtual_nodes))
+        self._keys = [key for key, _ in points]
+        self._owners = [member for _, member in points]
+
+    def owner(self, symbol: str):
+        if not self._keys:
+            return None
+        n = bisect.bisect(self._keys, _hash(symbol)) % len(self._keys)
+        return self._owners[n]
+
+class ShardCoordinator:
+    """
+    多个进程 (或共享同一数据卷的多台机器) 分担币种列表：
+    - 每个 worker 在共享的 SQLite 中定期续租 (heartbeat)，超过 SHARD_LEASE_SECONDS 未续租的 worker 视为已退出
+    - 币种按一致性哈希分配给当前存活的 worker，worker 退出或加入后下一轮检查自动重新分配
+    告警去重由使用同一数据库的 SignalStateManager(shared=True) 保证 (重新分配期间两个 worker 都检查同一币种时也只发送一次)。
+    数据库操作是阻塞的 (共享卷被锁时最长等待 30 秒)，在事件循环中应通过 asyncio.to_thread 调用。
+    """
+    def __init__(self, db_path: str = SHARD_DB_PATH, worker_id: str = SHARD_WORKER_ID, lease_seconds: float = SHARD_LEASE_SECONDS):
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.lease_seconds = lease_seconds
+        self.db = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS shard_members (worker_id TEXT PRIMARY KEY, heartbeat_at REAL NOT NULL)"
+        )
+        self.db.commit()
+        self._ring = HashRing([self.worker_id])
+        # 心跳任务与检查周期可能在不同线程中同时使用连接
+        self._lock = threading.Lock()
+
+    def heartbeat(self):
+        """续租并清除租约已过期的 worker，返回当前存活的 worker 列表"""
+        now = time.time()
+        with self._lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO shard_members (worker_id, heartbeat_at) VALUES (?, ?)", (self.worker_id, now)
+            )
+            self.db.execute("DELETE FROM shard_members WHERE heartbeat_at < ?", (now - self.lease_seconds,))
+            self.db.commit()
+            members = [row[0] for row in self.db.execute("SELECT worker_id FROM shard_members").fetchall()]
+        if tuple(sorted(members)) != self._ring.members:
+            logger.info(f"Shard members changed: {', '.join(self._ring.members)} -> {', '.join(sorted(members))}")
+            self._ring = HashRing(members)
+            SHARD_MEMBERS.set(len(members))
+        return list(self._ring.members)
+
+    def owned_symbols(self, symbols: list):
+        """续租后返回 symbols 中分配给本 worker 的部分 (保持原有顺序)"""
+        self.heartbeat()
+        return [symbol for symbol in symbols if self._ring.owner(symbol) == self.worker_id]
+
+    async def run_heartbeat(self):
+        """后台续租 (检查周期可能远长于租约时间)"""
+        while True:
+            try:
+                await asyncio.to_thread(self.heartbeat)
+            except sqlite3.Error as e:
+                logger.error(f"Shard heartbeat failed: {e}")
+            await asyncio.sleep(SHARD_HEARTBEAT_INTERVAL)
+
+    def leave(self):
+        """正常退出时释放租约，其他 worker 立即接管本 worker 的币种"""
+        with self._lock:
+            self.db.execute("DELETE FROM shard_members WHERE worker_id = ?", (self.worker_id,))
+            self.db.commit()
+            self.db.close()
@@ -0,0 +1,114 @@
+import numpy as np
+from config import *
+from indicators import FeatureFrame, _create_market_snapshot, _candle_timestamp, uses_stale_data
+from signals import Indicator, SignalRecord
+
+def _stack_column(frames: dict, symbols: list, column: str, length: int):
+    """
+    将所有币种的某一列堆叠为 (symbols x time) 矩阵。
+    各币种按最新一根 K 线右对齐，历史较短的币种在前面用 NaN 填充。
+    """
+    matrix = np.full((len(symbols), length), np.nan)
+    for i, symbol in enumerate(symbols):
+        values = frames[symbol][column].to_numpy(dtype=float)
+        matrix[i, length - len(values):] = values
+    return matrix
+
+def _latest_z_score(matrix: np.ndarray, lookback: int):
+    """计算每一行最新值相对最近 lookback 个值的 Z-Score (与 calculate_z_score 的最后一个值一致)"""
+    if matrix.shape[1] < lookback:
+        return np.full(matrix.shape[0], np.nan)
+    window = matrix[:, -lookback:]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = window.mean(axis=1)
+        std = window.std(axis=1, ddof=1)
+        return (matrix[:, -1] - mean) / std
+
+def evaluate_signals(frames: dict):
+    """
+    一次性对所有币种计算 Volume / Open Interest / Long-Short Ratio 信号。
+    返回 [(symbol, signal), ...]，signal 的格式与各 checker.check() 的返回值相同，
+    顺序与 [VolumeSignal, OpenInterestSignal, LSRatioSignal] 逐个检查时一致。
+    """
+    symbols = [s for s, df in frames.items() if not df.empty]
+    if not symbols:
+        return []
+
+    length = max(len(frames[s]) for s in symbols)
+    lengths = np.array([len(frames[s]) for s in symbols])
+    close = _stack_column(frames, symbols, 'close', length)
+    volume = _stack_column(frames, symbols, 'volume', length)
+    oi = _stack_column(frames, symbols, 'oi', length)
+    ls_ratio = _stack_column(frames, symbols, 'ls_ratio', length)
+    # 依赖旧的缓存序列的指标不检查
+    fresh = {
+        indicator: np.array([not uses_stale_data(frames[s], indicator) for s in symbols], dtype=bool)
+        for indicator in Indicator
+    }
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        # 1. Volume Z-Score
+        volume_z = _latest_z_score(volume, VOLUME_LOOKBACK_PERIOD)
+        volume_fired = fresh[Indicator.VOLUME] & (lengths >= VOLUME_LOOKBACK_PERIOD) & (np.abs(volume_z) > VOLUME_Z_SCORE_THRESHOLD)
+        price_change = close[:, -1] / close[:, -2] - 1 if length > 1 else np.full(len(symbols), np.nan)
+
+        # 2. Open Interest: 24h change, continuous rise/fall, sudden change
+        oi_eligible = fresh[Indicator.OPEN_INTEREST] & (lengths >= VOLUME_LOOKBACK_PERIOD)
+        if length >= VOLUME_LOOKBACK_PERIOD:
+            oi_24h_change = oi[:, -1] / oi[:, -VOLUME_LOOKBACK_PERIOD] - 1
+        else:
+            oi_24h_change = np.full(len(symbols), np.nan)
+        oi_pct_change = np.full_like(oi, np.nan)
+        oi_pct_change[:, 1:] = oi[:, 1:] / oi[:, :-1] - 1
+        recent_oi_change = oi_pct_change[:, -OI_CONTINUOUS_RISE_PERIODS:]
+        oi_24h_fired = oi_eligible & (np.abs(oi_24h_change) > OI_24H_CHANGE_THRESHOLD)
+        oi_rise_fired = oi_eligible & (recent_oi_change > 0).all(axis=1)
+        oi_fall_fired = oi_eligible & (recent_oi_change < 0).all(axis=1)
+        oi_sudden_fired = oi_eligible & (np.abs(oi_pct_change[:, -1]) > OI_SUDDEN_CHANGE_THRESHOLD)
+
+        # 3. Long/Short Ratio Z-Score
+        ls_z = _latest_z_score(ls_ratio, LS_RATIO_LOOKBACK_PERIOD)
+        ls_fired = fresh[Indicator.LS_RATIO] & (lengths >= LS_RATIO_LOOKBACK_PERIOD) & (np.abs(ls_z) > LS_RATIO_Z_SCORE_THRESHOLD)
+
+    results = []
+    for i, symbol in enumerate(symbols):
+        df = frames[symbol]
+        timestamp = _candle_timestamp(df)
+        # 同一币种的多个信号共用一个背景快照
+        features = FeatureFrame(df)
+
+        if volume_fired[i]:
+            signal = SignalRecord(
+                Indicator.VOLUME, "Spike Alert", timestamp=timestamp,
+                value=float(volume[i, -1]), z_score=float(volume_z[i]), price_change=float(price_change[i]),
+            )
+            results.append((symbol, _create_market_snapshot(features, signal)))
+
+        oi_signal = None
+        if oi_24h_fired[i]:
+            oi_signal = SignalRecord(
+                Indicator.OPEN_INTEREST, "24H Change Alert", timestamp=timestamp,
+                value=float(oi[i, -1]), change_24h=float(oi_24h_change[i]), price=float(close[i, -1]),
+            )
+        elif oi_rise_fired[i] or oi_fall_fired[i]:
+            direction = "Rise" if oi_rise_fired[i] else "Fall"
+            oi_signal = SignalRecord(
+                Indicator.OPEN_INTEREST, f"Continuous {direction} ({OI_CONTINUOUS_RISE_PERIODS} periods)", timestamp=timestamp,
+                value=float(oi[i, -1]), price=float(close[i, -1]),
+            )
+        elif oi_sudden_fired[i]:
+            oi_signal = SignalRecord(
+                Indicator.OPEN_INTEREST, "Sudden Change Alert", timestamp=timestamp,
+                value=float(oi[i, -1]), change_1_period=float(oi_pct_change[i, -1]), price=float(close[i, -1]),
+            )
+        if oi_signal is not None:
+            results.append((symbol, _create_market_snapshot(features, oi_signal)))
+
+        if ls_fired[i]:
+            signal = SignalRecord(
+                Indicator.LS_RATIO, "Sentiment Extreme Alert", timestamp=timestamp,
+                value=float(ls_ratio[i, -1]), z_score=float(ls_z[i]),
+            )
+            results.append((symbol, _create_market_snapshot(features, signal)))
+
+    return results
@@ -0,0 +1,97 @@
+import math
+from enum import Enum
+
+class Indicator(str, Enum):
+    VOLUME = "Volume"
+    OPEN_INTEREST = "Open Interest"
+    LS_RATIO = "Long/Short Ratio"
+
+# 百分比变化类字段 (用于状态管理中的显著变化判断)
+CHANGE_FIELDS = ('price_change', 'change_24h', 'change_1_period')
+
+class SignalRecord:
+    """
+    指标信号的紧凑记录，所有数值均为原始 float (百分比为小数，如 0.052 表示 5.2%)。
+    只在发送告警和构建 AI 提示词时才格式化为字符串 (format_fields)。
+    """
+    __slots__ = (
+        'indicator', 'signal_type', 'timestamp', 'value', 'z_score',
+        'price', 'price_change', 'change_24h', 'change_1_period', 'timeframe',
+    )
+
+    def __init__(self, indicator: Indicator, signal_type: str, timestamp: int = None, value: float = None,
+                 z_score: float = None, price: float = None, price_change: float = None,
+                 change_24h: float = None, change_1_period: float = None, timeframe: str = None):
+        self.indicator = Indicator(indicator)
+        self.signal_type = signal_type
+        self.timestamp = timestamp          # 信号所在 K 线的开盘时间 (毫秒)
+        self.value = value
+        self.z_score = z_score
+        self.price = price
+        self.price_change = price_change
+        self.change_24h = change_24h
+        self.change_1_period = change_1_period
+        self.timeframe = timeframe          # 信号所在的 K 线周期 (如 '1h')
+
+    def to_dict(self):
+        """原始数值字典 (可 JSON 序列化)，省略为 None 的字段"""
+        data = {'indicator': self.indicator.value, 'signal_type': self.signal_type}
+        for field in self.__slots__[2:]:
+            value = getattr(self, field)
+            if value is not None:
+                data[field] = value
+        return data
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        return cls(**data)
+
+    @property
+    def sentiment(self):
+        if self.indicator is not Indicator.LS_RATIO or self.z_score is None:
+            return None
+        return "Extremely Bullish (Contrarian Bearish)" if self.z_score > 0 else "Extremely Bearish (Contrarian Bullish)"
+
+    def format_value(self):
+        if self.indicator is Indicator.OPEN_INTEREST:
+            return f"${self.value:,.0f}"
+        if self.indicator is Indicator.LS_RATIO:
+            return f"{self.value:.3f}"
+        return f"{self.value:,.0f}"
+
+    def format_fields(self):
+        """格式化后的展示字段，键与顺序与旧版字符串信号字典一致"""
+        fields = {"indicator": self.indicator.value, "signal_type": self.signal_type}
+        if self.timeframe is not None:
+            fields["timeframe"] = self.timeframe
+        if self.value is not None:
+            fields["value"] = self.format_value()
+        if self.z_score is not None:
+            fields["z_score"] = f"{self.z_score:.2f}"
+        if self.price_change is not None:
+            fields["price_change"] = f"{self.price_change:.2%}"
+        if self.change_24h is not None:
+            fields["change_24h"] = f"{self.change_24h:+.2%}"
+        if self.change_1_period is not None:
+            fields["change_1_period"] = f"{self.change_1_period:+.2%}"
+        if self.price is not None:
+            fields["price"] = f"{self.price:.2f}"
+        if self.sentiment is not None:
+            fields["sentiment"] = self.sentiment
+        return fields
+
+    def __eq__(self, other):
+        if not isinstance(other, SignalRecord):
+            return NotImplemented
+        return all(getattr(self, f) == getattr(other, f) for f in self.__slots__)
+
+    def __repr__(self):
+        return f"SignalRecord({self.format_fields()})"
+
+def is_significant_diff(new_value: float, old_value: float, threshold: float):
+    """两个数值都存在且差值的绝对值不小于阈值"""
+    if new_value is None or old_value is None:
+        return False
+    if math.isnan(new_value) or math.isnan(old_value):
+        return False
+    return abs(new_value - old_value) >= threshold
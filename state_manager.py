@@ -1,9 +1,148 @@
+import json
+import logging
+import sqlite3
+import threading
 import time
-from config import Z_SCORE_CHANGE_THRESHOLD, PERCENTAGE_CHANGE_THRESHOLD
+from config import TIMEFRAME, Z_SCORE_CHANGE_THRESHOLD, PERCENTAGE_CHANGE_THRESHOLD, STATE_DB_PATH, STATE_TTL_SECONDS
+from signals import SignalRecord, CHANGE_FIELDS, is_significant_diff
+
+logger = logging.getLogger(__name__)
+
+# 两次过期清理之间的最小间隔 (秒)
+EVICTION_INTERVAL = 60
 
 class SignalStateManager:
-    def __init__(self):
+    def __init__(self, db_path: str = STATE_DB_PATH, ttl: float = STATE_TTL_SECONDS, shared: bool = False):
+        """
+        db_path 为空时只保存在内存中。
+        只保存变化检测所需的精简记录 (primary_signal)，超过 ttl 秒未更新的信号会被清除。
+        shared=True 时多个进程共用 db_path：每次判断都在数据库事务中读取并更新状态，同一信号只有一个进程会发送。
+        数据库操作是阻塞的，在事件循环中通过 should_send_alerts + asyncio.to_thread 调用。
+        """
+        self.ttl = ttl
+        self.shared = shared
+        # signal_key -> {'primary_signal': SignalRecord}
         self.last_signals = {}
+        # signal_key -> 最后一次发送的时间戳
+        self.updated_at = {}
+        self._last_eviction = 0
+        # should_send_alerts 在线程池中执行，可能有多轮检查同时判断
+        self._lock = threading.Lock()
+        self.db = None
+        if db_path:
+            self.db = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("PRAGMA synchronous=NORMAL")
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS signal_state ("
+                "signal_key TEXT PRIMARY KEY, primary_signal TEXT NOT NULL, updated_at REAL NOT NULL)"
+            )
+            # 流式指标状态 (indicators.checkpoint_indicator_states)，键为 <symbol>_<timeframe>
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS indicator_state ("
+                "state_key TEXT PRIMARY KEY, state TEXT NOT NULL, updated_at REAL NOT NULL)"
+            )
+            self.db.commit()
+            if not shared:
+                self._load()
+
+    def _load(self):
+        """启动时加载未过期的信号状态，避免重启后重复告警"""
+        cutoff = time.time() - self.ttl
+        self.db.execute("DELETE FROM signal_state WHERE updated_at < ?", (cutoff,))
+        self.db.commit()
+        for signal_key, primary_signal, updated_at in self.db.execute(
+            "SELECT signal_key, primary_signal, updated_at FROM signal_state"
+        ).fetchall():
+            try:
+                record = SignalRecord.from_dict(json.loads(primary_signal))
+            except (ValueError, TypeError) as e:
+                logger.warning(f"Dropping unreadable signal state {signal_key}: {e}")
+                self.db.execute("DELETE FROM signal_state WHERE signal_key = ?", (signal_key,))
+                continue
+            self.last_signals[signal_key] = {'primary_signal': record}
+            self.updated_at[signal_key] = updated_at
+        self.db.commit()
+        logger.info(f"Loaded {len(self.last_signals)} signal states from the state store.")
+
+    def evict_expired(self):
+        """清除超过 TTL 的信号状态 (内存与持久化存储)"""
+        now = time.time()
+        self._last_eviction = now
+        cutoff = now - self.ttl
+        expired = [key for key, updated_at in self.updated_at.items() if updated_at < cutoff]
+        for key in expired:
+            del self.last_signals[key]
+            del self.updated_at[key]
+        if self.db:
+            self.db.execute("DELETE FROM signal_state WHERE updated_at < ?", (cutoff,))
+            self.db.execute("DELETE FROM indicator_state WHERE updated_at < ?", (cutoff,))
+            self.db.commit()
+
+    def _save(self, signal_key, signal):
+        compact_signal = {'primary_signal': signal['primary_signal']}
+        now = time.time()
+        self.last_signals[signal_key] = compact_signal
+        self.updated_at[signal_key] = now
+        if self.db:
+            self.db.execute(
+                "INSERT OR REPLACE INTO signal_state (signal_key, primary_signal, updated_at) VALUES (?, ?, ?)",
+                (signal_key, json.dumps(compact_signal['primary_signal'].to_dict()), now),
+            )
+            self.db.commit()
+
+    def _claim(self, signal_key, signal):
+        """共享模式：在写事务中比较并更新数据库中的状态 (BEGIN IMMEDIATE 保证多个进程串行判断)"""
+        now = time.time()
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            row = self.db.execute(
+                "SELECT primary_signal, updated_at FROM signal_state WHERE signal_key = ?", (signal_key,)
+            ).fetchone()
+            previous_signal = None
+            if row and now - row[1] <= self.ttl:
+                previous_signal = {'primary_signal': SignalRecord.from_dict(json.loads(row[0]))}
+            should_send = self.has_significant_change(signal, previous_signal)
+            if should_send:
+                self.db.execute(
+                    "INSERT OR REPLACE INTO signal_state (signal_key, primary_signal, updated_at) VALUES (?, ?, ?)",
+                    (signal_key, json.dumps(signal['primary_signal'].to_dict()), now),
+                )
+            self.db.commit()
+        except Exception:
+            self.db.rollback()
+            raise
+        return should_send, previous_signal
+
+    def save_indicator_states(self, states: dict):
+        """保存 checkpoint_indicator_states() 的结果 (阻塞，通过 asyncio.to_thread 调用)；没有数据库时忽略"""
+        if not self.db or not states:
+            return
+        now = time.time()
+        with self._lock:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO indicator_state (state_key, state, updated_at) VALUES (?, ?, ?)",
+                [(key, json.dumps(state), now) for key, state in states.items()],
+            )
+            self.db.commit()
+
+    def load_indicator_states(self):
+        """读取未过期的流式指标状态，返回可传给 restore_indicator_states 的字典"""
+        if not self.db:
+            return {}
+        cutoff = time.time() - self.ttl
+        states = {}
+        with self._lock:
+            rows = self.db.execute(
+                "SELECT state_key, state FROM indicator_state WHERE updated_at >= ?", (cutoff,)
+            ).fetchall()
+        for state_key, state in rows:
+            try:
+                states[state_key] = json.loads(state)
+            except ValueError as e:
+                logger.warning(f"Dropping unreadable indicator state {state_key}: {e}")
+        logger.info(f"Loaded {len(states)} indicator states from the state store.")
+        return states
 
     def has_significant_change(self, current_signal, previous_signal):
         """
@@ -12,34 +151,16 @@ class SignalStateManager:
         if not previous_signal:
             return True
 
+        current, previous = current_signal['primary_signal'], previous_signal['primary_signal']
+
         # 检查Z-Score类型的信号
-        if 'z_score' in current_signal['primary_signal'] and 'z_score' in previous_signal['primary_signal']:
-            try:
-                new_z = float(current_signal['primary_signal']['z_score'])
-                old_z = float(previous_signal['primary_signal']['z_score'])
-                if abs(new_z - old_z) >= Z_SCORE_CHANGE_THRESHOLD:
-                    return True
-            except (ValueError, TypeError):
-                # 如果转换失败，则忽略此检查
-                pass
-
-        # 检查百分比类型的信号 (例如 OI 变化)
-        # 查找包含 'change' 的键 (如 'change_24h', 'change_1_period')
-        change_keys = [k for k in current_signal['primary_signal'].keys() if 'change' in k]
-        for key in change_keys:
-            if key in previous_signal['primary_signal']:
-                try:
-                    # 移除 % 并转换为 float (e.g., "+5.20%" -> 0.052)
-                    new_val_str = current_signal['primary_signal'][key].replace('%', '').replace('+', '')
-                    old_val_str = previous_signal['primary_signal'][key].replace('%', '').replace('+', '')
-                    
-                    new_change = float(new_val_str) / 100
-                    old_change = float(old_val_str) / 100
-                    
-                    if abs(new_change - old_change) >= PERCENTAGE_CHANGE_THRESHOLD:
-                        return True
-                except (ValueError, TypeError):
-                    continue
+        if is_significant_diff(current.z_score, previous.z_score, Z_SCORE_CHANGE_THRESHOLD):
+            return True
+
+        # 检查百分比类型的信号 (例如 OI 变化、价格变化)
+        for field in CHANGE_FIELDS:
+            if is_significant_diff(getattr(current, field), getattr(previous, field), PERCENTAGE_CHANGE_THRESHOLD):
+                return True
 
         # 默认情况下，如果没有特定逻辑匹配，则认为没有显著变化
         # 这可以防止对同一事件的重复、无价值的警报
@@ -49,14 +170,28 @@ class SignalStateManager:
         """
         判断是否应该发送警报。
         只在信号与上次同类型信号有显著差异时才发送。
+        返回的 previous_signal 只包含 primary_signal。
         """
-        indicator_type = signal['primary_signal']['indicator']
-        signal_key = f"{symbol}_{indicator_type}"
+        if time.time() - self._last_eviction >= EVICTION_INTERVAL:
+            self.evict_expired()
+
+        # 按 (币种, 周期, 指标) 分别记录，不同周期的同类信号互不影响
+        primary_signal = signal['primary_signal']
+        signal_key = f"{symbol}_{primary_signal.timeframe or TIMEFRAME}_{primary_signal.indicator.value}"
+        if self.shared:
+            return self._claim(signal_key, signal)
 
         previous_signal = self.last_signals.get(signal_key)
+        if previous_signal and time.time() - self.updated_at[signal_key] > self.ttl:
+            previous_signal = None
 
         if self.has_significant_change(signal, previous_signal):
-            self.last_signals[signal_key] = signal
+            self._save(signal_key, signal)
             return True, previous_signal
         
         return False, previous_signal
+
+    def should_send_alerts(self, signals: list):
+        """批量判断 [(symbol, signal), ...]，返回一一对应的 (should_send, previous_signal) 列表"""
+        with self._lock:
+            return [self.should_send_alert(symbol, signal) for symbol, signal in signals]
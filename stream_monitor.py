@@ -0,0 +1,172 @@
+import asyncio
+import json
+import logging
+import time
+import aiohttp
+from config import (
+    TIMEFRAME, VERIFY_SSL, BINANCE_WS_URL, WS_STREAMS_PER_CONNECTION,
+    WS_CLOSE_SETTLE_SECONDS, WS_INTRA_CANDLE_CHECK, WS_INTRA_CANDLE_INTERVAL, WS_RESEED_INTERVAL,
+)
+from data_fetcher import apply_stream_kline, get_binance_data, get_cached_data
+from metrics import CYCLE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+def build_stream_urls(symbols: list):
+    """按 WS_STREAMS_PER_CONNECTION 将 <symbol>@kline_<interval> 流分组为多个组合流 URL"""
+    streams = [f"{symbol.lower()}@kline_{TIMEFRAME}" for symbol in symbols]
+    return [
+        f"{BINANCE_WS_URL}/stream?streams={'/'.join(streams[i:i + WS_STREAMS_PER_CONNECTION])}"
+        for i in range(0, len(streams), WS_STREAMS_PER_CONNECTION)
+    ]
+
+def parse_kline_message(message: dict):
+    """
+    解析组合流推送的 kline 事件。
+    返回 (symbol, row, is_closed)，row 与 REST /fapi/v1/klines 的行格式一致；非 kline 事件返回 None。
+    """
+    data = message.get('data', message)
+    if data.get('e') != 'kline':
+        return None
+    k = data['k']
+    row = [k['t'], k['o'], k['h'], k['l'], k['c'], k['v'], k['T'], k['q'], k['n'], k['V'], k['Q'], k.get('B', '0')]
+    return k['s'], row, bool(k['x'])
+
+class StreamMonitor:
+    """
+    订阅 K 线 WebSocket 流并在 K 线收盘时触发检查。
+    on_frames(frames) 接收 {symbol: DataFrame}，负责计算信号与发送告警。
+    """
+    def __init__(self, symbols: list, session: aiohttp.ClientSession, on_frames):
+        self.symbols = symbols
+        self.session = session
+        self.on_frames = on_frames
+        self.pending_closed = set()
+        self.last_intra_check = {}
+        # symbol -> 上次重新获取滚动窗口的时间 (monotonic)
+        self.last_reseed = {}
+        self._flush_task = None
+        self._tasks = set()
+
+    async def run(self):
+        groups = [
+            self.symbols[i:i + WS_STREAMS_PER_CONNECTION]
+            for i in range(0, len(self.symbols), WS_STREAMS_PER_CONNECTION)
+        ]
+        logger.info(f"Subscribing to {len(self.symbols)} kline streams over {len(groups)} websocket connection(s).")
+        await asyncio.gather(*[self._run_connection(build_stream_urls(group)[0], group) for group in groups])
+
+    async def _run_connection(self, url: str, symbols: list):
+        backoff = 1
+        reconnect = False
+        while True:
+            try:
+                async with self.session.ws_connect(url, ssl=VERIFY_SSL, heartbeat=60) as ws:
+                    backoff = 1
+                    # 连接建立后、处理推送前先通过 REST 补齐断线期间错过的 K 线 (推送在此期间缓存在连接中)
+                    await self._backfill(symbols, evaluate=reconnect)
+                    reconnect = True
+                    async for msg in ws:
+                        if msg.type == aiohttp.WSMsgType.TEXT:
+                            self._handle_message(json.loads(msg.data))
+                        elif msg.type in (aiohttp.WSMsgType.CLOSED, aiohttp.WSMsgType.ERROR):
+                            break
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Websocket error on {url}: {e}")
+            logger.warning(f"Websocket disconnected, reconnecting in {backoff}s...")
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 60)
+
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._task_done)
+
+    def _task_done(self, task: asyncio.Task):
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception():
+            logger.error(f"Error in stream task: {task.exception()}", exc_info=task.exception())
+
+    def _handle_message(self, message: dict):
+        parsed = parse_kline_message(message)
+        if not parsed:
+            return
+        symbol, row, is_closed = parsed
+        if not apply_stream_kline(symbol, row):
+            # 启动时 REST 获取失败，还没有滚动窗口，重新获取 (否则该币种在重启前都不会被检查)
+            now = time.monotonic()
+            if now - self.last_reseed.get(symbol, -WS_RESEED_INTERVAL) >= WS_RESEED_INTERVAL:
+                self.last_reseed[symbol] = now
+                self._spawn(self._reseed(symbol))
+            return
+
+        if is_closed:
+            # 同一时刻会有大量币种收盘，等待片刻后合并处理
+            self.pending_closed.add(symbol)
+            if self._flush_task is None or self._flush_task.done():
+                self._flush_task = asyncio.create_task(self._flush_closed())
+        elif WS_INTRA_CANDLE_CHECK:
+            now = time.monotonic()
+            if now - self.last_intra_check.get(symbol, 0) >= WS_INTRA_CANDLE_INTERVAL:
+                self.last_intra_check[symbol] = now
+                df = get_cached_data(symbol)
+                if not df.empty:
+                    self._spawn(self.on_frames({symbol: df}))
+
+    async def _reseed(self, symbol: str):
+        """通过 REST 重新获取没有缓存的币种的滚动窗口，成功后立即检查一次已收盘的 K 线"""
+        df = await get_binance_data(symbol, self.session, closed_only=True)
+        if df.empty:
+            logger.warning(f"Refetch of {symbol} failed, retrying in {WS_RESEED_INTERVAL}s.")
+            return
+        logger.info(f"Seeded the rolling window for {symbol} from REST.")
+        try:
+            await self.on_frames({symbol: df})
+        except Exception as e:
+            logger.error(f"Error evaluating {symbol} after refetch: {e}", exc_info=True)
+
+    async def _backfill(self, symbols: list, evaluate: bool):
+        """
+        通过 REST 获取 symbols 的 K 线 (增量获取只请求缓存之后的部分)，补齐滚动窗口中缺失的 K 线。
+        evaluate=True 时 (断线重连) 再检查一次已收盘的 K 线，以免断线期间的收盘信号被漏掉。
+        """
+        async def fetch(sym):
+            return sym, await get_binance_data(sym, self.session, closed_only=True)
+
+        frames = {}
+        for sym, df in await asyncio.gather(*[fetch(s) for s in symbols]):
+            if df.empty:
+                logger.warning(f"Backfill of {sym} failed, it will be refetched on its next stream event.")
+            else:
+                frames[sym] = df
+        logger.info(f"Backfilled {len(frames)}/{len(symbols)} symbols over REST.")
+        if evaluate and frames:
+            try:
+                await self.on_frames(frames)
+            except Exception as e:
+                logger.error(f"Error evaluating backfilled candles: {e}", exc_info=True)
+
+    async def _flush_closed(self):
+        """合并处理收盘的币种；处理期间又有币种收盘时继续处理，直到没有待处理的币种"""
+        while self.pending_closed:
+            await asyncio.sleep(WS_CLOSE_SETTLE_SECONDS)
+            symbols, self.pending_closed = self.pending_closed, set()
+            started = time.perf_counter()
+            logger.info(f"Candle closed for {len(symbols)} symbols, refreshing OI / L/S ratio...")
+
+            async def refresh(sym):
+                return sym, await get_binance_data(sym, self.session, fetch_klines=False, closed_only=True)
+
+            frames = {}
+            for sym, df in await asyncio.gather(*[refresh(s) for s in symbols]):
+                if df.empty:
+                    logger.warning(f"Failed to fetch data for {sym}, skipping.")
+                else:
+                    frames[sym] = df
+            try:
+                await self.on_frames(frames)
+            except Exception as e:
+                logger.error(f"Error evaluating streamed candles: {e}", exc_info=True)
+            CYCLE_SECONDS.observe(time.perf_counter() - started, mode='stream')
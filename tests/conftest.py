@@ -0,0 +1,6 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# 测试直接导入仓库根目录下的模块与 benchmarks 中的合成数据
+sys.path[:0] = [ROOT, os.path.join(ROOT, 'benchmarks')]
@@ -0,0 +1,59 @@
+"""本地聚合与 pandas resample (只保留完整的 K 线) 的结果一致"""
+import numpy as np
+import pandas as pd
+import pytest
+from data_fetcher import _build_dataframe
+from resampler import AGGREGATIONS, resample_frame, timeframe_ratio, check_timeframe
+from synthetic import generate_market_data
+
+HOUR_MS = 3_600_000
+# 整点开始，再偏移 2 小时，使起始时间不对齐 4h / 1d (窗口开头是不完整的 K 线)
+START_MS = 1_700_000_000_000 // (24 * HOUR_MS) * (24 * HOUR_MS) + 2 * HOUR_MS
+
+def _hourly(rows: int = 200, start: int = START_MS):
+    df = _build_dataframe(*generate_market_data(rows, seed=3, start=start))
+    df.attrs = {'symbol': 'SYNUSDT'}
+    return df
+
+def _expected(df: pd.DataFrame, rule: str, ratio: int):
+    aggregations = {column: how for column, how in AGGREGATIONS.items() if column in df}
+    expected = df.resample(rule).agg(aggregations)
+    return expected[df['open'].resample(rule).count() == ratio]
+
+@pytest.mark.parametrize('timeframe, rule', [('4h', '4h'), ('1d', '1D')])
+def test_resample_matches_pandas_complete_buckets(timeframe, rule):
+    df = _hourly()
+    ratio = timeframe_ratio(timeframe)
+    result = resample_frame(df, timeframe, now_ms=int(df.index[-1].value // 1_000_000) + 100 * HOUR_MS)
+    expected = _expected(df, rule, ratio)
+    assert result.index.equals(expected.index)
+    for column in expected:
+        np.testing.assert_allclose(result[column].to_numpy(float), expected[column].to_numpy(float), err_msg=column)
+    assert result.attrs == {'symbol': 'SYNUSDT', 'timeframe': timeframe}
+
+def test_resample_drops_bucket_that_has_not_closed():
+    df = _hourly()
+    last_open = int(df.index[-1].value // 1_000_000)
+    # 最后一个 4h 桶的行数齐全，但最后一根 1h K 线仍在形成中
+    df = df[df.index < pd.Timestamp(last_open - last_open % (4 * HOUR_MS), unit='ms')]
+    bucket_open = int(df.index[-4].value // 1_000_000)
+    closing = resample_frame(df, '4h', now_ms=bucket_open + 4 * HOUR_MS - 1)
+    closed = resample_frame(df, '4h', now_ms=bucket_open + 4 * HOUR_MS)
+    assert closed.index[-1] == df.index[-4]
+    assert closing.index.equals(closed.index[:-1])
+
+def test_base_timeframe_is_returned_unchanged():
+    df = _hourly()
+    result = resample_frame(df, '1h')
+    assert result.equals(df)
+    assert result.attrs['timeframe'] == '1h'
+
+def test_invalid_timeframes_are_rejected():
+    with pytest.raises(ValueError):
+        timeframe_ratio('90m')
+    with pytest.raises(ValueError):
+        timeframe_ratio('30m')
+    # 1d 只能从 WINDOW_LIMIT 根 1h K 线中聚合出不到回看周期的 K 线
+    with pytest.raises(ValueError):
+        check_timeframe('1d')
+    assert check_timeframe('1h') == 1
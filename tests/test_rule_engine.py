@@ -0,0 +1,39 @@
+"""rules.json 中的规则与内置向量化引擎 (signal_engine) 的结果一致"""
+import os
+from data_fetcher import _build_dataframe
+from rule_engine import load_rules, evaluate_rules
+from signal_engine import evaluate_signals
+from signals import Indicator
+from synthetic import generate_market_data
+
+RULES_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'rules.json')
+
+def _frames(count: int = 60):
+    frames = {}
+    for n in range(count):
+        # 不同长度 (包括不足回看周期的) 与人为放大的成交量 / OI / 多空比，保证各类信号都会触发
+        rows = 200 if n % 5 else 20 + n
+        klines, oi, ls = generate_market_data(rows, seed=n)
+        if n % 3 == 0:
+            klines[-1][5] = f"{float(klines[-1][5]) * 6:.3f}"
+        if n % 4 == 0:
+            oi[-1]['sumOpenInterestValue'] = f"{float(oi[-1]['sumOpenInterestValue']) * 1.3:.2f}"
+        if n % 7 == 0:
+            ls[-1]['longShortRatio'] = f"{float(ls[-1]['longShortRatio']) * 1.2:.4f}"
+        frames[f"S{n:03d}USDT"] = _build_dataframe(klines, oi, ls)
+    return frames
+
+def _normalize(signals: list):
+    return [(symbol, signal['primary_signal'].to_dict(), signal['market_context']) for symbol, signal in signals]
+
+def test_rules_json_matches_builtin_engine():
+    frames = _frames()
+    expected = _normalize(evaluate_signals(frames))
+    actual = _normalize(evaluate_rules(frames, load_rules(RULES_FILE)))
+    assert actual == expected
+    assert {signal['indicator'] for _, signal, _ in expected} == {indicator.value for indicator in Indicator}
+
+def test_rules_skip_short_windows():
+    frames = {symbol: df for symbol, df in _frames().items() if len(df) < 50}
+    assert frames
+    assert evaluate_rules(frames, load_rules(RULES_FILE)) == []
@@ -0,0 +1,98 @@
+"""流式累加器 (RollingZScore / StreamingEMA / StreamingRSI) 与整个窗口重新计算的结果一致"""
+import json
+import numpy as np
+import pandas as pd
+import pytest
+import indicators
+from indicators import (
+    RollingZScore, StreamingEMA, StreamingRSI, SymbolIndicatorState, FeatureFrame,
+    calculate_z_score, calculate_ema, calculate_rsi, checkpoint_indicator_states, restore_indicator_states,
+)
+from config import VOLUME_LOOKBACK_PERIOD, LS_RATIO_LOOKBACK_PERIOD
+from data_fetcher import _build_dataframe
+from synthetic import generate_market_data
+
+@pytest.fixture(autouse=True)
+def clear_states():
+    indicators._indicator_states.clear()
+    yield
+    indicators._indicator_states.clear()
+
+def _series(n: int = 300, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    return pd.Series(100 * np.exp(np.cumsum(rng.normal(0, 0.01, n))))
+
+def _streamed(accumulator, values):
+    """逐个写入 values，同时记录每一步的 peek (写入前) 与 update 结果"""
+    peeks, updates = [], []
+    for value in values:
+        peeks.append(accumulator.peek(value))
+        updates.append(accumulator.update(value))
+    return np.array(peeks), np.array(updates)
+
+def test_rolling_z_score_matches_batch():
+    series = _series()
+    series[150] = np.nan
+    expected = calculate_z_score(series, 20).to_numpy()
+    peeks, updates = _streamed(RollingZScore(20), series.tolist())
+    np.testing.assert_allclose(updates, expected, rtol=1e-9, atol=1e-9)
+    np.testing.assert_allclose(peeks, expected, rtol=1e-9, atol=1e-9)
+
+def test_streaming_ema_matches_batch():
+    series = _series(seed=1)
+    for length in (12, 26):
+        peeks, updates = _streamed(StreamingEMA(length), series.tolist())
+        expected = calculate_ema(series, length).to_numpy()
+        np.testing.assert_allclose(updates, expected, rtol=1e-12)
+        np.testing.assert_allclose(peeks, expected, rtol=1e-12)
+
+def test_streaming_rsi_matches_batch():
+    series = _series(seed=2)
+    # 连续上涨的一段 (loss 为 0，RSI 为 100)
+    series[100:130] = np.linspace(series[99], series[99] * 1.2, 30)
+    peeks, updates = _streamed(StreamingRSI(14), series.tolist())
+    expected = calculate_rsi(series, 14).to_numpy()
+    np.testing.assert_allclose(updates, expected, rtol=1e-9, atol=1e-9)
+    np.testing.assert_allclose(peeks, expected, rtol=1e-9, atol=1e-9)
+
+def _frame(rows: int = 300, seed: int = 0, symbol: str = 'SYNUSDT'):
+    df = _build_dataframe(*generate_market_data(rows, seed=seed))
+    df.attrs = {'symbol': symbol, 'timeframe': '1h'}
+    return df
+
+def _batch_features(df: pd.DataFrame):
+    unnamed = df.copy()
+    unnamed.attrs = {}
+    return FeatureFrame(unnamed)
+
+def test_features_use_accumulators_incrementally():
+    df = _frame()
+    for end in [*range(150, len(df), 11), len(df)]:
+        window = df.iloc[:end]
+        streamed, batch = FeatureFrame(window), _batch_features(window)
+        for name in ('volume_z_score', 'ls_z_score'):
+            assert streamed[name] == pytest.approx(batch[name], rel=1e-9)
+    state = indicators._indicator_states[('SYNUSDT', '1h')]
+    assert state.last_timestamp == df.index[-2]
+    assert len(state.volume_z.window) == VOLUME_LOOKBACK_PERIOD
+    assert len(state.ls_z.window) == LS_RATIO_LOOKBACK_PERIOD
+
+def test_state_rebuilds_when_a_closed_candle_is_revised():
+    df = _frame()
+    FeatureFrame(df.iloc[:-1])['ls_z_score']
+    revised = df.copy()
+    revised.iloc[-3, revised.columns.get_loc('ls_ratio')] *= 1.5
+    assert FeatureFrame(revised)['ls_z_score'] == pytest.approx(_batch_features(revised)['ls_z_score'], rel=1e-9)
+
+def test_checkpoint_round_trip():
+    df = _frame()
+    FeatureFrame(df.iloc[:-20])['volume_z_score']
+    checkpoint = json.loads(json.dumps(checkpoint_indicator_states()))
+    indicators._indicator_states.clear()
+    restore_indicator_states(checkpoint)
+    state = indicators._indicator_states[('SYNUSDT', '1h')]
+    assert state.last_timestamp == df.index[-22]
+    # 恢复后只需写入之后的 K 线，结果与整个窗口重新计算一致
+    assert FeatureFrame(df)['volume_z_score'] == pytest.approx(_batch_features(df)['volume_z_score'], rel=1e-9)
+    assert state.last_timestamp == df.index[-2]
+    assert isinstance(SymbolIndicatorState.from_state(state.to_state()), SymbolIndicatorState)
@@ -0,0 +1,30 @@
+import math
+
+# Binance K 线周期单位 (秒)；月线 (1M) 长度不固定，不支持
+INTERVAL_UNITS = {'m': 60, 'h': 3600, 'd': 86400, 'w': 7 * 86400}
+# 周线从周一 00:00 UTC 开始，而 Unix 纪元 (1970-01-01) 是周四
+WEEK_OFFSET = 4 * 86400
+
+def interval_seconds(interval: str):
+    """将 '15m'、'1h'、'4h'、'1d' 等周期字符串转换为秒数"""
+    unit = interval[-1:]
+    if unit not in INTERVAL_UNITS or not interval[:-1].isdigit():
+        raise ValueError(f"Unsupported interval: {interval}")
+    return int(interval[:-1]) * INTERVAL_UNITS[unit]
+
+def _offset(interval: str):
+    return WEEK_OFFSET if interval.endswith('w') else 0
+
+def candle_open_ms(timestamp_ms, interval: str):
+    """timestamp_ms (毫秒，可以是整数或 NumPy 数组) 所在 K 线的开盘时间 (毫秒)"""
+    period, offset = interval_seconds(interval) * 1000, _offset(interval) * 1000
+    return (timestamp_ms - offset) // period * period + offset
+
+def next_candle_close(timestamp: float, interval: str):
+    """timestamp (秒) 之后下一根 K 线的收盘时间 (即下一根 K 线的开盘时间，秒)"""
+    period, offset = interval_seconds(interval), _offset(interval)
+    return (math.floor((timestamp - offset) / period) + 1) * period + offset
+
+def is_candle_close(timestamp: float, interval: str):
+    """timestamp (秒) 是否恰好是该周期 K 线的收盘时间"""
+    return (timestamp - _offset(interval)) % interval_seconds(interval) == 0
@@ -0,0 +1,66 @@
+import heapq
+import logging
+import time
+import aiohttp
+from config import TOP_N_SYMBOLS, UNIVERSE_REFRESH_INTERVAL, EXCHANGE_INFO_REFRESH_INTERVAL
+from data_fetcher import BASE_URL, fetch_json
+
+logger = logging.getLogger(__name__)
+
+class SymbolUniverse:
+    """
+    动态币种列表服务：按 24 小时成交额选出流动性前 N 的 USDT 永续合约。
+    - exchangeInfo 用于过滤非永续、非 USDT 或已下架/暂停交易的合约，缓存 EXCHANGE_INFO_REFRESH_INTERVAL 秒
+    - ticker/24hr (权重 40) 的结果缓存 UNIVERSE_REFRESH_INTERVAL 秒，而不是每轮检查都请求
+    - 刷新失败时继续使用上一次的列表
+    """
+    def __init__(self, top_n: int = TOP_N_SYMBOLS):
+        self.top_n = top_n
+        self.symbols = []
+        self.refreshed_at = 0
+        self.tradable = set()
+        self.exchange_info_at = 0
+
+    async def _refresh_tradable(self, session: aiohttp.ClientSession):
+        if self.tradable and time.monotonic() - self.exchange_info_at < EXCHANGE_INFO_REFRESH_INTERVAL:
+            return
+        exchange_info = await fetch_json(session, f"{BASE_URL}/fapi/v1/exchangeInfo", {})
+        if not exchange_info:
+            logger.error("Error fetching exchangeInfo, keeping the previous contract list.")
+            return
+        self.tradable = {
+            s['symbol'] for s in exchange_info.get('symbols', [])
+            if s.get('contractType') == 'PERPETUAL' and s.get('quoteAsset') == 'USDT' and s.get('status') == 'TRADING'
+        }
+        self.exchange_info_at = time.monotonic()
+
+    async def refresh(self, session: aiohttp.ClientSession):
+        """重新计算流动性前 N 的币种，失败时保留旧列表"""
+        try:
+            await self._refresh_tradable(session)
+            tickers = await fetch_json(session, f"{BASE_URL}/fapi/v1/ticker/24hr", {})
+            if not tickers:
+                logger.error("Error fetching top symbols")
+                return self.symbols
+
+            if self.tradable:
+                candidates = [t for t in tickers if t['symbol'] in self.tradable]
+            else:
+                # exchangeInfo 不可用时退回到按名称过滤
+                candidates = [t for t in tickers if t['symbol'].endswith('USDT')]
+            # 部分排序：只取前 N 个，无需对全部交易对排序
+            top = heapq.nlargest(self.top_n, candidates, key=lambda t: float(t['quoteVolume']))
+            self.symbols = [t['symbol'] for t in top]
+            self.refreshed_at = time.monotonic()
+            logger.info(f"动态获取到流动性前 {self.top_n} 的币种 ({len(self.symbols)} 个): {', '.join(self.symbols)}")
+        except Exception as e:
+            logger.error(f"动态获取热门币种列表失败: {e}", exc_info=True)
+        return self.symbols
+
+    async def get_symbols(self, session: aiohttp.ClientSession):
+        """返回缓存的币种列表，超过 UNIVERSE_REFRESH_INTERVAL 时刷新"""
+        if not self.symbols or time.monotonic() - self.refreshed_at >= UNIVERSE_REFRESH_INTERVAL:
+            await self.refresh(session)
+        return self.symbols
+
+universe = SymbolUniverse()